@@ -0,0 +1,88 @@
+"""Cost of saving a one-allocation change, single JSON file vs journal.
+
+Run with: python benchmarks/bench_journal.py
+
+For each registry size, loads the registry, changes one allocation and
+times ``save``. The JSON backend rewrites the whole file; the journal
+backend appends one record. The journal backend is scoped to the changed
+project, as ``init`` and ``release`` open it, so it only diffs that
+project. Also times a fresh load, which for the journal means reading the
+snapshot and replaying ``RECORDS`` journal records.
+"""
+
+import functools
+import tempfile
+import time
+from pathlib import Path
+
+from worktree_env import registry_journal
+from worktree_env.registry import JsonBackend
+from worktree_env.registry_journal import JournalBackend
+
+SIZES = [1_000, 10_000, 100_000]
+PROJECTS = 50
+RECORDS = 100
+REPEAT = 5
+
+
+def synthetic_registry(allocations: int) -> dict:
+    projects: dict[str, dict] = {}
+    for i in range(allocations):
+        project = f"project{i % PROJECTS}"
+        projects.setdefault(project, {})[f"/home/dev/{project}/wt{i}"] = {
+            "worktree": f"wt{i}",
+            "ports": {"PORT": 4000 + 2 * i, "LIVE_PORT": 4001 + 2 * i},
+            "env": {"DB_NAME": f"{project}_dev_wt{i}"},
+        }
+    return {"projects": projects}
+
+
+def change_one(data: dict, n: int) -> None:
+    data["projects"]["project0"]["/home/dev/project0/wt0"]["env"]["N"] = str(n)
+
+
+def bench(backend_cls, dir_path: Path, data: dict) -> tuple[float, float]:
+    # The journal backend imports registry.json as its first snapshot.
+    JsonBackend(dir_path).save(data)
+    backend = backend_cls(dir_path)
+    loaded = backend.load()
+    for n in range(RECORDS):
+        change_one(loaded, n)
+        backend.save(loaded)
+
+    saves, loads = [], []
+    for n in range(REPEAT):
+        backend = backend_cls(dir_path)
+        began = time.perf_counter()
+        loaded = backend.load()
+        loads.append(time.perf_counter() - began)
+        change_one(loaded, RECORDS + n)
+        began = time.perf_counter()
+        backend.save(loaded)
+        saves.append(time.perf_counter() - began)
+    return min(saves), min(loads)
+
+
+def main():
+    # Keep the journal around so loads include replaying it.
+    registry_journal._spawn_compactor = lambda dir_path: None
+    print(
+        f"{'allocations':>12} {'json save':>10} {'journal save':>13} "
+        f"{'json load':>10} {'journal load':>13}  (ms)"
+    )
+    for size in SIZES:
+        data = synthetic_registry(size)
+        row = []
+        journal = functools.partial(JournalBackend, projects=["project0"])
+        for backend_cls in (JsonBackend, journal):
+            with tempfile.TemporaryDirectory() as tmp:
+                row.append(bench(backend_cls, Path(tmp), data))
+        (json_save, json_load), (journal_save, journal_load) = row
+        print(
+            f"{size:>12,} {json_save * 1e3:>10.2f} {journal_save * 1e3:>13.2f} "
+            f"{json_load * 1e3:>10.2f} {journal_load * 1e3:>13.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
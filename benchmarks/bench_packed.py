@@ -0,0 +1,93 @@
+"""Looking up one allocation, single JSON file vs packed registry.
+
+Run with: python benchmarks/bench_packed.py
+
+Each registry holds ``SIZES`` allocations spread over ``PROJECTS``
+projects. A row times what ``show`` does: load the registry read-only,
+scoped to one project, and look up one path. The JSON backend parses the
+whole file; the packed backend maps it, binary-searches the project table
+and decodes one section. Also reports the bytes each decodes and the peak
+memory allocated while loading.
+"""
+
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from worktree_env import tracing
+from worktree_env.registry import JsonBackend, get_allocation
+from worktree_env.registry_packed import PackedBackend
+
+SIZES = [1_000, 10_000, 100_000]
+PROJECTS = 1_000
+REPEAT = 20
+
+
+def synthetic_registry(allocations: int) -> dict:
+    projects: dict[str, dict] = {}
+    for i in range(allocations):
+        project = f"project{i % PROJECTS}"
+        projects.setdefault(project, {})[f"/home/dev/{project}/wt{i}"] = {
+            "worktree": f"wt{i}",
+            "ports": {"PORT": 4000 + 2 * i, "LIVE_PORT": 4001 + 2 * i},
+            "env": {"DB_NAME": f"{project}_dev_wt{i}"},
+        }
+    return {"projects": projects}
+
+
+def lookup(backend_cls, dir_path: Path) -> None:
+    backend = backend_cls(dir_path, readonly=True, **scope(backend_cls))
+    try:
+        data = backend.load()
+        get_allocation(data, "project7", "/home/dev/project7/wt7")
+    finally:
+        backend.close()
+
+
+def scope(backend_cls) -> dict:
+    return {"projects": ["project7"]} if backend_cls is PackedBackend else {}
+
+
+def bench(backend_cls, dir_path: Path) -> tuple[float, int, int]:
+    times = []
+    for _ in range(REPEAT):
+        began = time.perf_counter()
+        lookup(backend_cls, dir_path)
+        times.append(time.perf_counter() - began)
+
+    tracing._tracer = None
+    tracing.enable()
+    tracemalloc.start()
+    lookup(backend_cls, dir_path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    decoded = tracing._tracer.counters.get("registry.bytes_read", 0)
+    tracing._tracer = None
+    return min(times), decoded, peak
+
+
+def main():
+    print(
+        f"{'allocations':>12} {'json (ms)':>10} {'packed (ms)':>12} "
+        f"{'json read':>11} {'packed read':>12} {'json peak':>11} {'packed peak':>12}"
+    )
+    for size in SIZES:
+        data = synthetic_registry(size)
+        with tempfile.TemporaryDirectory() as tmp:
+            dir_path = Path(tmp)
+            JsonBackend(dir_path).save(data)
+            # Imports registry.json, as on first use of the backend.
+            PackedBackend(dir_path).close()
+            (dir_path / "registry.json.migrated").rename(dir_path / "registry.json")
+            json_time, json_read, json_peak = bench(JsonBackend, dir_path)
+            packed_time, packed_read, packed_peak = bench(PackedBackend, dir_path)
+        print(
+            f"{size:>12,} {json_time * 1e3:>10.2f} {packed_time * 1e3:>12.3f} "
+            f"{json_read:>11,} {packed_read:>12,} "
+            f"{json_peak:>11,} {packed_peak:>12,}"
+        )
+
+
+if __name__ == "__main__":
+    main()
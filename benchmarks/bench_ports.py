@@ -0,0 +1,67 @@
+"""Port allocation cost as the default 4000-8999 range fills up.
+
+Run with: python benchmarks/bench_ports.py
+
+Ports are taken from the bottom of the range, which is the worst case for
+a linear scan. "build" is the one-off cost of indexing the allocated ports,
+"per port" is the cost of each allocation from a built index, and the last
+two columns are end-to-end ``allocate_ports`` calls compared with the old
+per-name linear scan.
+"""
+
+import time
+import timeit
+
+from worktree_env.ports import PortAllocator, allocate_ports
+
+PORT_RANGE = (4000, 8999)
+PORT_NAMES = ["PORT", "LIVE_PORT", "DEBUG_PORT", "METRICS_PORT"]
+FILLS = [0.0, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+
+def linear_scan(port_names, already_allocated, port_range):
+    used = set(already_allocated)
+    result = {}
+    for name in port_names:
+        for port in range(port_range[0], port_range[1] + 1):
+            if port not in used:
+                break
+        result[name] = port
+        used.add(port)
+    return result
+
+
+def main():
+    start, end = PORT_RANGE
+    size = end - start + 1
+    number = 200
+    print(
+        f"{'fill':>6} {'build (us)':>11} {'per port (us)':>14} "
+        f"{'allocate (us)':>14} {'linear (us)':>12}"
+    )
+    for fill in FILLS:
+        used = set(range(start, start + int(size * fill)))
+
+        build = timeit.timeit(lambda: PortAllocator(PORT_RANGE, used), number=number)
+
+        allocators = [PortAllocator(PORT_RANGE, used) for _ in range(number)]
+        began = time.perf_counter()
+        for allocator in allocators:
+            for _ in PORT_NAMES:
+                allocator.allocate()
+        per_port = (time.perf_counter() - began) / number / len(PORT_NAMES)
+
+        allocate = timeit.timeit(
+            lambda: allocate_ports(PORT_NAMES, used, PORT_RANGE), number=number
+        )
+        linear = timeit.timeit(
+            lambda: linear_scan(PORT_NAMES, used, PORT_RANGE), number=number
+        )
+        print(
+            f"{fill:>6.0%} {build / number * 1e6:>11.1f} {per_port * 1e6:>14.2f} "
+            f"{allocate / number * 1e6:>14.1f} {linear / number * 1e6:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Registry write cost at 1k, 10k and 100k allocations.
+
+Run with: python benchmarks/bench_registry_write.py
+
+Compares the old in-place ``write_text(json.dumps(indent=2))`` with
+``JsonBackend.save`` (compact separators, temp file, fsync and rename), and
+with a save after ``load`` when nothing changed, which skips the write.
+"""
+
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from worktree_env.registry import JsonBackend
+
+SIZES = [1_000, 10_000, 100_000]
+PROJECTS = 50
+
+
+def synthetic_registry(allocations: int) -> dict:
+    projects: dict[str, dict] = {}
+    for i in range(allocations):
+        project = f"project{i % PROJECTS}"
+        projects.setdefault(project, {})[f"/home/dev/{project}/wt{i}"] = {
+            "worktree": f"wt{i}",
+            "ports": {"PORT": 4000 + 2 * i, "LIVE_PORT": 4001 + 2 * i},
+            "env": {"DB_NAME": f"{project}_dev_wt{i}"},
+        }
+    return {"projects": projects}
+
+
+def best_of(fn, repeat: int = 3) -> float:
+    timings = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - began)
+    return min(timings)
+
+
+def main():
+    print(
+        f"{'allocations':>12} {'legacy (ms)':>12} {'atomic (ms)':>12} "
+        f"{'unchanged (ms)':>15} {'size (KB)':>10}"
+    )
+    for size in SIZES:
+        data = synthetic_registry(size)
+        with tempfile.TemporaryDirectory() as tmp:
+            dir_path = Path(tmp)
+            path = dir_path / "registry.json"
+
+            legacy = best_of(
+                lambda: path.write_text(json.dumps(data, indent=2) + "\n")
+            )
+
+            def atomic():
+                backend = JsonBackend(dir_path)
+                backend.save(data)
+
+            atomic_time = best_of(atomic)
+
+            backend = JsonBackend(dir_path)
+            loaded = backend.load()
+            unchanged = best_of(lambda: backend.save(loaded))
+
+            print(
+                f"{size:>12,} {legacy * 1e3:>12.1f} {atomic_time * 1e3:>12.1f} "
+                f"{unchanged * 1e3:>15.1f} {path.stat().st_size / 1024:>10.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Repository root discovery: in-process walk vs ``git rev-parse``.
+
+Run with: python benchmarks/bench_repo_root.py
+
+Measures ``get_repo_root`` (which walks up looking for ``.git``) against
+the ``git rev-parse --show-toplevel`` fallback, from the root and from a
+nested directory of a main and a linked worktree.
+"""
+
+import subprocess
+import tempfile
+import timeit
+from pathlib import Path
+
+from worktree_env.worktree import _git_repo_root, get_repo_root
+
+
+def make_repo(base: Path) -> tuple[Path, Path]:
+    main = base / "repo"
+    main.mkdir()
+    git = ["git", "-c", "user.name=bench", "-c", "user.email=bench@example.com"]
+    subprocess.run(git + ["init", "-q"], cwd=main, check=True)
+    subprocess.run(
+        git + ["commit", "-q", "--allow-empty", "-m", "init"], cwd=main, check=True
+    )
+    linked = base / "linked"
+    subprocess.run(
+        git + ["worktree", "add", "-q", "--detach", str(linked)],
+        cwd=main,
+        check=True,
+    )
+    return main, linked
+
+
+def main():
+    number = 100
+    with tempfile.TemporaryDirectory() as tmp:
+        main_root, linked_root = make_repo(Path(tmp).resolve())
+        cases = {}
+        for label, root in [("main", main_root), ("linked", linked_root)]:
+            nested = root / "a" / "b" / "c"
+            nested.mkdir(parents=True)
+            cases[f"{label} root"] = root
+            cases[f"{label} nested"] = nested
+
+        print(f"{'case':<15} {'native (us)':>12} {'git (us)':>12} {'speedup':>8}")
+        for label, start in cases.items():
+            native = timeit.timeit(lambda: get_repo_root(start), number=number)
+            git = timeit.timeit(lambda: _git_repo_root(start), number=number)
+            print(
+                f"{label:<15} {native / number * 1e6:>12.1f} "
+                f"{git / number * 1e6:>12.1f} {git / native:>7.0f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+"""Latency and peak memory of every command and hot function as the registry grows.
+
+Run with: python benchmarks/bench_scale.py [--sizes 1,100,10000,100000]
+                                            [--fill 0.5] [--output results.json]
+
+For each size, builds a synthetic registry of that many allocations spread
+over ``--projects`` projects, with ports sampled from a range that the
+allocations fill to ``--fill``. Allocation paths are real directories, so
+GC stats them like it would in production; ``--stale`` makes a fraction of
+them missing. A real repository with ``--worktrees`` linked worktrees is
+registered alongside, and the CLI commands run against it.
+
+Commands run in a fresh interpreter, the way a shell would start them;
+their peak memory is the child's maximum RSS. Hot functions run in this
+process; their peak memory is what tracemalloc sees them allocate. The
+registry is restored before every run, so mutating commands always start
+from the same state.
+
+Results are written as JSON so runs from different versions can be diffed.
+The synthetic port range is allowed to extend past 65535: to the registry
+ports are only integers.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import worktree_env
+from worktree_env.envrc import write_envrc
+from worktree_env.ports import allocate_ports
+from worktree_env.registry import (
+    PortIndex,
+    find_port_owner,
+    gc_stale_entries,
+    get_all_allocated_ports,
+)
+from worktree_env.template import build_template_vars, render_env
+
+SIZES = [1, 100, 10_000, 100_000]
+RANGE_START = 4000
+PORT_NAMES = ["PORT", "LIVE_PORT"]
+ENV_SPECS = {
+    "DB_NAME": {"template": "{project}_dev_{worktree}"},
+    "DATABASE_URL": {"template": "postgres://localhost:5432/{env.DB_NAME}"},
+    "API_URL": {"template": "http://localhost:{port.PORT}/api"},
+}
+PROJECT_CONFIG = """\
+[project]
+name = "bench"
+
+[ports]
+PORT = {}
+LIVE_PORT = {}
+
+[env]
+DB_NAME = { template = "{project}_dev_{worktree}" }
+DATABASE_URL = { template = "postgres://localhost:5432/{env.DB_NAME}" }
+"""
+
+# name -> (arguments, which worktree to run in). "new" is a linked worktree
+# that has no allocation yet; "main" is the registered main worktree.
+COMMANDS = {
+    "init (new)": (["init"], "new"),
+    "init (existing)": (["init"], "main"),
+    "init --all": (["init", "--all"], "main"),
+    "show": (["show"], "main"),
+    "status": (["status"], "main"),
+    "status --all": (["status", "--all", "--format", "jsonl"], "main"),
+    "release": (["release"], "main"),
+    "gc": (["gc"], "main"),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        default=",".join(map(str, SIZES)),
+        help="Comma-separated registry sizes, in allocations.",
+    )
+    parser.add_argument(
+        "--fill", type=float, default=0.5, help="Fraction of the port range in use."
+    )
+    parser.add_argument("--projects", type=int, default=50)
+    parser.add_argument(
+        "--stale",
+        type=float,
+        default=0.0,
+        help="Fraction of allocations whose worktree no longer exists.",
+    )
+    parser.add_argument(
+        "--worktrees", type=int, default=4, help="Linked worktrees in the repository."
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write JSON here instead of stdout.")
+    args = parser.parse_args()
+    if not 0 < args.fill <= 1:
+        parser.error("--fill must be in (0, 1]")
+    return args
+
+
+def make_repo(base: Path, worktrees: int) -> tuple[Path, list[Path]]:
+    main = base / "repo"
+    main.mkdir()
+    git = ["git", "-c", "user.name=bench", "-c", "user.email=bench@example.com"]
+    subprocess.run(git + ["init", "-q"], cwd=main, check=True)
+    (main / ".worktree-env.toml").write_text(PROJECT_CONFIG)
+    subprocess.run(git + ["add", ".worktree-env.toml"], cwd=main, check=True)
+    subprocess.run(git + ["commit", "-q", "-m", "init"], cwd=main, check=True)
+    linked = []
+    for i in range(worktrees):
+        path = base / f"linked{i}"
+        subprocess.run(
+            git + ["worktree", "add", "-q", "--detach", str(path)],
+            cwd=main,
+            check=True,
+        )
+        linked.append(path)
+    # Backdate the configs so they are old enough to be cached.
+    past = time.time() - 60
+    for root in [main, *linked]:
+        os.utime(root / ".worktree-env.toml", (past, past))
+    return main, linked
+
+
+def synthetic_registry(
+    base: Path, size: int, args, rng
+) -> tuple[dict, tuple[int, int]]:
+    """Build a registry of ``size`` allocations; create their directories.
+
+    The range always leaves room for the benchmark repository's worktrees.
+    """
+    total_ports = size * len(PORT_NAMES)
+    headroom = (args.worktrees + 1) * len(PORT_NAMES)
+    range_size = max(int(total_ports / args.fill), total_ports + headroom)
+    port_range = (RANGE_START, RANGE_START + range_size - 1)
+    ports = iter(rng.sample(range(port_range[0], port_range[1] + 1), total_ports))
+    missing = set(rng.sample(range(size), int(size * args.stale)))
+
+    now = int(time.time())
+    registry: dict[str, dict] = {}
+    verified: dict[str, dict] = {}
+    for i in range(size):
+        project = f"project{i % args.projects}"
+        path = base / "worktrees" / project / f"wt{i}"
+        if i not in missing:
+            path.mkdir(parents=True)
+        registry.setdefault(project, {})[str(path)] = {
+            "worktree": f"wt{i}",
+            "ports": {name: next(ports) for name in PORT_NAMES},
+            "env": {"DB_NAME": f"{project}_dev_wt{i}"},
+        }
+        verified.setdefault(project, {})[str(path)] = now
+    return {"projects": registry, "verified": verified}, port_range
+
+
+def register(data: dict, root: Path, port_range: tuple[int, int]) -> None:
+    """Add an allocation for the benchmark repository's main worktree."""
+    used = get_all_allocated_ports(data)
+    data["projects"].setdefault("bench", {})[str(root)] = {
+        "worktree": root.name,
+        "ports": allocate_ports(PORT_NAMES, used, port_range),
+        "env": {"DB_NAME": f"bench_dev_{root.name}"},
+    }
+    data["verified"].setdefault("bench", {})[str(root)] = int(time.time())
+
+
+def summarize(timings: list[float]) -> dict:
+    return {
+        "min": round(min(timings) * 1e3, 3),
+        "median": round(statistics.median(timings) * 1e3, 3),
+        "max": round(max(timings) * 1e3, 3),
+    }
+
+
+def run_command(argv: list[str], cwd: Path, env: dict) -> tuple[float, int]:
+    """Run one command; return its wall time and peak RSS in KB."""
+    with tempfile.TemporaryFile() as stderr:
+        began = time.perf_counter()
+        proc = subprocess.Popen(
+            argv, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=stderr
+        )
+        # wait4 rather than wait, for the child's own resource usage.
+        _, status, usage = os.wait4(proc.pid, 0)
+        elapsed = time.perf_counter() - began
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        if proc.returncode != 0:
+            stderr.seek(0)
+            raise RuntimeError(
+                f"{' '.join(argv)} failed in {cwd}:\n{stderr.read().decode()}"
+            )
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    peak_kb = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    return elapsed, peak_kb
+
+
+def bench_commands(
+    texts: dict[str, str], config: Path, main: Path, new: Path, env: dict, repeat: int
+) -> list[dict]:
+    results = []
+    for name, (args, where) in COMMANDS.items():
+        cwd = main if where == "main" else new
+        argv = [sys.executable, "-m", "worktree_env", *args]
+        timings, peaks = [], []
+        # One unmeasured run warms the config cache and the page cache.
+        for run in range(repeat + 1):
+            for filename, text in texts.items():
+                (config / filename).write_text(text)
+            elapsed, peak_kb = run_command(argv, cwd, env)
+            if run:
+                timings.append(elapsed)
+                peaks.append(peak_kb)
+        results.append(
+            {
+                "kind": "command",
+                "name": name,
+                "latency_ms": summarize(timings),
+                "peak_memory_kb": max(peaks),
+            }
+        )
+    return results
+
+
+def measure(fn, setup, repeat: int) -> dict:
+    """Time ``fn(setup())`` and trace its peak allocation, excluding setup."""
+    timings = []
+    for _ in range(repeat):
+        arg = setup()
+        began = time.perf_counter()
+        fn(arg)
+        timings.append(time.perf_counter() - began)
+
+    arg = setup()
+    tracemalloc.start()
+    try:
+        fn(arg)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"latency_ms": summarize(timings), "peak_memory_kb": round(peak / 1024, 1)}
+
+
+def bench_functions(
+    texts: dict[str, str], port_range: tuple[int, int], envrc_dir: Path, repeat: int
+) -> list[dict]:
+    def load():
+        data = json.loads(texts["registry.json"])
+        data["verified"] = json.loads(texts["verified.json"])
+        return data
+
+    data = load()
+    used = get_all_allocated_ports(data)
+    template_vars = build_template_vars("bench", "wt", {"PORT": 4000})
+    ports = {"PORT": 4000, "LIVE_PORT": 4001}
+    env_vars = render_env(ENV_SPECS, template_vars)
+    # As the daemon holds it: the index is built once, then kept up to date.
+    indexed = {**data, "port_index": PortIndex(data["projects"])}
+    indexed["port_index"].rebuild()
+    probe = max(used)
+
+    cases = {
+        "allocate_ports": (
+            lambda _: allocate_ports(PORT_NAMES, used, port_range),
+            lambda: None,
+        ),
+        "get_all_allocated_ports": (get_all_allocated_ports, lambda: data),
+        "get_all_allocated_ports (port index)": (
+            get_all_allocated_ports,
+            lambda: indexed,
+        ),
+        "find_port_owner": (lambda d: find_port_owner(d, probe), lambda: data),
+        "find_port_owner (port index)": (
+            lambda d: find_port_owner(d, probe),
+            lambda: indexed,
+        ),
+        # GC stamps and prunes the registry it is given, so every run gets
+        # its own copy.
+        "gc_stale_entries": (gc_stale_entries, load),
+        "render_env": (lambda _: render_env(ENV_SPECS, template_vars), lambda: None),
+        "write_envrc": (
+            lambda _: write_envrc(envrc_dir, env_vars, ports),
+            lambda: (envrc_dir / ".envrc").unlink(missing_ok=True),
+        ),
+    }
+    return [
+        {"kind": "function", "name": name, **measure(fn, setup, repeat)}
+        for name, (fn, setup) in cases.items()
+    ]
+
+
+def bench_size(size: int, args, rng) -> list[dict]:
+    with tempfile.TemporaryDirectory() as tmp:
+        base = Path(tmp).resolve()
+        main, linked = make_repo(base, args.worktrees)
+        data, port_range = synthetic_registry(base, size, args, rng)
+        register(data, main, port_range)
+        # Laid out as the JSON backend stores it, GC times in their own file.
+        texts = {
+            "verified.json": json.dumps(data.pop("verified")),
+            "registry.json": json.dumps(data),
+        }
+
+        config = base / "config"
+        config.mkdir()
+        (config / "config.toml").write_text(
+            f"[ports]\nrange = [{port_range[0]}, {port_range[1]}]\n"
+        )
+        # A no-op direnv, and an rc file that already has the hook, so that
+        # init measures worktree-env and not direnv.
+        bin_dir = base / "bin"
+        bin_dir.mkdir()
+        direnv = bin_dir / "direnv"
+        direnv.write_text("#!/bin/sh\nexit 0\n")
+        direnv.chmod(0o755)
+        home = base / "home"
+        home.mkdir()
+        (home / ".bashrc").write_text('eval "$(direnv hook bash)"\n')
+        env = dict(
+            os.environ,
+            WORKTREE_ENV_CONFIG_DIR=str(config),
+            PATH=f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+            HOME=str(home),
+            SHELL="/bin/bash",
+        )
+
+        results = bench_commands(texts, config, main, linked[0], env, args.repeat)
+        envrc_dir = base / "envrc"
+        envrc_dir.mkdir()
+        results += bench_functions(texts, port_range, envrc_dir, args.repeat)
+
+    for result in results:
+        result["registry_allocations"] = size
+    return results
+
+
+def main():
+    args = parse_args()
+    if args.worktrees < 1:
+        sys.exit("--worktrees must be at least 1")
+    if not shutil.which("git"):
+        sys.exit("git is required to build the benchmark repository")
+    rng = random.Random(args.seed)
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    results = []
+    for size in sizes:
+        print(f"Benchmarking {size:,} allocations...", file=sys.stderr)
+        results += bench_size(size, args, rng)
+
+    report = {
+        "version": worktree_env.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": int(time.time()),
+        "parameters": {
+            "sizes": sizes,
+            "fill": args.fill,
+            "projects": args.projects,
+            "stale": args.stale,
+            "worktrees": args.worktrees,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2) + "\n"
+    if args.output:
+        Path(args.output).write_text(text)
+    else:
+        sys.stdout.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Registry throughput with concurrent commands, single file vs sharded.
+
+Run with: python benchmarks/bench_sharded.py
+
+Each of 1, 2, 4 and 8 worker processes runs ``init`` for its own project
+in a loop (through ``run_operation``, as the CLI does) against a registry
+pre-filled with 10k allocations in other projects. With one registry file
+every command locks and rewrites all of it; with shards a command only
+locks and rewrites its own project, and touches the port index only when
+it allocates ports. The first init of each worktree allocates, the
+repeated ones find their allocation and change nothing.
+"""
+
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from worktree_env.operations import run_operation
+from worktree_env.registry import locked_registry
+
+BACKENDS = ["json", "sharded"]
+WORKERS = [1, 2, 4, 8]
+WORKTREES = 20
+REPEATS = 5
+BACKGROUND = 10_000
+
+
+def prefill(base: Path) -> None:
+    with locked_registry() as data:
+        projects = data.setdefault("projects", {})
+        verified = data.setdefault("verified", {})
+        for i in range(BACKGROUND):
+            project, path = f"background{i % 50}", f"/gone/wt{i}"
+            projects.setdefault(project, {})[path] = {
+                "worktree": f"wt{i}",
+                "ports": {"PORT": 10_000 + i},
+                "env": {},
+            }
+            verified.setdefault(project, {})[path] = int(time.time())
+
+
+def worker(config: str, base: str, project: str) -> None:
+    os.environ["WORKTREE_ENV_CONFIG_DIR"] = config
+    for i in range(WORKTREES):
+        path = Path(base) / project / f"wt{i}"
+        path.mkdir(parents=True, exist_ok=True)
+        target = {
+            "path": str(path),
+            "name": path.name,
+            "config": {"name": project, "ports": {"PORT": {}}, "env": {}},
+        }
+        for _ in range(REPEATS):
+            run_operation(
+                "init", targets=[target], port_range=[4000, 8999], gc_max_age=600
+            )
+
+
+def run(backend: str, workers: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        base = Path(tmp)
+        config = base / "config"
+        config.mkdir()
+        (config / "config.toml").write_text(
+            f'[registry]\nbackend = "{backend}"\n'
+        )
+        os.environ["WORKTREE_ENV_CONFIG_DIR"] = str(config)
+        prefill(base)
+
+        procs = [
+            multiprocessing.Process(
+                target=worker, args=(str(config), str(base), f"project{n}")
+            )
+            for n in range(workers)
+        ]
+        began = time.perf_counter()
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        elapsed = time.perf_counter() - began
+
+        with locked_registry() as data:
+            ports = [
+                port
+                for entries in data["projects"].values()
+                for allocation in entries.values()
+                for port in allocation["ports"].values()
+            ]
+        assert len(ports) == len(set(ports)), "duplicate ports allocated"
+        return workers * WORKTREES * REPEATS / elapsed
+
+
+def main():
+    results = {backend: {} for backend in BACKENDS}
+    print(f"{'workers':>8}" + "".join(f"{b + ' (ops/s)':>18}" for b in BACKENDS))
+    for workers in WORKERS:
+        row = f"{workers:>8}"
+        for backend in BACKENDS:
+            throughput = run(backend, workers)
+            results[backend][workers] = round(throughput, 1)
+            row += f"{throughput:>18.0f}"
+        print(row)
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
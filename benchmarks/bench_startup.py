@@ -0,0 +1,95 @@
+"""Wall-clock startup cost of CLI invocations.
+
+Run with: python benchmarks/bench_startup.py
+
+Sets up a throwaway repository and registry, then times fresh interpreter
+runs of ``show`` through the fast path and through click, of ``exec``
+running ``true``, and of the prompt hook's ``hook-env`` with a warm cache,
+next to a bare interpreter as the floor. ``python -X importtime -m worktree_env show``
+breaks the remaining cost down per module.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+RUNS = 20
+
+CASES = {
+    "python (floor)": "pass",
+    "show (fast path)": (
+        "import sys; sys.argv = ['worktree-env', 'show']; "
+        "from worktree_env.__main__ import main; main()"
+    ),
+    "show (click)": (
+        "import sys; sys.argv = ['worktree-env', 'show']; "
+        "from worktree_env.cli import main; main()"
+    ),
+    "exec true": (
+        "import sys; sys.argv = ['worktree-env', 'exec', 'true']; "
+        "from worktree_env.__main__ import main; main()"
+    ),
+    "hook-env (warm)": (
+        "import sys; sys.argv = ['worktree-env', 'hook-env', 'bash']; "
+        "from worktree_env.__main__ import main; main()"
+    ),
+}
+
+
+def best_wall_time(code: str, cwd: Path, env: dict) -> float:
+    timings = []
+    for _ in range(RUNS):
+        began = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", code], cwd=cwd, env=env, capture_output=True
+        )
+        timings.append(time.perf_counter() - began)
+    return min(timings)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        base = Path(tmp).resolve()
+        repo = base / "repo"
+        repo.mkdir()
+        subprocess.run(["git", "init", "-q"], cwd=repo, check=True)
+        project_config = repo / ".worktree-env.toml"
+        project_config.write_text(
+            '[project]\nname = "bench"\n\n[ports]\nPORT = {}\n'
+        )
+        # Backdate the config so it is old enough to be cached.
+        past = time.time() - 60
+        os.utime(project_config, (past, past))
+        config = base / "config"
+        config.mkdir()
+        (config / "registry.json").write_text(
+            json.dumps(
+                {
+                    "projects": {
+                        "bench": {
+                            str(repo): {
+                                "worktree": "repo",
+                                "ports": {"PORT": 4000},
+                                "env": {},
+                            }
+                        }
+                    }
+                }
+            )
+        )
+        # Likewise the registry, so that the allocation is cached.
+        os.utime(config / "registry.json", (past, past))
+        env = dict(os.environ, WORKTREE_ENV_CONFIG_DIR=str(config))
+
+        print(f"{'case':<20} {'best of %d (ms)' % RUNS:>16}")
+        for label, code in CASES.items():
+            elapsed = best_wall_time(code, repo, env)
+            print(f"{label:<20} {elapsed * 1e3:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
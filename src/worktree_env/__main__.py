@@ -0,0 +1,65 @@
+import sys
+
+
+def main() -> None:
+    """Console entry point.
+
+    ``worktree-env show`` runs from shell prompts and hooks, and
+    ``worktree-env exec`` in front of every command it wraps, so both are
+    served here without importing click or anything only the other
+    commands need. ``worktree-env hook-env`` runs before every prompt and
+    does not even load the tracing module. Every other invocation goes
+    through the click group in ``cli``.
+    """
+    if sys.argv[1:2] == ["hook-env"]:
+        from .hook import hook_env
+
+        sys.exit(hook_env(sys.argv[2] if len(sys.argv) > 2 else ""))
+
+    if sys.argv[1:] == ["show"] or sys.argv[1:2] == ["exec"]:
+        from . import tracing
+
+        tracing.enable_from_env()
+        try:
+            status = _show() if sys.argv[1] == "show" else _exec(sys.argv[2:])
+        finally:
+            tracing.report()
+        sys.exit(status)
+
+    from .cli import main as cli_main
+
+    cli_main()
+
+
+def _show() -> int:
+    from .errors import WorktreeEnvError
+    from .resolve import merged_env, resolve_allocation
+
+    try:
+        env = merged_env(resolve_allocation())
+    except WorktreeEnvError as e:
+        sys.stderr.write(f"Error: {e}\n")
+        return 1
+
+    sys.stdout.write("".join(f"{k}={v}\n" for k, v in sorted(env.items())))
+    return 0
+
+
+def _exec(args: list[str]) -> int:
+    from .errors import WorktreeEnvError
+    from .resolve import exec_with_env
+
+    if args[:1] == ["--"]:
+        args = args[1:]
+    if not args:
+        sys.stderr.write("Usage: worktree-env exec [--] COMMAND [ARGS]...\n")
+        return 2
+    try:
+        return exec_with_env(args)
+    except WorktreeEnvError as e:
+        sys.stderr.write(f"Error: {e}\n")
+        return 1
+
+
+if __name__ == "__main__":
+    main()
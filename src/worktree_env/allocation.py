@@ -0,0 +1,193 @@
+from dataclasses import dataclass
+from pathlib import Path
+
+from . import tracing
+from .config import ProjectConfig
+from .ports import BlockAllocator, PortAllocator
+from .registry import (
+    allocation_ports,
+    allocation_runs,
+    get_all_allocated_ports,
+    get_allocated_runs,
+    get_allocation,
+    set_allocation,
+)
+from .template import build_template_vars, render_env
+
+
+@dataclass
+class WorktreeTarget:
+    path: Path
+    name: str
+    config: ProjectConfig
+
+
+def allocate_worktrees(
+    data: dict,
+    targets: list[WorktreeTarget],
+    port_range: tuple[int, int],
+    strategy: str = "lowest",
+) -> list[dict]:
+    """Allocate ports and render env vars for each target worktree.
+
+    Existing ports are reused for names that are still configured, ports of
+    names that were dropped are freed, and new names are served from one
+    allocator built for the whole batch. Projects with a ``port_block``
+    reserve one aligned block per worktree instead, keep it while its size
+    is unchanged, and place each port at its offset within it.
+
+    New ports and blocks are the lowest free ones with the "lowest"
+    strategy. With "hash", each starts probing at a port derived from the
+    project, worktree and port name, so a worktree gets the same ports on
+    every machine and after a release, as long as they are free. Returns
+    the allocations in the order of ``targets`` after storing them in the
+    registry.
+    """
+    with tracing.phase("allocate"):
+        return _allocate_worktrees(data, targets, port_range, strategy)
+
+
+def _allocate_worktrees(
+    data: dict,
+    targets: list[WorktreeTarget],
+    port_range: tuple[int, int],
+    strategy: str,
+) -> list[dict]:
+    kept, dropped = [], []
+    for target in targets:
+        existing = get_allocation(data, target.config.name, str(target.path))
+        kept.append(_kept_ports(target.config, existing or {}))
+        dropped.append(existing or {})
+
+    # The ports in use are only needed when something new must be
+    # allocated; re-initializing an unchanged worktree skips collecting them.
+    allocators = None
+    if any(
+        name not in ports
+        for target, (_, ports) in zip(targets, kept)
+        for name in target.config.ports
+    ) or any(
+        target.config.port_block and block is None
+        for target, (block, _) in zip(targets, kept)
+    ):
+        allocators = _Allocators(data, targets, dropped, kept, port_range)
+
+    def preferred(*key: str) -> int | None:
+        if strategy != "hash":
+            return None
+        return _hashed_port(port_range, key)
+
+    allocations = []
+    for target, (block, ports) in zip(targets, kept):
+        config = target.config
+        if config.port_block:
+            if block is None:
+                start = allocators.allocate_block(
+                    config.port_block, preferred(config.name, target.name)
+                )
+                block = {"start": start, "size": config.port_block}
+                offsets = config.port_offsets()
+                ports = {name: start + offsets[name] for name in config.ports}
+        else:
+            ports = {
+                name: ports[name]
+                if name in ports
+                else allocators.allocate(preferred(config.name, target.name, name))
+                for name in config.ports
+            }
+
+        template_vars = build_template_vars(config.name, target.name, ports)
+        env_vars = render_env(config.env, template_vars)
+
+        allocation = {
+            "worktree": target.name,
+            "ports": ports,
+            "env": env_vars,
+        }
+        if block is not None:
+            allocation["block"] = block
+        set_allocation(data, config.name, str(target.path), allocation)
+        allocations.append(allocation)
+
+    return allocations
+
+
+def _hashed_port(port_range: tuple[int, int], key: tuple[str, ...]) -> int:
+    """Map ``key`` to a port of the range, the same on every machine."""
+    import hashlib
+
+    digest = hashlib.blake2b("\0".join(key).encode(), digest_size=8).digest()
+    start, end = port_range
+    return start + int.from_bytes(digest, "big") % (end - start + 1)
+
+
+def _kept_ports(config: ProjectConfig, existing: dict) -> tuple[dict | None, dict]:
+    """Return the block and ports a worktree keeps from its allocation.
+
+    A block is kept only while the configured block size is unchanged, and
+    then places every configured port. Without a block, the ports of names
+    that are still configured are kept.
+    """
+    block = existing.get("block")
+    if config.port_block:
+        if not block or block.get("size") != config.port_block:
+            return None, {}
+        offsets = config.port_offsets()
+        return block, {name: block["start"] + offsets[name] for name in config.ports}
+    old_ports = existing.get("ports", {})
+    return None, {name: old_ports[name] for name in config.ports if name in old_ports}
+
+
+class _Allocators:
+    """Port and block allocators for one batch, each built on first use.
+
+    Both start from the ports in use outside the batch plus the ports the
+    batch keeps. Whatever one of them hands out is marked as used in the
+    others, so a batch mixing projects with and without blocks never
+    overlaps.
+    """
+
+    def __init__(self, data, targets, dropped, kept, port_range):
+        self.data = data
+        self.targets = targets
+        self.dropped = dropped
+        self.kept = [{"block": block, "ports": ports} for block, ports in kept]
+        self.port_range = port_range
+        self.ports: PortAllocator | None = None
+        self.blocks: dict[int, BlockAllocator] = {}
+        self.allocated: list[tuple[int, int]] = []
+
+    def allocate(self, preferred: int | None = None) -> int:
+        if self.ports is None:
+            used = get_all_allocated_ports(self.data)
+            for allocation in self.dropped:
+                used.difference_update(allocation_ports(allocation))
+            for allocation in self.kept:
+                used.update(allocation_ports(allocation))
+            for first, last in self.allocated:
+                used.update(range(first, last + 1))
+            self.ports = PortAllocator(self.port_range, used)
+        port = self.ports.allocate(preferred)
+        self._mark_used(port, port, self.ports)
+        return port
+
+    def allocate_block(self, size: int, preferred: int | None = None) -> int:
+        if size not in self.blocks:
+            skip = {(t.config.name, str(t.path)) for t in self.targets}
+            used = get_allocated_runs(self.data, skip)
+            for allocation in self.kept:
+                used.extend(allocation_runs(allocation))
+            used.extend(self.allocated)
+            self.blocks[size] = BlockAllocator(self.port_range, size, used)
+        start = self.blocks[size].allocate(preferred)
+        self._mark_used(start, start + size - 1, self.blocks[size])
+        return start
+
+    def _mark_used(self, first: int, last: int, source) -> None:
+        self.allocated.append((first, last))
+        if self.ports is not None and self.ports is not source:
+            for port in range(first, last + 1):
+                self.ports.mark_used(port)
+        for allocator in self.blocks.values():
+            if allocator is not source:
+                allocator.mark_used(first, last)
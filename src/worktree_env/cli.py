@@ -1,129 +1,272 @@
 import click
 
-from .config import load_global_config, load_project_config
-from .envrc import ensure_direnv, run_direnv_allow, write_envrc
 from .errors import WorktreeEnvError
-from .ports import allocate_ports
-from .registry import (
-    gc_stale_entries,
-    get_all_allocated_ports,
-    get_allocation,
-    locked_registry,
-    remove_allocation,
-    set_allocation,
-)
-from .template import build_template_vars, render_env
-from .worktree import get_repo_root, get_worktree_name, sanitize_name
+
+# Commands import what they need when they run, so that invoking one command
+# does not pay for the imports of all the others.
 
 
 @click.group()
-def main():
+@click.option(
+    "--trace", is_flag=True, help="Print per-phase timings and counters to stderr."
+)
+@click.option(
+    "--trace-format",
+    type=click.Choice(["human", "json"]),
+    help="Trace as a human summary (default) or JSON lines. Implies --trace.",
+)
+@click.pass_context
+def main(ctx, trace, trace_format):
     """Isolated ports, database names, and env vars for each Git worktree."""
-    pass
+    from . import tracing
+
+    if trace or trace_format:
+        tracing.enable(trace_format or "human")
+    else:
+        tracing.enable_from_env()
+    ctx.call_on_close(tracing.report)
 
 
 @main.command()
-def init():
+@click.option(
+    "--all",
+    "all_worktrees",
+    is_flag=True,
+    help="Initialize every worktree of the repository in one pass.",
+)
+def init(all_worktrees):
     """Initialize environment for the current worktree."""
+    from . import tracing
+    from .allocation import WorktreeTarget
+    from .config import load_global_config, load_project_config
+    from .envrc import ensure_direnv
+    from .errors import ConfigNotFoundError
+    from .operations import run_operation
+    from .worktree import (
+        get_repo_root,
+        get_worktree_name,
+        list_worktrees,
+        sanitize_name,
+    )
+
     try:
         repo_root = get_repo_root()
-        worktree_name = sanitize_name(get_worktree_name(repo_root))
+        roots = list_worktrees(repo_root) if all_worktrees else [repo_root]
+
+        targets = []
+        for root in roots:
+            try:
+                project_config = load_project_config(root)
+            except ConfigNotFoundError:
+                if not all_worktrees:
+                    raise
+                click.echo(f"Skipping {root}: no .worktree-env.toml")
+                continue
+            worktree_name = sanitize_name(get_worktree_name(root))
+            targets.append(WorktreeTarget(root, worktree_name, project_config))
 
-        project_config = load_project_config(repo_root)
         global_config = load_global_config()
 
-        with locked_registry() as data:
-            removed = gc_stale_entries(data)
-            if removed:
-                click.echo(f"GC: pruned {len(removed)} stale entries")
-
-            path_key = str(repo_root)
-            existing = get_allocation(data, project_config.name, path_key)
-
-            all_ports = get_all_allocated_ports(data)
-            # Exclude our own ports from the "used" set so re-init can reuse them
-            if existing:
-                for p in existing.get("ports", {}).values():
-                    all_ports.discard(p)
-
-            requested_port_names = list(project_config.ports.keys())
-
-            # Reconcile: keep existing ports for names that still exist
-            reused_ports = {}
-            new_port_names = []
-            if existing:
-                old_ports = existing.get("ports", {})
-                for name in requested_port_names:
-                    if name in old_ports:
-                        reused_ports[name] = old_ports[name]
-                        all_ports.add(old_ports[name])
-                    else:
-                        new_port_names.append(name)
-            else:
-                new_port_names = requested_port_names
-
-            newly_allocated = allocate_ports(
-                new_port_names, all_ports, global_config.port_range
-            )
-
-            ports = {**reused_ports, **newly_allocated}
+        result = run_operation(
+            "init",
+            targets=[
+                {
+                    "path": str(target.path),
+                    "name": target.name,
+                    "config": target.config.as_dict(),
+                }
+                for target in targets
+            ],
+            port_range=list(global_config.port_range),
+            port_strategy=global_config.port_strategy,
+            gc_max_age=global_config.gc_interval,
+        )
+        if result["removed"]:
+            click.echo(f"GC: pruned {len(result['removed'])} stale entries")
+        allocations = result["allocations"]
+
+        with tracing.phase("ensure_direnv"):
+            use_direnv = ensure_direnv()
+
+        with tracing.phase("envrc_write"):
+            changed = _update_envrcs(targets, allocations)
+        tracing.count("envrc.written", sum(changed))
+
+        with tracing.phase("outputs_write"):
+            outputs = _update_outputs(targets, allocations)
+        tracing.count(
+            "outputs.written", sum(written for paths in outputs for _, written in paths)
+        )
+
+        with tracing.phase("direnv_allow"):
+            allowed = _direnv_allow_all(targets, changed) if use_direnv else []
+        tracing.count("direnv.allowed", sum(ok is not None for ok in allowed))
+        for target, ok in zip(targets, allowed):
+            if ok is False:
+                click.echo(
+                    f"Warning: 'direnv allow' failed in {target.path}; "
+                    "run it there manually.",
+                    err=True,
+                )
+
+        if not all_worktrees:
+            _echo_init_summary(targets[0], allocations[0], changed[0], outputs[0])
+            return
 
-            template_vars = build_template_vars(
-                project_config.name, worktree_name, ports
+        click.echo(f"Initialized {len(targets)} worktrees")
+        for target, allocation in zip(targets, allocations):
+            ports_str = ", ".join(
+                f"{k}={v}" for k, v in sorted(allocation["ports"].items())
             )
-            env_vars = render_env(project_config.env, template_vars)
-
-            allocation = {
-                "worktree": worktree_name,
-                "ports": ports,
-                "env": env_vars,
-            }
-            set_allocation(data, project_config.name, path_key, allocation)
-
-        envrc_path = write_envrc(repo_root, env_vars, ports)
-
-        ensure_direnv()
-        run_direnv_allow(repo_root)
-
-        click.echo(f"Project:  {project_config.name}")
-        click.echo(f"Worktree: {worktree_name}")
-        click.echo(f"Envrc:    {envrc_path}")
-        if ports:
-            click.echo("Ports:")
-            for name, port in sorted(ports.items()):
-                click.echo(f"  {name}={port}")
-        if env_vars:
-            click.echo("Env:")
-            for name, value in sorted(env_vars.items()):
-                click.echo(f"  {name}={value}")
+            click.echo(f"  {target.name:<20} {target.path}  {ports_str}")
 
     except WorktreeEnvError as e:
         raise click.ClickException(str(e))
 
 
+def _update_envrcs(targets, allocations):
+    from .envrc import update_envrc
+
+    return _map_concurrently(
+        lambda target, allocation: update_envrc(
+            target.path, allocation["env"], allocation["ports"]
+        ),
+        targets,
+        allocations,
+    )
+
+
+def _update_outputs(targets, allocations):
+    """Write each target's configured outputs where their content changed.
+
+    Returns, per target, (path, written) pairs. Every worktree's env is
+    merged once and rendered in each format, and all the files are written
+    concurrently.
+    """
+    from .outputs import render_outputs, write_output
+    from .resolve import merged_env
+
+    rendered = [
+        render_outputs(target.path, target.config.outputs, merged_env(allocation))
+        for target, allocation in zip(targets, allocations)
+    ]
+    files = [item for items in rendered for item in items]
+    written = iter(_map_concurrently(write_output, *zip(*files)))
+    return [[(path, next(written)) for path, _ in items] for items in rendered]
+
+
+def _direnv_allow_all(targets, changed):
+    """Run 'direnv allow' where .envrc changed or is not allowed yet.
+
+    Returns, per target, None if it was already allowed, otherwise whether
+    'direnv allow' succeeded. An unchanged .envrc is checked against the
+    marker left by the last successful allow, then with 'direnv status',
+    so an earlier failed allow is retried on the next init.
+    """
+    from .envrc import direnv_allowed, run_direnv_allow
+
+    def allow(target, written):
+        if not written and direnv_allowed(target.path):
+            return None
+        return run_direnv_allow(target.path)
+
+    return _map_concurrently(allow, targets, changed)
+
+
+def _map_concurrently(fn, *iterables):
+    """map() over a thread pool, or inline when there is a single item."""
+    items = list(zip(*iterables))
+    if len(items) <= 1:
+        return [fn(*args) for args in items]
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor() as pool:
+        return list(pool.map(lambda args: fn(*args), items))
+
+
+def _echo_init_summary(target, allocation, envrc_written, outputs):
+    ports = allocation["ports"]
+    env_vars = allocation["env"]
+    envrc_path = target.path / ".envrc"
+    click.echo(f"Project:  {target.config.name}")
+    click.echo(f"Worktree: {target.name}")
+    click.echo(f"Envrc:    {envrc_path}{'' if envrc_written else ' (unchanged)'}")
+    for path, written in outputs:
+        click.echo(f"Output:   {path}{'' if written else ' (unchanged)'}")
+    if ports:
+        click.echo("Ports:")
+        for name, port in sorted(ports.items()):
+            click.echo(f"  {name}={port}")
+    if env_vars:
+        click.echo("Env:")
+        for name, value in sorted(env_vars.items()):
+            click.echo(f"  {name}={value}")
+
+
 @main.command()
-def show():
-    """Show env vars for the current worktree."""
+@click.option(
+    "--poll",
+    is_flag=True,
+    help="Poll for changes instead of using inotify.",
+)
+def watch(poll):
+    """Re-initialize worktrees whenever their configs or the worktree list change.
+
+    Watches every worktree's .worktree-env.toml, the global config.toml and
+    the repository's .git/worktrees until interrupted.
+    """
+    from . import watch as watching
+    from .envrc import ensure_direnv
+    from .worktree import get_repo_root
+
     try:
         repo_root = get_repo_root()
-        project_config = load_project_config(repo_root)
-        path_key = str(repo_root)
-
-        with locked_registry() as data:
-            allocation = get_allocation(data, project_config.name, path_key)
+        syncer = watching.Syncer(repo_root)
+        use_direnv = ensure_direnv()
+    except WorktreeEnvError as e:
+        raise click.ClickException(str(e))
 
-        if not allocation:
-            raise click.ClickException(
-                "No allocation found. Run 'worktree-env init' first."
+    def on_sync(targets, result):
+        for path in result["released"]:
+            click.echo(f"Released {path}")
+        allocations = result["allocations"]
+        changed = _update_envrcs(targets, allocations)
+        _update_outputs(targets, allocations)
+        for target, allocation in zip(targets, allocations):
+            ports_str = ", ".join(
+                f"{k}={v}" for k, v in sorted(allocation["ports"].items())
             )
+            click.echo(f"Updated  {target.name:<20} {target.path}  {ports_str}")
+        allowed = _direnv_allow_all(targets, changed) if use_direnv else []
+        for target, ok in zip(targets, allowed):
+            if ok is False:
+                click.echo(
+                    f"Warning: 'direnv allow' failed in {target.path}; "
+                    "run it there manually.",
+                    err=True,
+                )
+
+    def on_error(error):
+        click.echo(f"Error: {error}", err=True)
+
+    watcher = watching.open_watcher(poll)
+    click.echo(f"Watching {repo_root} ({watcher.name}); press Ctrl-C to stop.")
+    try:
+        watching.watch(syncer, watcher, on_sync, on_error)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
 
-        ports = allocation.get("ports", {})
-        env_vars = allocation.get("env", {})
+@main.command()
+def show():
+    """Show env vars for the current worktree."""
+    from .resolve import merged_env, resolve_allocation
 
-        merged = {}
-        for name, value in ports.items():
-            merged[name] = str(value)
-        merged.update(env_vars)
+    try:
+        merged = merged_env(resolve_allocation())
 
         for key, value in sorted(merged.items()):
             click.echo(f"{key}={value}")
@@ -132,27 +275,50 @@ def show():
         raise click.ClickException(str(e))
 
 
+@main.command(
+    "exec",
+    context_settings={"ignore_unknown_options": True, "allow_interspersed_args": False},
+)
+@click.argument("command", nargs=-1, required=True, type=click.UNPROCESSED)
+def exec_(command):
+    """Run COMMAND with the current worktree's env vars, without direnv.
+
+    Put -- before COMMAND when it has options of its own.
+    """
+    from .resolve import exec_with_env
+
+    try:
+        status = exec_with_env(list(command))
+    except WorktreeEnvError as e:
+        raise click.ClickException(str(e))
+    raise SystemExit(status)
+
+
 @main.command()
 def release():
-    """Release allocation and delete .envrc for the current worktree."""
+    """Release allocation and delete generated files for the current worktree."""
+    from .config import load_project_config
+    from .operations import run_operation
+    from .worktree import get_repo_root
+
     try:
         repo_root = get_repo_root()
         project_config = load_project_config(repo_root)
         path_key = str(repo_root)
 
-        with locked_registry() as data:
-            removed = remove_allocation(
-                data, project_config.name, path_key
-            )
+        removed = run_operation(
+            "release", project=project_config.name, path=path_key
+        )
 
         if not removed:
             click.echo("No allocation found for this worktree.")
             return
 
-        envrc_path = repo_root / ".envrc"
-        if envrc_path.exists():
-            envrc_path.unlink()
-            click.echo(f"Deleted {envrc_path}")
+        for path in [".envrc", *project_config.outputs]:
+            generated = repo_root / path
+            if generated.exists():
+                generated.unlink()
+                click.echo(f"Deleted {generated}")
 
         click.echo("Allocation released.")
 
@@ -161,39 +327,126 @@ def release():
 
 
 @main.command()
-def status():
-    """Show all worktrees for the current project."""
-    try:
-        repo_root = get_repo_root()
-        project_config = load_project_config(repo_root)
+@click.option(
+    "--all",
+    "all_projects",
+    is_flag=True,
+    help="List every project in the registry; no repository needed.",
+)
+@click.option("--project", help="List this project; no repository needed.")
+@click.option(
+    "--path-prefix",
+    type=click.Path(file_okay=False),
+    help="Only list worktrees at or below this directory.",
+)
+@click.option(
+    "--stale",
+    "stale_only",
+    is_flag=True,
+    help="Only list worktrees whose path no longer exists.",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["table", "json", "jsonl"]),
+    default="table",
+    help="Output a table (default), one JSON document, or JSON lines.",
+)
+def status(all_projects, project, path_prefix, stale_only, output_format):
+    """Show the worktrees of the current project, or of every project.
 
-        with locked_registry() as data:
-            projects = data.get("projects", {})
-            entries = projects.get(project_config.name, {})
+    Worktrees are printed in registry order as they are read, followed by
+    how much of the port range is allocated.
+    """
+    import os
+    import sys
 
-        if not entries:
-            click.echo("No worktrees registered for this project.")
-            return
+    from .config import load_global_config, load_project_config
+    from .operations import stream_operation
+    from .worktree import get_repo_root
 
-        click.echo(f"Project: {project_config.name}")
-        click.echo(f"{'Worktree':<20} {'Path':<50} {'Ports'}")
-        click.echo("-" * 90)
-        for path, alloc in sorted(entries.items()):
-            wt = alloc.get("worktree", "?")
-            ports_str = ", ".join(
-                f"{k}={v}" for k, v in sorted(alloc.get("ports", {}).items())
-            )
-            click.echo(f"{wt:<20} {path:<50} {ports_str}")
+    try:
+        if project is None and not all_projects:
+            project = load_project_config(get_repo_root()).name
+        if path_prefix is not None:
+            path_prefix = os.path.realpath(path_prefix)
+
+        items = stream_operation(
+            "status_stream",
+            port_range=list(load_global_config().port_range),
+            project=project,
+            path_prefix=path_prefix,
+            stale_only=stale_only,
+        )
+        out = sys.stdout
+        if output_format == "jsonl":
+            _write_jsonl(out, items)
+        elif output_format == "json":
+            _write_json(out, items)
+        else:
+            _write_status_table(out, items)
+        out.flush()
 
     except WorktreeEnvError as e:
         raise click.ClickException(str(e))
 
 
+def _write_jsonl(out, items):
+    import json
+
+    for item in items:
+        out.write(json.dumps(item) + "\n")
+
+
+def _write_json(out, items):
+    """Write ``{"worktrees": [...], "range": {...}}`` one item at a time."""
+    import json
+
+    out.write('{"worktrees": [')
+    separator = "\n  "
+    for item in items:
+        kind = item.pop("kind")
+        if kind == "range":
+            out.write(f'\n], "range": {json.dumps(item)}}}\n')
+            break
+        out.write(separator + json.dumps(item))
+        separator = ",\n  "
+
+
+def _write_status_table(out, items):
+    rows = 0
+    for item in items:
+        if item["kind"] == "range":
+            break
+        if not rows:
+            out.write(f"{'Project':<20} {'Worktree':<20} {'Path':<50} {'Ports'}\n")
+            out.write("-" * 110 + "\n")
+        rows += 1
+        ports_str = ", ".join(f"{k}={v}" for k, v in sorted(item["ports"].items()))
+        worktree = item["worktree"] or "?"
+        out.write(
+            f"{item['project']:<20} {worktree:<20} {item['path']:<50} {ports_str}\n"
+        )
+    if not rows:
+        out.write("No matching worktrees.\n")
+    start, end = item["range"]
+    out.write(
+        f"\nPorts {start}-{end}: {item['allocated']} of {item['size']} allocated "
+        f"({item['utilization']:.1%}), {item['free_runs']} free runs, "
+        f"largest {item['largest_free_run']} "
+        f"({item['fragmentation']:.1%} fragmentation)\n"
+    )
+
+
 @main.command()
 def gc():
     """Prune stale registry entries (paths that no longer exist)."""
-    with locked_registry() as data:
-        removed = gc_stale_entries(data)
+    from .operations import run_operation
+
+    try:
+        removed = run_operation("gc")
+    except WorktreeEnvError as e:
+        raise click.ClickException(str(e))
 
     if removed:
         click.echo(f"Removed {len(removed)} stale entries:")
@@ -201,3 +454,63 @@ def gc():
             click.echo(f"  {entry}")
     else:
         click.echo("No stale entries found.")
+
+
+@main.command()
+@click.argument("port", type=int)
+def who(port):
+    """Show which worktree holds PORT."""
+    from .operations import run_operation
+
+    try:
+        owner = run_operation("who", port=port)
+    except WorktreeEnvError as e:
+        raise click.ClickException(str(e))
+
+    if owner is None:
+        click.echo(f"Port {port} is not allocated.")
+        raise SystemExit(1)
+    click.echo(f"Project:  {owner['project']}")
+    click.echo(f"Worktree: {owner['worktree']}")
+    click.echo(f"Path:     {owner['path']}")
+    click.echo(f"Port:     {port} ({owner['name'] or 'reserved in its port block'})")
+
+
+@main.command()
+@click.argument("shell", type=click.Choice(["bash", "zsh", "fish"]))
+def hook(shell):
+    """Print a prompt hook that applies the worktree env without direnv.
+
+    Add eval "$(worktree-env hook bash)" to ~/.bashrc, the same with zsh to
+    ~/.zshrc, or worktree-env hook fish | source to config.fish.
+    """
+    import shlex
+    import shutil
+    import sys
+
+    from .hook import hook_script
+
+    executable = shutil.which("worktree-env")
+    if executable:
+        command = shlex.quote(executable)
+    else:
+        command = f"{shlex.quote(sys.executable)} -m worktree_env"
+    click.echo(hook_script(shell, command), nl=False)
+
+
+@main.command()
+def daemon():
+    """Serve the registry from memory over a Unix socket.
+
+    While the daemon runs, other commands send their registry work to it
+    instead of locking and rewriting the registry file themselves.
+    """
+    from .client import socket_path
+    from .daemon import run_daemon
+
+    try:
+        run_daemon(
+            on_ready=lambda: click.echo(f"Listening on {socket_path()}")
+        )
+    except WorktreeEnvError as e:
+        raise click.ClickException(str(e))
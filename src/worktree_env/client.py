@@ -0,0 +1,101 @@
+import json
+import os
+from pathlib import Path
+
+from . import errors, tracing
+from .config import config_dir
+from .errors import DaemonError, WorktreeEnvError
+
+# Generous because an init through the daemon may include a full GC sweep.
+REQUEST_TIMEOUT = 60
+
+
+class DaemonUnavailable(Exception):
+    """No daemon is listening; the caller should use the registry directly."""
+
+
+def socket_path() -> Path:
+    return config_dir() / "daemon.sock"
+
+
+def daemon_request(op: str, **params):
+    """Send one request to the daemon and return its result.
+
+    Raises DaemonUnavailable when there is no socket or nothing accepts
+    connections on it. Errors reported by the daemon are re-raised as the
+    matching WorktreeEnvError subclass.
+    """
+    with tracing.phase("daemon_request"):
+        sock = _send(op, params)
+        with sock:
+            try:
+                with sock.makefile("rb") as stream:
+                    line = stream.readline()
+            except OSError as e:
+                raise DaemonError(f"Request to daemon at {socket_path()} failed: {e}")
+    return _decode(line)["result"]
+
+
+def daemon_stream(op: str, **params):
+    """Send a request for a streamed operation and iterate over its items.
+
+    The daemon answers with one ``{"item": ...}`` line per item and a final
+    ``{"result": ...}`` line. DaemonUnavailable is raised right away, as by
+    daemon_request; errors the daemon reports midway are raised by the
+    iterator.
+    """
+    return _stream_items(_send(op, params))
+
+
+def _send(op: str, params: dict):
+    """Connect to the daemon and send a request, returning the socket."""
+    path = socket_path()
+    if not os.path.exists(path):
+        raise DaemonUnavailable()
+
+    import socket
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(REQUEST_TIMEOUT)
+    try:
+        sock.connect(str(path))
+    except (ConnectionRefusedError, FileNotFoundError):
+        sock.close()
+        raise DaemonUnavailable()
+    try:
+        request = {"op": op, "params": params}
+        sock.sendall(json.dumps(request).encode() + b"\n")
+    except OSError as e:
+        sock.close()
+        raise DaemonError(f"Request to daemon at {path} failed: {e}")
+    return sock
+
+
+def _stream_items(sock):
+    with sock:
+        try:
+            with sock.makefile("rb") as stream:
+                for line in stream:
+                    response = _decode(line)
+                    if "item" not in response:
+                        return
+                    yield response["item"]
+        except OSError as e:
+            raise DaemonError(f"Request to daemon at {socket_path()} failed: {e}")
+    raise DaemonError(f"Daemon at {socket_path()} closed the connection")
+
+
+def _decode(line: bytes) -> dict:
+    if not line:
+        raise DaemonError(f"Daemon at {socket_path()} closed the connection")
+    response = json.loads(line)
+    if "error" in response:
+        raise _error_class(response["error"]["type"])(response["error"]["message"])
+    return response
+
+
+def _error_class(name: str) -> type[WorktreeEnvError]:
+    cls = getattr(errors, name, None)
+    if isinstance(cls, type) and issubclass(cls, WorktreeEnvError):
+        return cls
+    return WorktreeEnvError
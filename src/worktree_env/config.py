@@ -1,25 +1,112 @@
+import json
 import os
-from dataclasses import dataclass, field
+import time
+import zlib
 from pathlib import Path
 
-from .errors import ConfigNotFoundError
+from . import tracing
+from .errors import ConfigNotFoundError, InvalidConfigError
+from .fsutil import RACY_SECONDS, atomic_write_text
 
-try:
-    import tomllib
-except ModuleNotFoundError:
-    import tomli as tomllib
 
+class _Config:
+    """Equality, repr and dict conversion over the names in ``FIELDS``.
 
-@dataclass
-class ProjectConfig:
-    name: str
-    ports: dict[str, dict] = field(default_factory=dict)
-    env: dict[str, dict] = field(default_factory=dict)
+    The configs are plain classes rather than dataclasses because
+    ``dataclasses`` imports ``inspect``, which alone costs several
+    milliseconds on every ``show``.
+    """
 
+    FIELDS: tuple[str, ...] = ()
 
-@dataclass
-class GlobalConfig:
-    port_range: tuple[int, int] = (4000, 8999)
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.as_dict() == other.as_dict()
+
+    def __repr__(self) -> str:
+        args = ", ".join(f"{k}={v!r}" for k, v in self.as_dict().items())
+        return f"{type(self).__name__}({args})"
+
+
+class ProjectConfig(_Config):
+    FIELDS = ("name", "ports", "env", "port_block", "outputs")
+
+    def __init__(
+        self,
+        name: str,
+        ports: dict[str, dict] | None = None,
+        env: dict[str, dict] | None = None,
+        port_block: int | None = None,
+        outputs: dict[str, dict] | None = None,
+    ):
+        self.name = name
+        self.ports = {} if ports is None else ports
+        self.env = {} if env is None else env
+        # Size of the aligned block of ports each worktree reserves, or None
+        # to allocate every port on its own.
+        self.port_block = port_block
+        # Extra files rendering the env vars, keyed on their path relative
+        # to the worktree; see outputs.py.
+        self.outputs = {} if outputs is None else outputs
+
+    def port_offsets(self) -> dict[str, int]:
+        """Map each port name to its offset within the worktree's block.
+
+        Names with an explicit ``offset`` keep it; the others take the
+        lowest unused offsets in the order they are declared.
+        """
+        offsets = {
+            name: options["offset"]
+            for name, options in self.ports.items()
+            if "offset" in options
+        }
+        taken = set(offsets.values())
+        free = (n for n in range(self.port_block or 0) if n not in taken)
+        for name in self.ports:
+            if name not in offsets:
+                offsets[name] = next(free)
+        return {name: offsets[name] for name in self.ports}
+
+
+REGISTRY_BACKENDS = ("json", "sqlite", "sharded", "journal", "packed")
+
+PORT_STRATEGIES = ("lowest", "hash")
+
+
+class GlobalConfig(_Config):
+    FIELDS = ("port_range", "port_strategy", "registry_backend", "gc_interval")
+
+    def __init__(
+        self,
+        port_range: tuple[int, int] = (4000, 8999),
+        port_strategy: str = "lowest",
+        registry_backend: str = "json",
+        gc_interval: int = 600,
+    ):
+        self.port_range = tuple(port_range)
+        self.port_strategy = port_strategy
+        self.registry_backend = registry_backend
+        self.gc_interval = gc_interval
+
+
+# Bump when parsing or validation changes in a way that makes previously
+# cached configs wrong. Field additions are picked up automatically.
+CACHE_VERSION = 1
+
+
+def _load_toml(path: Path) -> dict:
+    # Imported here so commands that never parse TOML don't pay for it.
+    try:
+        import tomllib
+    except ModuleNotFoundError:
+        import tomli as tomllib
+
+    with open(path, "rb") as f:
+        return tomllib.load(f)
 
 
 def config_dir() -> Path:
@@ -29,14 +116,74 @@ def config_dir() -> Path:
     return Path.home() / ".config" / "worktree-env"
 
 
+def _cache_path(config_path: Path) -> Path:
+    checksum = zlib.crc32(str(config_path).encode())
+    name = f"{config_path.name.lstrip('.')}-{checksum:08x}.json"
+    return config_dir() / "cache" / name
+
+
+def _load_cached(config_path: Path, config_cls, parse):
+    """Load a config through a cache keyed on the file's stat.
+
+    Returns None when ``config_path`` does not exist. While the file's
+    path, inode, mtime and size are unchanged, the validated config is read
+    back from a small JSON file under ``config_dir()/cache`` instead of
+    parsing TOML again.
+    """
+    try:
+        st = os.stat(config_path)
+    except FileNotFoundError:
+        return None
+
+    key = [
+        CACHE_VERSION,
+        str(config_path),
+        st.st_ino,
+        st.st_mtime_ns,
+        st.st_size,
+        list(config_cls.FIELDS),
+    ]
+    cache_path = _cache_path(config_path)
+    try:
+        cached = json.loads(cache_path.read_text())
+        if cached["key"] == key:
+            config = config_cls(**cached["config"])
+            tracing.count("config.cache_hits")
+            return config
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    tracing.count("config.cache_misses")
+    config = parse(config_path)
+    if time.time() - st.st_mtime >= RACY_SECONDS:
+        payload = {"key": key, "config": config.as_dict()}
+        try:
+            text = json.dumps(payload, separators=(",", ":"))
+        except (TypeError, ValueError):
+            # TOML dates and times have no JSON form; such configs are
+            # simply parsed every time.
+            return config
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_text(cache_path, text)
+        except OSError:
+            pass
+    return config
+
+
 def load_project_config(repo_root: Path) -> ProjectConfig:
     config_path = repo_root / ".worktree-env.toml"
-    if not config_path.exists():
+    with tracing.phase("project_config"):
+        config = _load_cached(config_path, ProjectConfig, _parse_project_config)
+    if config is None:
         raise ConfigNotFoundError(
             f"No .worktree-env.toml found in {repo_root}"
         )
-    with open(config_path, "rb") as f:
-        data = tomllib.load(f)
+    return config
+
+
+def _parse_project_config(config_path: Path) -> ProjectConfig:
+    data = _load_toml(config_path)
 
     project = data.get("project", {})
     name = project.get("name")
@@ -45,21 +192,93 @@ def load_project_config(repo_root: Path) -> ProjectConfig:
             ".worktree-env.toml must have [project] name"
         )
 
+    ports = dict(data.get("ports", {}))
+    port_block = ports.pop("block_size", None)
+    if port_block is not None:
+        _check_port_block(config_path, ports, port_block)
+
+    outputs = data.get("outputs", {})
+    if outputs:
+        from .outputs import check_outputs
+
+        check_outputs(config_path, outputs)
+
     return ProjectConfig(
         name=name,
-        ports=data.get("ports", {}),
+        ports=ports,
         env=data.get("env", {}),
+        port_block=port_block,
+        outputs=outputs,
     )
 
 
+def _check_port_block(config_path: Path, ports: dict, port_block) -> None:
+    if type(port_block) is not int or port_block < 1:
+        raise InvalidConfigError(
+            f"[ports] block_size in {config_path} must be a positive integer"
+        )
+    if len(ports) > port_block:
+        raise InvalidConfigError(
+            f"[ports] block_size = {port_block} in {config_path} is too small "
+            f"for {len(ports)} ports"
+        )
+    seen = {}
+    for name, options in ports.items():
+        if "offset" not in options:
+            continue
+        offset = options["offset"]
+        if type(offset) is not int or not 0 <= offset < port_block:
+            raise InvalidConfigError(
+                f"Port {name} in {config_path} has offset {offset!r}; "
+                f"expected an integer from 0 to {port_block - 1}"
+            )
+        if offset in seen:
+            raise InvalidConfigError(
+                f"Ports {seen[offset]} and {name} in {config_path} "
+                f"share offset {offset}"
+            )
+        seen[offset] = name
+
+
 def load_global_config() -> GlobalConfig:
     config_path = config_dir() / "config.toml"
-    if not config_path.exists():
-        return GlobalConfig()
+    with tracing.phase("global_config"):
+        config = _load_cached(config_path, GlobalConfig, _parse_global_config)
+    return config if config is not None else GlobalConfig()
+
 
-    with open(config_path, "rb") as f:
-        data = tomllib.load(f)
+def _parse_global_config(config_path: Path) -> GlobalConfig:
+    data = _load_toml(config_path)
 
     ports = data.get("ports", {})
     port_range = ports.get("range", [4000, 8999])
-    return GlobalConfig(port_range=tuple(port_range))
+    strategy = ports.get("strategy", "lowest")
+    if strategy not in PORT_STRATEGIES:
+        raise InvalidConfigError(
+            f"Unknown port strategy {strategy!r} in {config_path}. "
+            f"Expected one of: {', '.join(PORT_STRATEGIES)}"
+        )
+
+    registry = data.get("registry", {})
+    backend = registry.get("backend", "json")
+    if backend not in REGISTRY_BACKENDS:
+        raise InvalidConfigError(
+            f"Unknown registry backend {backend!r} in {config_path}. "
+            f"Expected one of: {', '.join(REGISTRY_BACKENDS)}"
+        )
+
+    gc = data.get("gc", {})
+    gc_interval = gc.get("interval", 600)
+    # TOML booleans are ints to Python, but `interval = true` is a mistake.
+    if type(gc_interval) is not int or gc_interval < 0:
+        raise InvalidConfigError(
+            f"Invalid gc interval {gc_interval!r} in {config_path}. "
+            "Expected a non-negative number of seconds"
+        )
+
+    return GlobalConfig(
+        port_range=tuple(port_range),
+        port_strategy=strategy,
+        registry_backend=backend,
+        gc_interval=gc_interval,
+    )
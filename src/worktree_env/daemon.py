@@ -0,0 +1,178 @@
+import asyncio
+import copy
+import json
+import signal
+from pathlib import Path
+
+from .client import DaemonUnavailable, daemon_request, socket_path
+from .errors import DaemonError, WorktreeEnvError
+from .operations import OPERATIONS, STREAMS
+from .registry import held_registry, restore_project
+
+# How long a mutating request waits for others to join the same write.
+FLUSH_DELAY = 0.005
+
+# Bytes a stream may queue for a client before waiting for it to read them.
+STREAM_BUFFER = 256 * 1024
+
+
+class Daemon:
+    """Serves registry operations from memory over a Unix socket.
+
+    Requests are single JSON lines answered with a single JSON line, or for
+    streamed operations with one line per item before the last. Handlers
+    run one at a time on the event loop, so each operation sees a consistent
+    registry. Mutating requests are answered only after their change is on
+    disk, but concurrent requests share one write (group commit). The
+    projects an operation touches are copied before it runs, so a failed
+    operation or a failed write is rolled back instead of lingering in
+    memory and reaching disk with a later write.
+    """
+
+    def __init__(self, data: dict, save):
+        self.data = data
+        self._save = save
+        self._waiters: list[asyncio.Future] = []
+        # Project -> its entries before the first unsaved change to it
+        # (None if it did not exist), for rolling back a failed write.
+        self._undo: dict[str, dict | None] = {}
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stopped: asyncio.Event | None = None
+
+    async def serve(self, path: Path, ready=None) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        path.unlink(missing_ok=True)
+        server = await asyncio.start_unix_server(self._handle, path=str(path))
+        try:
+            if ready is not None:
+                ready()
+            async with server:
+                await self._stopped.wait()
+        finally:
+            path.unlink(missing_ok=True)
+            self._flush()
+
+    def stop(self) -> None:
+        """Ask ``serve`` to return. Safe to call from any thread."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    async def _handle(self, reader, writer) -> None:
+        try:
+            request = json.loads(await reader.readline())
+            if request["op"] in STREAMS:
+                result = await self._stream(request, writer)
+            else:
+                result = await self._dispatch(request)
+            response = {"result": result}
+        except WorktreeEnvError as e:
+            response = {"error": {"type": type(e).__name__, "message": str(e)}}
+        except Exception as e:
+            response = {
+                "error": {"type": "DaemonError", "message": f"Bad request: {e!r}"}
+            }
+        writer.write(json.dumps(response).encode() + b"\n")
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _dispatch(self, request: dict):
+        if request["op"] == "ping":
+            return "pong"
+        fn, mutates, scope = OPERATIONS[request["op"]]
+        params = request.get("params", {})
+        if not mutates:
+            return fn(self.data, **params)
+
+        before = self._snapshot(scope(params) if scope is not None else None)
+        try:
+            result = fn(self.data, **params)
+            # Serialize before yielding to the loop; later requests may
+            # modify the same allocation dicts.
+            result = json.loads(json.dumps(result))
+        except BaseException:
+            self._restore(before)
+            raise
+        for name, entries in before.items():
+            self._undo.setdefault(name, entries)
+        await self._persisted()
+        return result
+
+    async def _stream(self, request: dict, writer) -> None:
+        """Write each item of a streamed operation as its own line.
+
+        Other requests run while a slow client catches up, so the operation
+        must cope with the registry changing between items.
+        """
+        fn, _ = STREAMS[request["op"]]
+        for item in fn(self.data, **request.get("params", {})):
+            writer.write(json.dumps({"item": item}).encode() + b"\n")
+            if writer.transport.get_write_buffer_size() > STREAM_BUFFER:
+                await writer.drain()
+
+    def _snapshot(self, projects: list[str] | None) -> dict[str, dict | None]:
+        """Copy the given projects, or all of them when None."""
+        current = self.data.setdefault("projects", {})
+        names = list(current) if projects is None else projects
+        return {name: copy.deepcopy(current.get(name)) for name in names}
+
+    def _restore(self, snapshot: dict[str, dict | None]) -> None:
+        for name, entries in snapshot.items():
+            restore_project(self.data, name, entries)
+
+    def _persisted(self) -> asyncio.Future:
+        waiter = self._loop.create_future()
+        self._waiters.append(waiter)
+        if self._flush_handle is None:
+            self._flush_handle = self._loop.call_later(FLUSH_DELAY, self._flush)
+        return waiter
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        waiters, self._waiters = self._waiters, []
+        undo, self._undo = self._undo, {}
+        try:
+            self._save()
+        except Exception as e:
+            # Runs as a loop callback: anything escaping here would leave
+            # the waiters, and their clients, hanging.
+            self._restore(undo)
+            error = DaemonError(f"Could not persist the registry: {e}")
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(error)
+            return
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+def daemon_running() -> bool:
+    try:
+        daemon_request("ping")
+    except DaemonUnavailable:
+        return False
+    return True
+
+
+def run_daemon(on_ready=None) -> None:
+    """Own the registry and serve requests until SIGINT or SIGTERM."""
+    path = socket_path()
+    if daemon_running():
+        raise DaemonError(f"A daemon is already listening on {path}")
+
+    with held_registry() as (data, save):
+        daemon = Daemon(data, save)
+
+        async def main():
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, daemon.stop)
+            await daemon.serve(path, ready=on_ready)
+
+        asyncio.run(main())
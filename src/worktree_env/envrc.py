@@ -1,11 +1,13 @@
+import json
 import os
-import shutil
-import subprocess
+import re
 from pathlib import Path
 
 import click
 
+from .config import config_dir
 from .errors import WorktreeEnvError
+from .fsutil import atomic_write_text, update_text
 
 SHELL_HOOKS = {
     "zsh": {"rc": ".zshrc", "hook": 'eval "$(direnv hook zsh)"'},
@@ -13,6 +15,8 @@ SHELL_HOOKS = {
     "fish": {"rc": ".config/fish/config.fish", "hook": "direnv hook fish | source"},
 }
 
+_SAFE_VALUE = re.compile(r"^[a-zA-Z0-9_./:-]+$")
+
 
 def _detect_shell() -> str | None:
     """Detect user's shell from $SHELL env var."""
@@ -25,7 +29,7 @@ def _ensure_shell_hook(shell_name: str) -> bool:
     """Add direnv hook to shell rc file if not already present. Returns True if added."""
     config = SHELL_HOOKS[shell_name]
     rc_path = Path.home() / config["rc"]
-    if rc_path.exists() and "direnv hook" in rc_path.read_text():
+    if _rc_hooks(rc_path)["direnv"]:
         return False
     rc_path.parent.mkdir(parents=True, exist_ok=True)
     with rc_path.open("a") as f:
@@ -33,19 +37,83 @@ def _ensure_shell_hook(shell_name: str) -> bool:
     return True
 
 
-def ensure_direnv() -> None:
-    """Ensure direnv is installed and shell hook is configured.
+def _hook_cache_path() -> Path:
+    return config_dir() / "cache" / "shell-hooks.json"
+
+
+def _rc_stat_key(rc_path: Path) -> list[int] | None:
+    try:
+        st = os.stat(rc_path)
+    except OSError:
+        return None
+    return [st.st_ino, st.st_mtime_ns, st.st_size]
+
+
+def _read_hook_cache() -> dict:
+    try:
+        return json.loads(_hook_cache_path().read_text())
+    except (OSError, ValueError):
+        return {}
+
 
-    Raises WorktreeEnvError if direnv is not installed.
-    Auto-adds shell hook if direnv is installed but hook is missing.
+def _rc_hooks(rc_path: Path) -> dict[str, bool]:
+    """Which hooks the rc file loads: ``{"direnv": ..., "native": ...}``.
+
+    The answer is cached along with the rc file's stat, so later runs skip
+    reading the file until it changes.
     """
-    if not shutil.which("direnv"):
+    key = _rc_stat_key(rc_path)
+    if key is None:
+        return {"direnv": False, "native": False}
+    cached = _read_hook_cache().get(str(rc_path))
+    if isinstance(cached, dict) and cached.get("stat") == key:
+        return cached["hooks"]
+    try:
+        text = rc_path.read_text()
+    except (OSError, UnicodeDecodeError):
+        text = ""
+    hooks = {"direnv": "direnv hook" in text, "native": "worktree-env hook" in text}
+    _cache_hooks(rc_path, key, hooks)
+    return hooks
+
+
+def _cache_hooks(rc_path: Path, key: list[int], hooks: dict[str, bool]) -> None:
+    cache = _read_hook_cache()
+    cache[str(rc_path)] = {"stat": key, "hooks": hooks}
+    cache_path = _hook_cache_path()
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_text(cache_path, json.dumps(cache))
+    except OSError:
+        pass
+
+
+def ensure_direnv() -> bool:
+    """Ensure the worktree env reaches the user's shell. Returns whether to use direnv.
+
+    When the shell's rc file loads the native hook (``worktree-env hook``),
+    nothing is required or added, and direnv is used only if it is
+    installed. Otherwise direnv is required, and its hook is added to the
+    rc file if missing.
+
+    Raises WorktreeEnvError if neither direnv nor the native hook is set up.
+    """
+    import shutil
+
+    has_direnv = shutil.which("direnv") is not None
+    shell_name = _detect_shell()
+    if shell_name and _native_hook_installed(shell_name):
+        return has_direnv
+
+    if not has_direnv:
         raise WorktreeEnvError(
             "direnv is required but not installed. Install it first:\n"
-            "  brew install direnv"
+            "  brew install direnv\n"
+            "or load the environment without direnv by adding\n"
+            '  eval "$(worktree-env hook bash)"\n'
+            "(or zsh, or fish) to your shell's rc file."
         )
 
-    shell_name = _detect_shell()
     if shell_name:
         if _ensure_shell_hook(shell_name):
             rc_file = SHELL_HOOKS[shell_name]["rc"]
@@ -57,15 +125,14 @@ def ensure_direnv() -> None:
             f"Warning: unsupported shell ({shell_path}). "
             "Add the direnv hook manually: https://direnv.net/docs/hook.html"
         )
+    return True
 
 
-def write_envrc(
-    path: Path,
-    env_vars: dict[str, str],
-    ports: dict[str, int],
-) -> Path:
-    envrc_path = path / ".envrc"
+def _native_hook_installed(shell_name: str) -> bool:
+    return _rc_hooks(Path.home() / SHELL_HOOKS[shell_name]["rc"])["native"]
 
+
+def render_envrc(env_vars: dict[str, str], ports: dict[str, int]) -> str:
     lines = ["# Generated by worktree-env — do not edit manually", ""]
 
     merged = {}
@@ -77,8 +144,29 @@ def write_envrc(
         lines.append(f"export {key}={_shell_quote(value)}")
 
     lines.append("")
-    envrc_path.write_text("\n".join(lines))
-    return envrc_path
+    return "\n".join(lines)
+
+
+def update_envrc(
+    path: Path,
+    env_vars: dict[str, str],
+    ports: dict[str, int],
+) -> bool:
+    """Write ``.envrc`` only if its content changed. Returns True if written.
+
+    Leaving an identical file untouched keeps its mtime, so direnv does not
+    reload every open shell in the worktree.
+    """
+    return update_text(path / ".envrc", render_envrc(env_vars, ports))
+
+
+def write_envrc(
+    path: Path,
+    env_vars: dict[str, str],
+    ports: dict[str, int],
+) -> Path:
+    update_envrc(path, env_vars, ports)
+    return path / ".envrc"
 
 
 def _shell_quote(value: str) -> str:
@@ -88,11 +176,89 @@ def _shell_quote(value: str) -> str:
 
 
 def _is_safe(value: str) -> bool:
-    import re
-    return bool(re.match(r"^[a-zA-Z0-9_./:-]+$", value))
+    return bool(_SAFE_VALUE.match(value))
+
+
+def _allow_marker_path(path: Path) -> Path:
+    import hashlib
+
+    envrc = str((path / ".envrc").resolve())
+    name = hashlib.sha1(envrc.encode()).hexdigest()
+    return config_dir() / "cache" / "direnv-allowed" / name
+
+
+def _envrc_digest(path: Path) -> str | None:
+    import hashlib
+
+    try:
+        return hashlib.sha1((path / ".envrc").read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+def _allow_marked(path: Path) -> bool:
+    """Return True if ``.envrc`` in ``path`` was allowed with its current content."""
+    digest = _envrc_digest(path)
+    try:
+        return digest is not None and _allow_marker_path(path).read_text() == digest
+    except OSError:
+        return False
+
+
+def _mark_allowed(path: Path) -> None:
+    """Remember the content of ``.envrc`` in ``path`` as allowed.
+
+    direnv keys its approvals on the file's path and content, so the
+    marker stays valid until the file changes.
+    """
+    digest = _envrc_digest(path)
+    if digest is None:
+        return
+    marker = _allow_marker_path(path)
+    try:
+        marker.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_text(marker, digest)
+    except OSError:
+        pass
+
+
+def direnv_allowed(path: Path) -> bool:
+    """Return True if direnv reports the ``.envrc`` in ``path`` as allowed.
+
+    Once allowed, the ``.envrc`` content is remembered in the cache
+    directory, and direnv is not asked again until the file changes.
+    Anything unexpected (direnv missing, an older direnv without
+    ``status --json``, unparsable output) counts as not allowed, so the
+    caller falls back to running ``direnv allow``.
+    """
+    import subprocess
+
+    if _allow_marked(path):
+        return True
+    try:
+        result = subprocess.run(
+            ["direnv", "status", "--json"],
+            cwd=path,
+            capture_output=True,
+            text=True,
+        )
+        found = json.loads(result.stdout)["state"]["foundRC"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+    if not found or Path(found["path"]).resolve() != (path / ".envrc").resolve():
+        return False
+    # Older releases report a boolean, newer ones an enum where 0 is allowed.
+    allowed = found.get("allowed")
+    if allowed is True or (type(allowed) is int and allowed == 0):
+        _mark_allowed(path)
+        return True
+    return False
 
 
 def run_direnv_allow(path: Path) -> bool:
+    import shutil
+    import subprocess
+
     if not shutil.which("direnv"):
         return False
     try:
@@ -102,6 +268,7 @@ def run_direnv_allow(path: Path) -> bool:
             capture_output=True,
             check=True,
         )
-        return True
     except subprocess.CalledProcessError:
         return False
+    _mark_allowed(path)
+    return True
@@ -10,9 +10,29 @@ class RegistryCorruptedError(WorktreeEnvError):
     pass
 
 
+class RegistryConflictError(WorktreeEnvError):
+    pass
+
+
 class PortsExhaustedError(WorktreeEnvError):
     pass
 
 
 class NotAGitRepoError(WorktreeEnvError):
     pass
+
+
+class InvalidConfigError(WorktreeEnvError):
+    pass
+
+
+class AllocationNotFoundError(WorktreeEnvError):
+    pass
+
+
+class TemplateCycleError(WorktreeEnvError):
+    pass
+
+
+class DaemonError(WorktreeEnvError):
+    pass
@@ -0,0 +1,87 @@
+import os
+import stat
+from pathlib import Path
+
+# A file modified this recently might be modified again within the same
+# mtime tick without changing size, so a cache keyed on its stat could miss
+# the second change. Such files are read but not cached yet.
+RACY_SECONDS = 2
+
+
+def atomic_write_text(path: Path, text: str) -> None:
+    """Replace ``path`` with ``text`` so readers see either the old or new file.
+
+    The content goes to a temporary file in the same directory, is fsynced,
+    and is then renamed over ``path``. A process killed halfway leaves the
+    previous file intact. The file keeps the mode of the one it replaces,
+    and a new file gets the default mode under the process umask, as with
+    a plain ``open()``.
+    """
+    _atomic_write(path, text, "w")
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    """``atomic_write_text`` for binary content."""
+    _atomic_write(path, data, "wb")
+
+
+def _atomic_write(path: Path, content, mode: str) -> None:
+    fd, tmp_path = _create_temp(path)
+    try:
+        try:
+            os.fchmod(fd, stat.S_IMODE(os.stat(path).st_mode))
+        except FileNotFoundError:
+            pass
+        with os.fdopen(fd, mode) as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    _fsync_dir(path.parent)
+
+
+def _create_temp(path: Path) -> tuple[int, Path]:
+    # tempfile.mkstemp would create the file 0600 regardless of the umask.
+    # Opening with 0666 lets the kernel apply the umask without changing
+    # it, which os.umask() can only do racily while other threads write.
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_CLOEXEC", 0)
+    while True:
+        tmp_path = path.parent / f".{path.name}.{os.urandom(6).hex()}.tmp"
+        try:
+            return os.open(tmp_path, flags, 0o666), tmp_path
+        except FileExistsError:
+            continue
+
+
+def _fsync_dir(path: Path) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def update_text(path: Path, text: str) -> bool:
+    """Atomically write ``text`` to ``path`` unless it already holds it.
+
+    Returns True if the file was written. Leaving an identical file alone
+    keeps its mtime, so tools watching it don't reload.
+    """
+    try:
+        if path.read_text() == text:
+            return False
+    except (OSError, UnicodeDecodeError):
+        pass
+    atomic_write_text(path, text)
+    return True
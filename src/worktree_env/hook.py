@@ -0,0 +1,255 @@
+"""Native shell hook: apply the worktree's env vars at every prompt.
+
+``worktree-env hook <shell>`` prints a snippet that runs ``worktree-env
+hook-env <shell>`` before each prompt and evaluates what it prints. That
+entry point runs on every prompt, so its warm path imports nothing beyond
+``os``, ``sys`` and ``json``: it finds the worktree with a few stat calls
+and answers from a cache keyed on the repository root's inode, the stat of
+the project and global configs, and the registry generation. Only a cache
+miss loads the config and registry modules.
+
+What was applied is kept in the shell's ``WORKTREE_ENV_STATE`` variable,
+along with the values the applied variables had before, so only changes
+are printed and leaving the worktree restores the previous environment.
+"""
+
+import json
+import os
+import sys
+
+SHELLS = ("bash", "zsh", "fish")
+
+STATE_VAR = "WORKTREE_ENV_STATE"
+
+# Bump when the layout of cache entries changes.
+CACHE_VERSION = 1
+
+_HOOKS = {
+    "bash": """\
+_worktree_env_hook() {
+  local previous_exit_status=$?
+  eval "$(%(command)s hook-env bash)"
+  return $previous_exit_status
+}
+if [[ ";${PROMPT_COMMAND[*]:-};" != *";_worktree_env_hook;"* ]]; then
+  PROMPT_COMMAND="_worktree_env_hook${PROMPT_COMMAND:+;$PROMPT_COMMAND}"
+fi
+""",
+    "zsh": """\
+_worktree_env_hook() {
+  eval "$(%(command)s hook-env zsh)"
+}
+typeset -ag precmd_functions chpwd_functions
+if (( ! ${precmd_functions[(I)_worktree_env_hook]} )); then
+  precmd_functions=(_worktree_env_hook $precmd_functions)
+fi
+if (( ! ${chpwd_functions[(I)_worktree_env_hook]} )); then
+  chpwd_functions=(_worktree_env_hook $chpwd_functions)
+fi
+""",
+    "fish": """\
+function _worktree_env_hook --on-event fish_prompt --on-variable PWD
+    %(command)s hook-env fish | source
+end
+""",
+}
+
+
+def hook_script(shell: str, command: str) -> str:
+    """The snippet that installs the prompt hook, running ``command``."""
+    return _HOOKS[shell] % {"command": command}
+
+
+def _config_dir() -> str:
+    # config.config_dir, without importing config and pathlib at every
+    # prompt.
+    override = os.environ.get("WORKTREE_ENV_CONFIG_DIR")
+    if override:
+        return override
+    return os.path.join(os.path.expanduser("~"), ".config", "worktree-env")
+
+
+def _stat_key(path: str) -> list[int] | None:
+    # The same shape registry.registry_generation uses for each file.
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_ino, st.st_mtime_ns, st.st_size]
+
+
+def _find_git_dir(start: str) -> str | None:
+    """The nearest directory at or above ``start`` that contains ``.git``."""
+    directory = start
+    while True:
+        if os.path.lexists(os.path.join(directory, ".git")):
+            return directory
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+def hook_env(shell: str) -> int:
+    """Print the commands that bring the shell's environment up to date."""
+    if shell not in SHELLS:
+        sys.stderr.write(f"worktree-env: unsupported shell {shell!r}\n")
+        return 2
+    try:
+        cwd = os.getcwd()
+    except OSError:
+        return 0
+
+    directory = _find_git_dir(cwd)
+    env = {} if directory is None else _cached_env(directory)
+    sys.stdout.write(_diff(shell, _load_state(), env))
+    return 0
+
+
+def _cached_env(directory: str) -> dict[str, str]:
+    config_dir = _config_dir()
+    cache_path = os.path.join(config_dir, "cache", "hook-env.json")
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+
+    entry = cache.get(directory)
+    if entry is not None:
+        try:
+            token = entry["generation"]
+            key = [
+                CACHE_VERSION,
+                os.stat(directory).st_ino,
+                _stat_key(os.path.join(entry["root"], ".worktree-env.toml")),
+                _stat_key(os.path.join(config_dir, "config.toml")),
+            ]
+            if key == entry["key"] and (
+                token is None
+                or token[1:] == [_stat_key(path) for path in entry["files"]]
+            ):
+                return entry["env"]
+        except (OSError, KeyError, TypeError, IndexError):
+            pass
+
+    entry, settled = _resolve_entry(directory, config_dir)
+    if settled:
+        cache[directory] = entry
+        _write_cache(cache_path, cache)
+    return entry["env"]
+
+
+def _resolve_entry(directory: str, config_dir: str) -> tuple[dict, bool]:
+    """Resolve the environment of the worktree containing ``directory``.
+
+    Returns the cache entry for it, and whether it may be cached: not when
+    resolving failed, nor when a file it depends on changed too recently to
+    be told apart from a later change.
+    """
+    import time
+    from pathlib import Path
+
+    from .config import load_project_config
+    from .errors import (
+        AllocationNotFoundError,
+        ConfigNotFoundError,
+        NotAGitRepoError,
+        WorktreeEnvError,
+    )
+    from .fsutil import RACY_SECONDS
+    from .registry import registry_files, registry_generation
+    from .resolve import merged_env, resolve_allocation
+    from .worktree import get_repo_root
+
+    root = Path(directory)
+    global_config = _stat_key(os.path.join(config_dir, "config.toml"))
+    project_config = None
+    files, token, env = [], None, {}
+    try:
+        root = get_repo_root(root)
+        project_config = _stat_key(str(root / ".worktree-env.toml"))
+        project = load_project_config(root).name
+        files = [str(path) for path in registry_files(project)]
+        token = registry_generation(project)
+        env = merged_env(resolve_allocation(root))
+    except (NotAGitRepoError, ConfigNotFoundError, AllocationNotFoundError):
+        pass
+    except WorktreeEnvError as e:
+        sys.stderr.write(f"worktree-env: {e}\n")
+        return {"env": {}}, False
+
+    since = time.time_ns() - RACY_SECONDS * 1_000_000_000
+    configs = [k for k in (project_config, global_config) if k is not None]
+    settled = all(k[1] <= since for k in configs) and not (files and token is None)
+    key = [CACHE_VERSION, os.stat(directory).st_ino, project_config, global_config]
+    entry = {
+        "key": key,
+        "root": str(root),
+        "files": files,
+        "generation": token,
+        "env": env,
+    }
+    return entry, settled
+
+
+def _write_cache(cache_path: str, cache: dict) -> None:
+    from pathlib import Path
+
+    from .fsutil import atomic_write_text
+
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        atomic_write_text(Path(cache_path), json.dumps(cache))
+    except OSError:
+        pass
+
+
+def _load_state() -> dict:
+    try:
+        state = json.loads(os.environ[STATE_VAR])
+    except (KeyError, ValueError):
+        return {"env": {}, "saved": {}}
+    if not isinstance(state, dict):
+        return {"env": {}, "saved": {}}
+    return {"env": state.get("env", {}), "saved": state.get("saved", {})}
+
+
+def _diff(shell: str, state: dict, env: dict[str, str]) -> str:
+    """Commands turning the applied ``state`` into ``env``.
+
+    Variables that are no longer wanted get back the value they had before
+    they were first applied, or are unset. Variables already holding the
+    wanted value are left alone, and nothing is printed when nothing
+    changes.
+    """
+    env = {k: v for k, v in env.items() if k.isidentifier() and k.isascii()}
+    applied, saved = state["env"], state["saved"]
+    lines = []
+    for name in applied:
+        if name not in env:
+            lines.append(_assign(shell, name, saved.get(name)))
+
+    kept = {}
+    for name, value in env.items():
+        kept[name] = saved[name] if name in applied else os.environ.get(name)
+        if os.environ.get(name) != value:
+            lines.append(_assign(shell, name, value))
+
+    new_state = {"env": env, "saved": kept} if env else None
+    if new_state != (state if applied else None):
+        value = None if new_state is None else json.dumps(new_state, sort_keys=True)
+        lines.append(_assign(shell, STATE_VAR, value))
+    return "".join(lines)
+
+
+def _assign(shell: str, name: str, value: str | None) -> str:
+    if shell == "fish":
+        if value is None:
+            return f"set -e {name};\n"
+        quoted = value.replace("\\", "\\\\").replace("'", "\\'")
+        return f"set -gx {name} '{quoted}';\n"
+    if value is None:
+        return f"unset {name};\n"
+    quoted = value.replace("'", "'\\''")
+    return f"export {name}='{quoted}';\n"
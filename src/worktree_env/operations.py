@@ -0,0 +1,193 @@
+from pathlib import Path
+
+from . import tracing
+from .client import DaemonUnavailable, daemon_request, daemon_stream
+from .config import ProjectConfig
+from .registry import (
+    find_port_owner,
+    gc_stale_entries,
+    get_all_allocated_ports,
+    get_allocation,
+    iter_allocations,
+    locked_registry,
+    read_registry,
+    remove_allocation,
+)
+
+
+def op_init(
+    data: dict,
+    targets: list[dict],
+    port_range: list[int],
+    gc_max_age: float | None,
+    port_strategy: str = "lowest",
+) -> dict:
+    from .allocation import WorktreeTarget, allocate_worktrees
+
+    removed = gc_stale_entries(data, max_age=gc_max_age)
+    worktree_targets = [
+        WorktreeTarget(
+            Path(target["path"]), target["name"], ProjectConfig(**target["config"])
+        )
+        for target in targets
+    ]
+    allocations = allocate_worktrees(
+        data, worktree_targets, tuple(port_range), port_strategy
+    )
+    return {"removed": removed, "allocations": allocations}
+
+
+def op_sync(
+    data: dict,
+    targets: list[dict],
+    released: list[dict],
+    port_range: list[int],
+    port_strategy: str = "lowest",
+) -> dict:
+    """Release worktrees that are gone and re-allocate those that changed.
+
+    Unlike init, it does not collect garbage: the caller knows exactly which
+    worktrees went away.
+    """
+    from .allocation import WorktreeTarget, allocate_worktrees
+
+    removed = [
+        entry["path"]
+        for entry in released
+        if remove_allocation(data, entry["project"], entry["path"])
+    ]
+    worktree_targets = [
+        WorktreeTarget(
+            Path(target["path"]), target["name"], ProjectConfig(**target["config"])
+        )
+        for target in targets
+    ]
+    allocations = allocate_worktrees(
+        data, worktree_targets, tuple(port_range), port_strategy
+    )
+    return {"released": removed, "allocations": allocations}
+
+
+def op_show(data: dict, project: str, path: str) -> dict | None:
+    return get_allocation(data, project, path)
+
+
+def op_release(data: dict, project: str, path: str) -> bool:
+    return remove_allocation(data, project, path)
+
+
+def op_status(data: dict, project: str) -> dict:
+    return data.get("projects", {}).get(project, {})
+
+
+def op_gc(data: dict) -> list[str]:
+    return gc_stale_entries(data)
+
+
+def op_who(data: dict, port: int) -> dict | None:
+    return find_port_owner(data, port)
+
+
+def op_status_stream(
+    data: dict,
+    port_range: list[int],
+    project: str | None = None,
+    path_prefix: str | None = None,
+    stale_only: bool = False,
+):
+    """Yield each matching worktree, then the usage of the port range.
+
+    The usage covers every allocation in the registry, whatever the filters.
+    """
+    from .ports import range_usage
+
+    for name, path, allocation in iter_allocations(
+        data, project, path_prefix, stale_only
+    ):
+        item = {
+            "kind": "worktree",
+            "project": name,
+            "path": path,
+            "worktree": allocation.get("worktree"),
+            "ports": allocation.get("ports", {}),
+        }
+        if "block" in allocation:
+            item["block"] = allocation["block"]
+        yield item
+    usage = range_usage(tuple(port_range), get_all_allocated_ports(data))
+    yield {"kind": "range", **usage}
+
+
+def _target_projects(params: dict) -> list[str]:
+    return [target["config"]["name"] for target in params["targets"]]
+
+
+def _sync_projects(params: dict) -> list[str]:
+    released = [entry["project"] for entry in params["released"]]
+    return sorted(set(_target_projects(params) + released))
+
+
+def _named_project(params: dict) -> list[str]:
+    return [params["project"]]
+
+
+def _filtered_project(params: dict) -> list[str] | None:
+    project = params.get("project")
+    return [project] if project is not None else None
+
+
+# Registry operations shared by the CLI and the daemon: name -> (function,
+# whether it mutates the registry, projects it touches). Each takes the
+# registry data plus JSON-serializable parameters and returns a
+# JSON-serializable result. The last element maps the parameters to the
+# projects the operation needs, or is None when it needs every project.
+OPERATIONS = {
+    "init": (op_init, True, _target_projects),
+    "sync": (op_sync, True, _sync_projects),
+    "show": (op_show, False, _named_project),
+    "release": (op_release, True, _named_project),
+    "status": (op_status, False, _named_project),
+    "gc": (op_gc, True, None),
+    "who": (op_who, False, None),
+}
+
+# Read-only operations that yield their results one at a time: name ->
+# (generator function, projects it touches). The daemon sends each item as
+# it is produced, so neither side holds the whole result.
+STREAMS = {
+    "status_stream": (op_status_stream, _filtered_project),
+}
+
+
+def run_operation(name: str, **params):
+    """Run an operation through the daemon if one is running, else locally."""
+    with tracing.phase(f"{name}_operation"):
+        try:
+            return daemon_request(name, **params)
+        except DaemonUnavailable:
+            pass
+
+        fn, mutates, scope = OPERATIONS[name]
+        projects = scope(params) if scope is not None else None
+        if mutates:
+            with locked_registry(projects) as data:
+                return fn(data, **params)
+        with read_registry(projects) as data:
+            return fn(data, **params)
+
+
+def stream_operation(name: str, **params):
+    """Yield the items of a streamed operation, from the daemon or locally.
+
+    Without a daemon, the registry stays locked for reading until the
+    stream is exhausted or closed.
+    """
+    with tracing.phase(f"{name}_operation"):
+        try:
+            items = daemon_stream(name, **params)
+        except DaemonUnavailable:
+            fn, scope = STREAMS[name]
+            with read_registry(scope(params)) as data:
+                yield from fn(data, **params)
+            return
+        yield from items
@@ -0,0 +1,130 @@
+"""Files that hand a worktree's env vars to tools other than direnv.
+
+``[outputs]`` in ``.worktree-env.toml`` maps paths, relative to the
+worktree, to a format:
+
+    [outputs]
+    ".env" = { format = "dotenv" }
+    ".vscode/worktree-env.json" = { format = "json" }
+    "docker-compose.override.yml" = { format = "compose", services = ["web"] }
+    "worktree.env" = { format = "systemd" }
+
+The merged ports and env vars are computed once per worktree and each
+output only formats them. A file is rewritten only when its rendered
+content differs from what is on disk, so tools watching it don't reload
+for nothing.
+"""
+
+import json
+import re
+from pathlib import Path
+
+from .errors import InvalidConfigError
+from .fsutil import update_text
+
+FORMATS = ("dotenv", "json", "compose", "systemd")
+
+HEADER = "# Generated by worktree-env — do not edit manually"
+
+_SAFE_VALUE = re.compile(r"^[a-zA-Z0-9_./:-]+$")
+_YAML_KEY = re.compile(r"^[A-Za-z_][A-Za-z0-9_.-]*$")
+
+
+def check_outputs(config_path: Path, outputs: dict) -> None:
+    """Raise InvalidConfigError unless ``outputs`` is a valid [outputs] table."""
+    for path, options in outputs.items():
+        where = f"Output {path!r} in {config_path}"
+        if not isinstance(options, dict):
+            raise InvalidConfigError(f"{where} must be a table")
+        parts = Path(path).parts
+        if not parts or Path(path).is_absolute() or ".." in parts:
+            raise InvalidConfigError(f"{where} must be a path inside the worktree")
+        if parts == (".envrc",):
+            raise InvalidConfigError(f"{where} would overwrite the managed .envrc")
+        fmt = options.get("format")
+        if fmt not in FORMATS:
+            raise InvalidConfigError(
+                f"{where} has unknown format {fmt!r}. "
+                f"Expected one of: {', '.join(FORMATS)}"
+            )
+        services = options.get("services")
+        if fmt == "compose" and not (
+            isinstance(services, list)
+            and services
+            and all(isinstance(name, str) and name for name in services)
+        ):
+            raise InvalidConfigError(
+                f"{where} needs services, a list of compose service names"
+            )
+
+
+def render_output(fmt: str, env: dict[str, str], options: dict) -> str:
+    """Render the merged ``env`` of a worktree in format ``fmt``."""
+    items = sorted(env.items())
+    if fmt == "json":
+        return json.dumps(dict(items), indent=2) + "\n"
+
+    lines = [HEADER]
+    if fmt == "dotenv":
+        lines.extend(f"{key}={_dotenv_quote(value)}" for key, value in items)
+    elif fmt == "systemd":
+        lines.extend(f"{key}={_systemd_quote(value)}" for key, value in items)
+    elif fmt == "compose":
+        lines.append("services:")
+        for service in options["services"]:
+            lines.append(f"  {_yaml_key(service)}:")
+            lines.append("    environment:")
+            if not items:
+                lines[-1] += " {}"
+            for key, value in items:
+                # Compose interpolates $VAR in the file itself; $$ is a
+                # literal dollar sign.
+                quoted = json.dumps(value.replace("$", "$$"))
+                lines.append(f"      {_yaml_key(key)}: {quoted}")
+    else:
+        raise ValueError(f"unknown output format {fmt!r}")
+    lines.append("")
+    return "\n".join(lines)
+
+
+def render_outputs(
+    root: Path, outputs: dict[str, dict], env: dict[str, str]
+) -> list[tuple[Path, str]]:
+    """Render every output of the worktree at ``root`` from one merged ``env``.
+
+    Returns (path, content) pairs; the caller writes them with
+    ``write_output``, concurrently across outputs and worktrees.
+    """
+    return [
+        (root / path, render_output(options["format"], env, options))
+        for path, options in outputs.items()
+    ]
+
+
+def write_output(path: Path, content: str) -> bool:
+    """Write an output file only if its content changed. Returns True if written."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return update_text(path, content)
+
+
+def _dotenv_quote(value: str) -> str:
+    if _SAFE_VALUE.match(value):
+        return value
+    # Single quotes are literal in dotenv parsers: no escapes, no ${VAR}.
+    if "'" not in value and "\n" not in value:
+        return f"'{value}'"
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'"{escaped}"'
+
+
+def _systemd_quote(value: str) -> str:
+    if _SAFE_VALUE.match(value):
+        return value
+    escaped = value
+    for char in ("\\", '"', "`", "$"):
+        escaped = escaped.replace(char, "\\" + char)
+    return f'"{escaped}"'
+
+
+def _yaml_key(key: str) -> str:
+    return key if _YAML_KEY.match(key) else json.dumps(key)
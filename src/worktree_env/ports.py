@@ -1,30 +1,186 @@
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import Iterable
+
+from . import tracing
 from .errors import PortsExhaustedError
 
 
+class PortAllocator:
+    """Hands out the lowest free ports of a range, or ports near a preference.
+
+    Allocated ports are kept as a sorted list. For the port at index ``i``,
+    ``used[i] - start - i`` counts the free ports below it, which never
+    decreases along the list, so the lowest free port is found with a
+    binary search instead of a scan from the bottom of the range. Given a
+    preferred port, allocation probes upwards from it (open addressing with
+    linear probing) and wraps around to the lowest free port.
+    """
+
+    def __init__(self, port_range: tuple[int, int], used: Iterable[int] = ()):
+        self.start, self.end = port_range
+        ordered = sorted(used)
+        self._used = ordered[
+            bisect_left(ordered, self.start):bisect_right(ordered, self.end)
+        ]
+
+    def mark_used(self, port: int) -> None:
+        if self.start <= port <= self.end and self.is_free(port):
+            insort(self._used, port)
+
+    def is_free(self, port: int) -> bool:
+        if not self.start <= port <= self.end:
+            return False
+        i = bisect_left(self._used, port)
+        return i == len(self._used) or self._used[i] != port
+
+    def allocate(self, preferred: int | None = None) -> int:
+        port = self._take(preferred)
+        if port is None:
+            raise PortsExhaustedError(
+                f"No available ports in range {self.start}-{self.end}. "
+                "Run 'worktree-env gc' to prune stale entries or expand the range "
+                "in ~/.config/worktree-env/config.toml"
+            )
+        tracing.count("ports.allocated")
+        return port
+
+    def _take(self, preferred: int | None = None) -> int | None:
+        """Mark a free port as used and return it, if there is one."""
+        if preferred is not None and self.start <= preferred <= self.end:
+            port = self._take_from(preferred)
+            if port is not None:
+                return port
+        return self._take_lowest()
+
+    def _take_from(self, port: int) -> int | None:
+        """Take the first free port at or above ``port``."""
+        used = self._used
+        i = bisect_left(used, port)
+        probes = 1
+        while i < len(used) and used[i] == port:
+            port += 1
+            i += 1
+            probes += 1
+        tracing.count("ports.probed", probes)
+        if port > self.end:
+            return None
+        used.insert(i, port)
+        return port
+
+    def _take_lowest(self) -> int | None:
+        """Mark the lowest free port as used and return it, if there is one."""
+        used = self._used
+        lo, hi = 0, len(used)
+        probes = 0
+        while lo < hi:
+            probes += 1
+            mid = (lo + hi) // 2
+            if used[mid] - self.start > mid:
+                hi = mid
+            else:
+                lo = mid + 1
+        tracing.count("ports.probed", probes)
+        port = self.start + lo
+        if port > self.end:
+            return None
+        used.insert(lo, port)
+        return port
+
+
+class BlockAllocator:
+    """Hands out the lowest free aligned blocks of ``size`` ports.
+
+    Blocks start at multiples of ``size``, so their port numbers are easy to
+    predict. The range is cut into such slots, and a slot is taken when any
+    of its ports is in use. Ports in use are given as ``(first, last)``
+    runs, so a block held by another worktree is one slot rather than
+    ``size`` ports, and the lowest free slot is found with the same binary
+    search ``PortAllocator`` uses for ports.
+    """
+
+    def __init__(
+        self,
+        port_range: tuple[int, int],
+        size: int,
+        used: Iterable[tuple[int, int]] = (),
+    ):
+        self.start, self.end = port_range
+        self.size = size
+        slots = []
+        for first, last in used:
+            low, high = first // size, last // size
+            if low == high:
+                slots.append(low)
+            else:
+                slots.extend(range(low, high + 1))
+        slot_range = (-(-self.start // size), (self.end + 1) // size - 1)
+        self._slots = PortAllocator(slot_range, slots)
+
+    def mark_used(self, first: int, last: int) -> None:
+        for slot in range(first // self.size, last // self.size + 1):
+            self._slots.mark_used(slot)
+
+    def allocate(self, preferred: int | None = None) -> int:
+        """Reserve a free block and return its first port.
+
+        That is the lowest free block, or with ``preferred`` the first free
+        block starting at or above it, wrapping around to the lowest.
+        """
+        if preferred is not None:
+            preferred = -(-preferred // self.size)
+        slot = self._slots._take(preferred)
+        if slot is None:
+            raise PortsExhaustedError(
+                f"No free block of {self.size} ports in range "
+                f"{self.start}-{self.end}. Run 'worktree-env gc' to prune stale "
+                "entries or expand the range in ~/.config/worktree-env/config.toml"
+            )
+        tracing.count("ports.blocks_allocated")
+        return slot * self.size
+
+
+def range_usage(port_range: tuple[int, int], used: Iterable[int]) -> dict:
+    """Summarize how much of ``port_range`` is allocated and how it is spread.
+
+    ``used`` must not repeat ports. Free ports form ``free_runs`` runs of
+    consecutive ports. ``fragmentation`` is the share of free ports outside
+    the largest run: 0 when they are all in one run, close to 1 when they
+    are scattered between allocations.
+    """
+    start, end = port_range
+    size = end - start + 1
+    allocated = free_runs = largest_free_run = 0
+    next_free = start
+    for port in sorted(port for port in used if start <= port <= end):
+        if port > next_free:
+            free_runs += 1
+            largest_free_run = max(largest_free_run, port - next_free)
+        next_free = port + 1
+        allocated += 1
+    if next_free <= end:
+        free_runs += 1
+        largest_free_run = max(largest_free_run, end - next_free + 1)
+
+    free = size - allocated
+    return {
+        "range": [start, end],
+        "size": size,
+        "allocated": allocated,
+        "free": free,
+        "utilization": allocated / size,
+        "free_runs": free_runs,
+        "largest_free_run": largest_free_run,
+        "fragmentation": 1 - largest_free_run / free if free else 0.0,
+    }
+
+
 def allocate_ports(
     port_names: list[str],
     already_allocated: set[int],
     port_range: tuple[int, int],
 ) -> dict[str, int]:
-    used = set(already_allocated)
-    result = {}
-
-    range_start, range_end = port_range
-
-    for name in port_names:
-        port = _next_available(range_start, range_end, used)
-        result[name] = port
-        used.add(port)
-
-    return result
-
+    if not port_names:
+        return {}
 
-def _next_available(start: int, end: int, used: set[int]) -> int:
-    for port in range(start, end + 1):
-        if port not in used:
-            return port
-    raise PortsExhaustedError(
-        f"No available ports in range {start}-{end}. "
-        "Run 'worktree-env gc' to prune stale entries or expand the range "
-        "in ~/.config/worktree-env/config.toml"
-    )
+    allocator = PortAllocator(port_range, already_allocated)
+    return {name: allocator.allocate() for name in port_names}
@@ -1,10 +1,28 @@
 import fcntl
 import json
+import os
+import time
 from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
 
-from .config import config_dir
+from . import tracing
+from .config import config_dir, load_global_config
 from .errors import RegistryCorruptedError
+from .fsutil import RACY_SECONDS, atomic_write_text
+
+# Registries with at least this many allocations are written without
+# indentation; at that size nobody reads them by hand and the whitespace
+# makes up a large share of the file.
+COMPACT_THRESHOLD = 1000
+
+# Stat calls are slow on network home directories, so GC checks paths on a
+# thread pool once there are enough of them to be worth it.
+GC_PARALLEL_THRESHOLD = 16
+GC_WORKERS = 16
+
+# Paths checked at once when listing stale allocations.
+STALE_BATCH = 256
 
 
 def _registry_path() -> Path:
@@ -19,36 +37,393 @@ def _empty_registry() -> dict:
     return {"projects": {}}
 
 
-@contextmanager
-def locked_registry():
-    dir_path = config_dir()
-    dir_path.mkdir(parents=True, exist_ok=True)
+class JsonBackend:
+    """Stores the whole registry as a single JSON document.
 
-    lock_path = _lock_path()
-    lock_file = open(lock_path, "w")
-    try:
-        fcntl.flock(lock_file, fcntl.LOCK_EX)
-
-        reg_path = _registry_path()
-        if reg_path.exists():
-            try:
-                data = json.loads(reg_path.read_text())
-            except (json.JSONDecodeError, ValueError) as e:
-                raise RegistryCorruptedError(
-                    f"Registry file is corrupted: {e}. "
-                    f"Back up and delete {reg_path} to reset."
-                )
-        else:
+    GC verification times live in ``verified.json`` next to it, so a GC
+    sweep that only re-stamps entries leaves the registry file alone.
+    """
+
+    def __init__(self, dir_path: Path, readonly: bool = False):
+        self.path = dir_path / "registry.json"
+        self.verified_path = dir_path / "verified.json"
+        self.readonly = readonly
+        self._digest: bytes | None = None
+        self._verified_text: str | None = None
+
+    def load(self) -> dict:
+        if not self.path.exists():
             data = _empty_registry()
+        else:
+            with tracing.phase("registry_load"):
+                text = self.path.read_text()
+                tracing.count("registry.bytes_read", len(text))
+                try:
+                    data = json.loads(text)
+                except (json.JSONDecodeError, ValueError) as e:
+                    raise RegistryCorruptedError(
+                        f"Registry file is corrupted: {e}. "
+                        f"Back up and delete {self.path} to reset."
+                    )
+            if not self.readonly:
+                self._digest = _digest(text)
+        if not self.readonly:
+            # Readers never run GC, so they skip the verification times.
+            self._verified_text, verified = _read_verified(self.verified_path)
+            if verified:
+                data["verified"] = verified
+        return data
 
-        yield data
+    def save(self, data: dict) -> None:
+        if self.readonly:
+            return
+        with tracing.phase("registry_save"):
+            text = _encode(data)
+            digest = _digest(text)
+            if digest != self._digest:
+                atomic_write_text(self.path, text)
+                tracing.count("registry.bytes_written", len(text))
+                self._digest = digest
+            self._verified_text = _write_verified(
+                self.verified_path, data.get("verified", {}), self._verified_text
+            )
+
+    def close(self) -> None:
+        pass
+
+
+def _encode(data: dict) -> str:
+    """Serialize the registry, dropping indentation once it gets large."""
+    data = {
+        key: value
+        for key, value in data.items()
+        if key not in ("verified", "port_index")
+    }
+    entries = sum(len(e) for e in data.get("projects", {}).values())
+    if entries >= COMPACT_THRESHOLD:
+        return json.dumps(data, separators=(",", ":")) + "\n"
+    return json.dumps(data, indent=2) + "\n"
+
+
+def _read_verified(path: Path) -> tuple[str | None, dict]:
+    """Return the text and content of a file of GC verification times.
+
+    The times only let GC skip recent checks, so a missing or unreadable
+    file just means every path is checked again.
+    """
+    try:
+        text = path.read_text()
+        verified = json.loads(text)
+    except (OSError, ValueError):
+        return None, {}
+    return text, verified if isinstance(verified, dict) else {}
+
+
+def _write_verified(path: Path, verified: dict, previous: str | None) -> str | None:
+    """Write GC verification times unless unchanged; return the new text."""
+    if not verified:
+        if previous is not None:
+            path.unlink(missing_ok=True)
+        return None
+    text = json.dumps(verified, separators=(",", ":")) + "\n"
+    if text != previous:
+        atomic_write_text(path, text)
+        tracing.count("registry.verified_bytes_written", len(text))
+    return text
+
+
+def _digest(text: str) -> bytes:
+    import hashlib
+
+    return hashlib.sha1(text.encode()).digest()
+
+
+class OtherPorts:
+    """Ports of the projects a scoped backend did not load, read lazily.
+
+    Stored as ``other_ports`` in the loaded data. ``read`` returns them as
+    ``(first, last)`` runs, one per block or loose port, and runs the first
+    time they are needed, so commands that allocate nothing never pay for
+    it. Iterating yields every port of every run.
+    """
+
+    def __init__(self, read):
+        self._read = read
+        self._runs: list[tuple[int, int]] | None = None
+
+    def runs(self) -> list[tuple[int, int]]:
+        if self._runs is None:
+            self._runs = self._read()
+        return self._runs
+
+    def __iter__(self):
+        for first, last in self.runs():
+            yield from range(first, last + 1)
+
+
+def narrow_projects(data: dict, projects: list[str]) -> dict:
+    """Keep only ``projects`` in ``data``, with the others' ports as ``other_ports``.
+
+    For scoped backends that had to read every project anyway, so readers
+    and writers alike still see the whole port range in use.
+    """
+    everything = data.get("projects", {})
+    scope = set(projects)
+    others = [entries for name, entries in everything.items() if name not in scope]
+    data["projects"] = {
+        name: everything[name] for name in projects if name in everything
+    }
+    data["other_ports"] = OtherPorts(
+        lambda: [
+            run
+            for entries in others
+            for allocation in entries.values()
+            for run in allocation_runs(allocation)
+        ]
+    )
+    return data
 
-        reg_path.write_text(json.dumps(data, indent=2) + "\n")
+
+class PortIndex:
+    """Which allocation holds each port, built on first use.
+
+    Stored as ``port_index`` in data that stays loaded for a long time, such
+    as the daemon's. ``owners`` maps each port to the ``(project, path,
+    name)`` holding it, with ``name`` None for the ports of a block that no
+    port name uses. It is built from the allocations the first time it is
+    used; after that set_allocation, remove_allocation and GC keep it up to
+    date, so listing the ports in use or finding the owner of one no longer
+    walks every allocation.
+    """
+
+    def __init__(self, projects: dict):
+        self._projects = projects
+        self._owners: dict[int, tuple] | None = None
+
+    @property
+    def owners(self) -> dict[int, tuple]:
+        if self._owners is None:
+            self.rebuild()
+        return self._owners
+
+    def rebuild(self) -> None:
+        tracing.count("registry.port_index_builds")
+        self._owners = build_port_owners(self._projects)
+
+    # Until the index is built there is nothing to update: it will be built
+    # from the allocations as they are then.
+
+    def add(self, project: str, path: str, allocation: dict) -> None:
+        if self._owners is not None:
+            _add_owners(self._owners, project, path, allocation)
+
+    def discard(self, project: str, path: str, allocation: dict) -> None:
+        owners = self._owners
+        if owners is None:
+            return
+        ports = allocation_ports(allocation)
+        ports.extend(allocation.get("ports", {}).values())
+        for port in ports:
+            owner = owners.get(port)
+            if owner is not None and owner[:2] == (project, path):
+                del owners[port]
+
+
+def _add_owners(owners: dict, project: str, path: str, allocation: dict) -> None:
+    block = allocation.get("block")
+    if block:
+        for port in range(block["start"], block["start"] + block["size"]):
+            owners[port] = (project, path, None)
+    for name, port in allocation.get("ports", {}).items():
+        owners[port] = (project, path, name)
+
+
+def build_port_owners(projects: dict) -> dict[int, tuple]:
+    """Map every port to the ``(project, path, name)`` holding it."""
+    owners = {}
+    for project, entries in projects.items():
+        for path, allocation in entries.items():
+            _add_owners(owners, project, path, allocation)
+    return owners
+
+
+def _open_backend(
+    dir_path: Path,
+    name: str,
+    readonly: bool = False,
+    projects: list[str] | None = None,
+    held: bool = False,
+):
+    if name == "sqlite":
+        from .registry_sqlite import SqliteBackend
+
+        return SqliteBackend(dir_path, readonly=readonly, projects=projects)
+    if name == "sharded":
+        from .registry_sharded import ShardedBackend
+
+        return ShardedBackend(dir_path, readonly=readonly, projects=projects)
+    if name == "packed":
+        from .registry_packed import PackedBackend
+
+        return PackedBackend(dir_path, readonly=readonly, projects=projects)
+    if name == "journal":
+        from .registry_journal import JournalBackend
+
+        return JournalBackend(
+            dir_path,
+            readonly=readonly,
+            projects=projects,
+            compact_in_background=not held,
+        )
+    return JsonBackend(dir_path, readonly=readonly)
+
+
+def registry_generation(project: str) -> list | None:
+    """A token that changes whenever ``project``'s allocations may change.
+
+    Made of the inode, mtime and size of each file the configured backend
+    stores the project in, so it costs a few stat calls and no lock; GC
+    verification times are left out. Returns None while one of the files
+    was modified too recently for its mtime to tell a later write apart,
+    so that nothing is cached against it yet.
+    """
+    name = load_global_config().registry_backend
+    now = time.time()
+    token = [name]
+    for path in _data_files(config_dir(), name, project):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            token.append(None)
+            continue
+        if now - st.st_mtime < RACY_SECONDS:
+            return None
+        token.append([st.st_ino, st.st_mtime_ns, st.st_size])
+    return token
+
+
+def registry_files(project: str) -> list[Path]:
+    """The files ``registry_generation`` stats for ``project``, in order."""
+    name = load_global_config().registry_backend
+    return _data_files(config_dir(), name, project)
+
+
+def _data_files(dir_path: Path, name: str, project: str) -> list[Path]:
+    """Files the backend writes when ``project``'s allocations change.
+
+    Each backend but JSON may still be reading an unmigrated registry.json.
+    """
+    legacy = dir_path / "registry.json"
+    if name == "sqlite":
+        return [dir_path / "registry.db", dir_path / "registry.db-wal", legacy]
+    if name == "sharded":
+        from .registry_sharded import _shard_stem
+
+        return [dir_path / "projects" / f"{_shard_stem(project)}.json", legacy]
+    if name == "journal":
+        return [dir_path / "snapshot.json", dir_path / "journal.jsonl", legacy]
+    if name == "packed":
+        return [dir_path / "registry.pack", legacy]
+    return [legacy]
+
+
+@contextmanager
+def file_lock(path: Path, operation: int):
+    lock_file = open(path, "a")
+    try:
+        with tracing.phase("lock_wait"):
+            fcntl.flock(lock_file, operation)
+        yield
     finally:
         fcntl.flock(lock_file, fcntl.LOCK_UN)
         lock_file.close()
 
 
+def _registry_lock(operation: int):
+    return file_lock(_lock_path(), operation)
+
+
+@contextmanager
+def _opened_backend(readonly: bool, projects: list[str] | None, held: bool = False):
+    """Open the configured backend under the registry lock.
+
+    The sqlite, sharded, journal and packed backends can be scoped to
+    ``projects`` and then load only those. The sharded backend also takes
+    the registry lock shared and locks the project shards itself, so
+    commands working on different projects don't wait on each other. Every
+    other case takes the registry lock exclusively for writers and shared
+    for readers.
+    ``held`` marks a backend kept open for the owner's whole lifetime.
+    """
+    dir_path = config_dir()
+    name = load_global_config().registry_backend
+    if name == "sharded" and (dir_path / "registry.json").exists():
+        from .registry_sharded import migrate_legacy_registry
+
+        with _registry_lock(fcntl.LOCK_EX):
+            migrate_legacy_registry(dir_path)
+
+    shared = readonly or (projects is not None and name == "sharded")
+    with _registry_lock(fcntl.LOCK_SH if shared else fcntl.LOCK_EX):
+        backend = _open_backend(
+            dir_path, name, readonly=readonly, projects=projects, held=held
+        )
+        try:
+            yield backend
+        finally:
+            backend.close()
+
+
+@contextmanager
+def locked_registry(projects: list[str] | None = None):
+    """Yield the registry for modification under an exclusive lock.
+
+    The registry is written back on exit, but only if its content changed.
+    With the sqlite, sharded, journal and packed backends, passing
+    ``projects`` loads only those projects, and the ports of all others are
+    available lazily as ``other_ports``; the JSON backend always loads
+    everything.
+    """
+    config_dir().mkdir(parents=True, exist_ok=True)
+
+    with _opened_backend(False, projects) as backend:
+        data = backend.load()
+        yield data
+        backend.save(data)
+
+
+@contextmanager
+def read_registry(projects: list[str] | None = None):
+    """Yield a read-only view of the registry under a shared lock.
+
+    Readers do not block each other and never write anything back, so
+    changes made to the yielded data are discarded. ``projects`` narrows
+    what is loaded, as for ``locked_registry``.
+    """
+    if not config_dir().exists():
+        yield _empty_registry()
+        return
+
+    with _opened_backend(True, projects) as backend:
+        yield backend.load()
+
+
+@contextmanager
+def held_registry():
+    """Hold the registry exclusively for a long-lived owner such as the daemon.
+
+    Yields the loaded data and a function that persists it. Nothing is saved
+    implicitly; the owner decides when to flush. The data carries a
+    ``port_index``, which pays off over many operations.
+    """
+    config_dir().mkdir(parents=True, exist_ok=True)
+
+    with _opened_backend(False, None, held=True) as backend:
+        data = backend.load()
+        data["port_index"] = PortIndex(data.setdefault("projects", {}))
+        yield data, lambda: backend.save(data)
+
+
 def get_allocation(
     data: dict, project: str, path: str
 ) -> dict | None:
@@ -63,8 +438,19 @@ def set_allocation(
     path: str,
     allocation: dict,
 ) -> None:
+    """Store ``allocation``, replacing any earlier one for the same path.
+
+    Allocations are replaced rather than changed in place, so that the
+    ``port_index`` can drop the ports of the one being replaced.
+    """
     projects = data.setdefault("projects", {})
     project_entries = projects.setdefault(project, {})
+    index = data.get("port_index")
+    if index is not None:
+        previous = project_entries.get(path)
+        if previous is not None:
+            index.discard(project, path, previous)
+        index.add(project, path, allocation)
     project_entries[path] = allocation
 
 
@@ -72,31 +458,229 @@ def remove_allocation(data: dict, project: str, path: str) -> bool:
     projects = data.get("projects", {})
     project_data = projects.get(project, {})
     if path in project_data:
-        del project_data[path]
+        allocation = project_data.pop(path)
         if not project_data:
             del projects[project]
+        _forget_allocation(data, project, path, allocation)
         return True
     return False
 
 
+def restore_project(data: dict, project: str, entries: dict | None) -> None:
+    """Put back a project's entries as copied earlier, or drop it if None."""
+    projects = data.setdefault("projects", {})
+    index = data.get("port_index")
+    if index is not None:
+        for path, allocation in projects.get(project, {}).items():
+            index.discard(project, path, allocation)
+        for path, allocation in (entries or {}).items():
+            index.add(project, path, allocation)
+    if entries is None:
+        projects.pop(project, None)
+    else:
+        projects[project] = entries
+
+
+def _forget_allocation(data: dict, project: str, path: str, allocation: dict) -> None:
+    index = data.get("port_index")
+    if index is not None:
+        index.discard(project, path, allocation)
+    _forget_verified(data.get("verified", {}), project, path)
+
+
+def _forget_verified(verified: dict, project: str, path: str) -> None:
+    stamps = verified.get(project)
+    if stamps is not None:
+        stamps.pop(path, None)
+        if not stamps:
+            del verified[project]
+
+
+def allocation_ports(allocation: dict) -> list[int]:
+    """Ports an allocation holds: all of its block, or its named ports."""
+    block = allocation.get("block")
+    if block:
+        return list(range(block["start"], block["start"] + block["size"]))
+    return list(allocation.get("ports", {}).values())
+
+
 def get_all_allocated_ports(data: dict) -> set[int]:
-    ports = set()
+    """Ports in use, including ``other_ports`` of projects that were not loaded."""
+    ports = set(data.get("other_ports", ()))
+    index = data.get("port_index")
+    if index is not None:
+        ports.update(index.owners)
+        return ports
     for project_entries in data.get("projects", {}).values():
         for allocation in project_entries.values():
-            for port in allocation.get("ports", {}).values():
-                ports.add(port)
+            ports.update(allocation_ports(allocation))
     return ports
 
 
-def gc_stale_entries(data: dict) -> list[str]:
-    removed = []
+def allocation_runs(allocation: dict) -> list[tuple[int, int]]:
+    """Ports an allocation holds as ``(first, last)`` runs.
+
+    The named ports of an allocation with a block all lie inside it, so
+    the block alone covers them.
+    """
+    block = allocation.get("block")
+    if block:
+        return [(block["start"], block["start"] + block["size"] - 1)]
+    return [(port, port) for port in allocation.get("ports", {}).values()]
+
+
+def get_allocated_runs(
+    data: dict, skip: set[tuple[str, str]] = frozenset()
+) -> list[tuple[int, int]]:
+    """Ports in use as ``(first, last)`` runs, one per block or loose port.
+
+    Allocations keyed ``(project, path)`` in ``skip`` are left out.
+    ``other_ports`` contributes its runs as the backend read them.
+    """
+    other = data.get("other_ports")
+    runs = list(other.runs()) if other is not None else []
+    for project, project_entries in data.get("projects", {}).items():
+        for path, allocation in project_entries.items():
+            if (project, path) not in skip:
+                runs += allocation_runs(allocation)
+    return runs
+
+
+def find_port_owner(data: dict, port: int) -> dict | None:
+    """Return the project, path, worktree and port name holding ``port``.
+
+    ``name`` is None for a port reserved by a block but not named. Looks the
+    port up in the ``port_index`` when the data has one, and rebuilds the
+    index if the allocation it names no longer holds the port.
+    """
+    index = data.get("port_index")
+    if index is None:
+        owner = build_port_owners(data.get("projects", {})).get(port)
+    else:
+        owner = index.owners.get(port)
+        if owner is not None and not _holds(data, owner, port):
+            index.rebuild()
+            owner = index.owners.get(port)
+    if owner is None:
+        return None
+    project, path, name = owner
+    return {
+        "project": project,
+        "path": path,
+        "worktree": get_allocation(data, project, path).get("worktree"),
+        "name": name,
+    }
+
+
+def _holds(data: dict, owner: tuple, port: int) -> bool:
+    project, path, name = owner
+    allocation = get_allocation(data, project, path)
+    if allocation is None:
+        return False
+    if name is None:
+        return port in allocation_ports(allocation)
+    return allocation.get("ports", {}).get(name) == port
+
+
+def iter_allocations(
+    data: dict,
+    project: str | None = None,
+    path_prefix: str | None = None,
+    stale_only: bool = False,
+):
+    """Yield ``(project, path, allocation)`` for the matching allocations.
+
+    Allocations come in registry order, one at a time, without sorting or
+    copying them. Each project's entries are listed when the project is
+    reached, so the registry may change between items, as it does while the
+    daemon sends them. ``path_prefix`` keeps the paths at or below it. With
+    ``stale_only``, only allocations whose path no longer exists are
+    yielded; paths are checked a batch at a time.
+    """
     projects = data.get("projects", {})
-    for project_name in list(projects.keys()):
+    names = list(projects) if project is None else [project]
+    under = None if path_prefix is None else path_prefix.rstrip(os.sep) + os.sep
+    for name in names:
+        entries = iter(list(projects.get(name, {}).items()))
+        if under is not None:
+            entries = (
+                (path, allocation)
+                for path, allocation in entries
+                if path == path_prefix or path.startswith(under)
+            )
+        if not stale_only:
+            for path, allocation in entries:
+                yield name, path, allocation
+            continue
+        while batch := list(islice(entries, STALE_BATCH)):
+            checked = _paths_exist([(name, path) for path, _ in batch])
+            for (path, allocation), exists in zip(batch, checked):
+                if not exists:
+                    yield name, path, allocation
+
+
+def gc_stale_entries(data: dict, max_age: float | None = None) -> list[str]:
+    """Remove allocations whose worktree path no longer exists.
+
+    Paths are checked concurrently. The time each surviving entry was
+    checked goes into ``data["verified"]`` (project -> path -> time), kept
+    apart from the allocations so that re-stamping them does not count as
+    a change to any allocation. When ``max_age`` is given, entries verified
+    less than ``max_age`` seconds ago are not checked again.
+    """
+    with tracing.phase("gc"):
+        return _gc_stale_entries(data, max_age)
+
+
+def _gc_stale_entries(data: dict, max_age: float | None) -> list[str]:
+    now = int(time.time())
+    projects = data.get("projects", {})
+    verified = data.setdefault("verified", {})
+    due = [
+        (project_name, path)
+        for project_name, entries in projects.items()
+        for path, allocation in entries.items()
+        if max_age is None
+        or not _verified_within(
+            verified.get(project_name, {}).get(path), allocation, now, max_age
+        )
+    ]
+
+    tracing.count("gc.paths_checked", len(due))
+    removed = []
+    for (project_name, path), exists in zip(due, _paths_exist(due)):
         entries = projects[project_name]
-        for path in list(entries.keys()):
-            if not Path(path).exists():
-                del entries[path]
-                removed.append(f"{project_name}: {path}")
-        if not entries:
-            del projects[project_name]
+        if exists:
+            verified.setdefault(project_name, {})[path] = now
+            # Registries written before the times moved out of the
+            # allocations carry them inline; drop them on the first sweep.
+            entries[path].pop("verified_at", None)
+        else:
+            _forget_allocation(data, project_name, path, entries.pop(path))
+            removed.append(f"{project_name}: {path}")
+
+    for project_name in [name for name, entries in projects.items() if not entries]:
+        del projects[project_name]
+    tracing.count("gc.removed", len(removed))
     return removed
+
+
+def _verified_within(
+    verified_at: float | None, allocation: dict, now: int, max_age: float
+) -> bool:
+    if verified_at is None:
+        verified_at = allocation.get("verified_at")
+    if not isinstance(verified_at, (int, float)):
+        return False
+    return 0 <= now - verified_at < max_age
+
+
+def _paths_exist(entries: list[tuple[str, str]]) -> list[bool]:
+    paths = [path for _, path in entries]
+    if len(paths) < GC_PARALLEL_THRESHOLD:
+        return [os.path.exists(path) for path in paths]
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=GC_WORKERS) as pool:
+        return list(pool.map(os.path.exists, paths))
@@ -0,0 +1,409 @@
+import copy
+import fcntl
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+from . import tracing
+from .errors import RegistryCorruptedError
+from .fsutil import _fsync_dir, atomic_write_text
+from .registry import _read_verified, _write_verified, narrow_projects
+
+SNAPSHOT_VERSION = 1
+
+# The journal is folded into a new snapshot once it is larger than the
+# snapshot itself (and at least this big), so replaying it never costs more
+# than reading the snapshot twice, and compaction work stays proportional to
+# the writes that triggered it.
+COMPACT_MIN_BYTES = 64 * 1024
+
+# How long a background compactor waits for the registry lock before giving
+# up; the next write over the threshold starts another one.
+COMPACT_LOCK_TIMEOUT = 10.0
+COMPACT_LOCK_POLL = 0.05
+
+
+class JournalBackend:
+    """Stores the registry as a snapshot plus an append-only journal.
+
+    ``snapshot.json`` holds the projects as of the last compaction and
+    ``journal.jsonl`` one record per allocation set or removed since then.
+    ``save`` appends records for the allocations that changed since
+    ``load`` with a single fsynced write, so its cost follows the size of
+    the change rather than the size of the registry. Scoped to
+    ``projects``, the backend still replays everything but hands out only
+    those projects, with the ports of the others as ``other_ports``.
+    Replaying a record twice has no effect, which is what makes a crash
+    between writing a new snapshot and truncating the journal harmless.
+
+    Once the journal outgrows the snapshot, a detached
+    ``python -m worktree_env.registry_journal`` folds it into a new
+    snapshot once the registry lock is free. A backend held for a whole
+    process lifetime (the daemon) never frees the lock, so it compacts
+    inline instead. GC verification times live in ``verified.json``, as
+    for the JSON backend.
+    """
+
+    def __init__(
+        self,
+        dir_path: Path,
+        readonly: bool = False,
+        projects: list[str] | None = None,
+        compact_in_background: bool = True,
+    ):
+        self.dir_path = dir_path
+        self.snapshot_path = dir_path / "snapshot.json"
+        self.journal_path = dir_path / "journal.jsonl"
+        self.verified_path = dir_path / "verified.json"
+        self.readonly = readonly
+        self.projects = projects
+        self.compact_in_background = compact_in_background
+        # Projects as last loaded or saved, parsed separately from the data
+        # handed out so that ``save`` can diff against them.
+        self._saved: dict[str, dict] = {}
+        self._verified_text: str | None = None
+        self._snapshot_size = 0
+        # End of the last complete journal record; anything after it is a
+        # torn write and is cut off before the next append.
+        self._journal_end = 0
+        if not readonly and not self.snapshot_path.exists():
+            _create_snapshot(dir_path)
+
+    def load(self) -> dict:
+        if self.readonly:
+            return self._load_readonly()
+
+        with tracing.phase("registry_load"):
+            raw, _ = _read_snapshot(self.snapshot_path)
+            _, records = _read_journal(self.journal_path, None, 0)
+            projects = _parse_snapshot(raw, self.snapshot_path)
+            count = _replay(projects, records, self.journal_path)
+        tracing.count("registry.journal_records_replayed", count)
+        self._snapshot_size = len(raw)
+        self._journal_end = len(records)
+
+        data = {"projects": projects}
+        if self.projects is not None:
+            narrow_projects(data, self.projects)
+        # A copy of what was handed out, for save to diff against. Comparing
+        # dicts runs in C, unlike fingerprinting every allocation.
+        self._saved = json.loads(json.dumps(data["projects"]))
+        self._verified_text, verified = _read_verified(self.verified_path)
+        if verified:
+            data["verified"] = verified
+        return data
+
+    def _load_readonly(self) -> dict:
+        if not self.snapshot_path.exists():
+            # Nothing was written through the journal yet; the registry may
+            # still be an unmigrated registry.json.
+            from .registry import JsonBackend
+
+            data = JsonBackend(self.dir_path, readonly=True).load()
+            projects = data.get("projects", {})
+        else:
+            with tracing.phase("registry_load"):
+                projects = _cached_state(self.snapshot_path, self.journal_path)
+        data = {"projects": projects}
+        if self.projects is not None:
+            narrow_projects(data, self.projects)
+        # The cached state outlives this call, so callers get their own copy.
+        data["projects"] = copy.deepcopy(data["projects"])
+        return data
+
+    def save(self, data: dict) -> None:
+        if self.readonly:
+            return
+        records = _diff(self._saved, data.get("projects", {}))
+        with tracing.phase("registry_save"):
+            if records:
+                payload = self._append(records)
+                # Re-parsing what was written keeps the saved copy
+                # independent of the caller's dicts.
+                _replay(self._saved, payload, self.journal_path)
+            self._verified_text = _write_verified(
+                self.verified_path, data.get("verified", {}), self._verified_text
+            )
+        if self._journal_end > max(COMPACT_MIN_BYTES, self._snapshot_size):
+            # A scoped backend only has part of the registry to compact.
+            if self.compact_in_background or self.projects is not None:
+                _spawn_compactor(self.dir_path)
+            else:
+                self.compact(data)
+
+    def _append(self, records: list[dict]) -> bytes:
+        payload = "".join(
+            json.dumps(record, separators=(",", ":")) + "\n" for record in records
+        ).encode()
+        fd = os.open(self.journal_path, os.O_WRONLY | os.O_CREAT, 0o666)
+        try:
+            if os.fstat(fd).st_size != self._journal_end:
+                os.ftruncate(fd, self._journal_end)
+            os.lseek(fd, self._journal_end, os.SEEK_SET)
+            os.write(fd, payload)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        if self._journal_end == 0:
+            _fsync_dir(self.dir_path)
+        self._journal_end += len(payload)
+        tracing.count("registry.journal_records", len(records))
+        tracing.count("registry.bytes_written", len(payload))
+        return payload
+
+    def compact(self, data: dict) -> None:
+        """Write ``data`` as the new snapshot and empty the journal.
+
+        ``data`` must be the full registry as saved by an unscoped backend,
+        with the registry lock held exclusively.
+        """
+        with tracing.phase("registry_compact"):
+            self._snapshot_size = _write_snapshot(
+                self.snapshot_path, self.journal_path, data.get("projects", {})
+            )
+        self._journal_end = 0
+
+    def close(self) -> None:
+        pass
+
+
+class _State:
+    """Projects rebuilt from the snapshot and the journal up to ``offset``."""
+
+    def __init__(self, snapshot_path: Path, journal_path: Path):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.projects: dict[str, dict] = {}
+        self.snapshot_key: tuple | None = None
+        self.journal_ino: int | None = None
+        self.offset = 0
+
+    def read(self) -> None:
+        raw, self.snapshot_key = _read_snapshot(self.snapshot_path)
+        self.projects = _parse_snapshot(raw, self.snapshot_path)
+        self.journal_ino = None
+        self.offset = 0
+        self.replay()
+
+    def replay(self) -> None:
+        """Apply the journal records written since the last read."""
+        ino, tail = _read_journal(self.journal_path, self.journal_ino, self.offset)
+        if ino != self.journal_ino:
+            self.journal_ino, self.offset = ino, 0
+        count = _replay(self.projects, tail, self.journal_path)
+        tracing.count("registry.journal_records_replayed", count)
+        self.offset += len(tail)
+
+    def snapshot_changed(self) -> bool:
+        try:
+            st = os.stat(self.snapshot_path)
+        except FileNotFoundError:
+            return self.snapshot_key is not None
+        return (st.st_ino, st.st_mtime_ns, st.st_size) != self.snapshot_key
+
+
+def _read_snapshot(path: Path) -> tuple[bytes, tuple | None]:
+    """Return the snapshot's content and a key that changes with the file."""
+    try:
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            raw = f.read()
+    except FileNotFoundError:
+        return b"", None
+    tracing.count("registry.bytes_read", len(raw))
+    return raw, (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _parse_snapshot(raw: bytes, path: Path) -> dict:
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)["projects"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise RegistryCorruptedError(
+            f"Registry snapshot is corrupted: {e}. "
+            f"Back up and delete {path} to reset."
+        )
+
+
+def _read_journal(
+    path: Path, ino: int | None, offset: int
+) -> tuple[int | None, bytes]:
+    """Return the journal's inode and its complete records past ``offset``.
+
+    ``offset`` only applies while the inode is still ``ino``. A torn final
+    record has no newline yet and is left out.
+    """
+    try:
+        with open(path, "rb") as f:
+            current = os.fstat(f.fileno()).st_ino
+            f.seek(offset if current == ino else 0)
+            tail = f.read()
+    except FileNotFoundError:
+        return None, b""
+    tracing.count("registry.journal_bytes_read", len(tail))
+    return current, tail[: tail.rfind(b"\n") + 1]
+
+
+def _replay(projects: dict, records: bytes, path: Path) -> int:
+    """Apply journal lines to ``projects``; return how many there were."""
+    count = 0
+    for line in records.splitlines():
+        try:
+            _apply(projects, json.loads(line))
+        except (ValueError, KeyError, TypeError) as e:
+            raise RegistryCorruptedError(
+                f"Registry journal is corrupted: {e}. "
+                f"Back up and delete {path} to reset."
+            )
+        count += 1
+    return count
+
+
+def _apply(projects: dict, record: dict) -> None:
+    project, path = record["project"], record["path"]
+    if record["op"] == "set":
+        projects.setdefault(project, {})[path] = record["allocation"]
+    elif record["op"] == "remove":
+        entries = projects.get(project, {})
+        entries.pop(path, None)
+        if not entries:
+            projects.pop(project, None)
+    else:
+        raise ValueError(f"unknown record {record['op']!r}")
+
+
+# Read-only state per snapshot path, kept for the life of the process. A
+# long-running reader (``watch``) re-reads the snapshot only after a
+# compaction replaced it, and otherwise just the new journal records.
+_cache: dict[Path, _State] = {}
+
+
+def _cached_state(snapshot_path: Path, journal_path: Path) -> dict:
+    state = _cache.get(snapshot_path)
+    if state is None or state.snapshot_changed():
+        state = _cache[snapshot_path] = _State(snapshot_path, journal_path)
+        state.read()
+        tracing.count("registry.snapshot_cache_misses")
+    else:
+        state.replay()
+        tracing.count("registry.snapshot_cache_hits")
+    return state.projects
+
+
+def _diff(saved: dict, projects: dict) -> list[dict]:
+    """Return the records that turn ``saved`` into ``projects``."""
+    records = []
+    for project, entries in projects.items():
+        before = saved.get(project, {})
+        if entries == before:
+            continue
+        for path, allocation in entries.items():
+            if before.get(path) != allocation:
+                records.append(
+                    {
+                        "op": "set",
+                        "project": project,
+                        "path": path,
+                        "allocation": allocation,
+                    }
+                )
+        records += [
+            {"op": "remove", "project": project, "path": path}
+            for path in before
+            if path not in entries
+        ]
+    for project, before in saved.items():
+        if project not in projects:
+            records += [
+                {"op": "remove", "project": project, "path": path} for path in before
+            ]
+    return records
+
+
+def _write_snapshot(snapshot_path: Path, journal_path: Path, projects: dict) -> int:
+    """Replace the snapshot with ``projects`` and empty the journal.
+
+    Returns the size of the new snapshot.
+    """
+    payload = {"version": SNAPSHOT_VERSION, "projects": projects}
+    text = json.dumps(payload, separators=(",", ":")) + "\n"
+    atomic_write_text(snapshot_path, text)
+    # A crash here replays the journal onto a snapshot that already
+    # contains it, which changes nothing.
+    if journal_path.exists():
+        os.truncate(journal_path, 0)
+    return len(text)
+
+
+def _create_snapshot(dir_path: Path) -> None:
+    """Write the first snapshot, from registry.json if there is one.
+
+    The caller holds the registry lock exclusively. The JSON file is
+    renamed afterwards so it is never imported twice.
+    """
+    from .registry import JsonBackend
+
+    json_path = dir_path / "registry.json"
+    projects = JsonBackend(dir_path, readonly=True).load().get("projects", {})
+    _write_snapshot(dir_path / "snapshot.json", dir_path / "journal.jsonl", projects)
+    if json_path.exists():
+        json_path.rename(json_path.with_suffix(".json.migrated"))
+
+
+def _spawn_compactor(dir_path: Path) -> None:
+    """Start a detached process that compacts once the registry is free."""
+    if _compaction_pending(dir_path):
+        return
+    import subprocess
+
+    subprocess.Popen(
+        [sys.executable, "-m", "worktree_env.registry_journal", str(dir_path)],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    tracing.count("registry.compactions_started")
+
+
+def _compaction_pending(dir_path: Path) -> bool:
+    with open(dir_path / "compact.lock", "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(f, fcntl.LOCK_UN)
+    return False
+
+
+def compact_when_idle(dir_path: Path, timeout: float = COMPACT_LOCK_TIMEOUT) -> bool:
+    """Compact the journal in ``dir_path`` once the registry lock is free.
+
+    Returns False if another compactor is running or the lock stayed busy
+    for ``timeout`` seconds.
+    """
+    with open(dir_path / "compact.lock", "a") as compact_lock:
+        try:
+            fcntl.flock(compact_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        with open(dir_path / "registry.lock", "a") as registry_lock:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    fcntl.flock(registry_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        return False
+                    time.sleep(COMPACT_LOCK_POLL)
+            backend = JournalBackend(dir_path)
+            backend.compact(backend.load())
+    return True
+
+
+if __name__ == "__main__":
+    compact_when_idle(Path(sys.argv[1]))
@@ -0,0 +1,349 @@
+"""A registry file that can be read one project at a time.
+
+``registry.pack`` is laid out as:
+
+    header   magic, format version, number of projects
+    table    per project, sorted by name: section offset, number of runs,
+             body length, name offset, name length (fixed size)
+    names    the project names, UTF-8
+    sections per project: the ports it holds as runs of consecutive ports,
+             each a pair of little-endian u32s (first, last), one per
+             block or loose port, sorted and unique; then its allocations
+             as compact JSON
+
+Readers map the file and binary-search the table, so loading one project
+decodes a few table entries and that project's section, whatever the size
+of the registry. The ports of the other projects are read straight from
+their sections without decoding any JSON. Sections keep JSON bodies so
+that decoding a project runs in the C JSON parser and any allocation,
+whatever its keys, round-trips unchanged: ``unpack(pack(projects)) ==
+projects``. ``python -m worktree_env.registry_packed dump|load`` converts
+to and from the JSON layout of ``registry.json`` for debugging.
+"""
+
+import json
+import mmap
+import struct
+import sys
+from pathlib import Path
+
+from . import tracing
+from .errors import RegistryCorruptedError
+from .fsutil import atomic_write_bytes
+from .registry import (
+    OtherPorts,
+    _read_verified,
+    _write_verified,
+    allocation_runs,
+    narrow_projects,
+)
+
+MAGIC = b"WTEPACK\0"
+# Version 2 stores runs of ports instead of every port.
+FORMAT_VERSION = 2
+
+_HEADER = struct.Struct("<8sII")
+_ENTRY = struct.Struct("<QIIII")
+_RUN = struct.Struct("<II")
+
+
+def _encode_section(entries: dict) -> tuple[bytes, bytes]:
+    """Return the runs and body of a project's section."""
+    runs = sorted(
+        {run for allocation in entries.values() for run in allocation_runs(allocation)}
+    )
+    body = json.dumps(entries, separators=(",", ":")).encode()
+    return b"".join(_RUN.pack(*run) for run in runs), body
+
+
+def _pack_sections(sections: dict[bytes, tuple[bytes, bytes]]) -> bytes:
+    """Assemble a file from encoded project names and their sections."""
+    names = sorted(sections)
+    names_start = _HEADER.size + len(names) * _ENTRY.size
+    offset = names_start + sum(len(name) for name in names)
+    name_offset = names_start
+    table = []
+    for name in names:
+        runs, body = sections[name]
+        table.append(
+            _ENTRY.pack(
+                offset, len(runs) // _RUN.size, len(body), name_offset, len(name)
+            )
+        )
+        offset += len(runs) + len(body)
+        name_offset += len(name)
+    parts = [_HEADER.pack(MAGIC, FORMAT_VERSION, len(names)), *table, *names]
+    for name in names:
+        parts.extend(sections[name])
+    return b"".join(parts)
+
+
+def pack(projects: dict) -> bytes:
+    """Encode the ``projects`` of a registry. Empty projects are left out."""
+    return _pack_sections(
+        {
+            name.encode(): _encode_section(entries)
+            for name, entries in projects.items()
+            if entries
+        }
+    )
+
+
+def unpack(buffer: bytes) -> dict:
+    """Decode every project of an encoded registry."""
+    packed = _PackedFile(buffer, "<buffer>")
+    return {packed.name(i): packed.entries(i) for i in range(len(packed))}
+
+
+class _PackedFile:
+    """Random access to the projects of an encoded registry."""
+
+    def __init__(self, buffer, path):
+        self.buffer = buffer
+        self.path = path
+        try:
+            magic, version, self.count = _HEADER.unpack_from(buffer, 0)
+        except struct.error:
+            magic, version = None, None
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._corrupted("unknown header")
+        if _HEADER.size + self.count * _ENTRY.size > len(buffer):
+            self._corrupted("truncated project table")
+
+    @classmethod
+    def open(cls, path: Path) -> "_PackedFile":
+        with open(path, "rb") as f:
+            try:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # An empty file cannot be mapped.
+                buffer = b""
+        return cls(buffer, path)
+
+    def close(self) -> None:
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _corrupted(self, reason: str):
+        raise RegistryCorruptedError(
+            f"Registry file is corrupted: {reason}. "
+            f"Back up and delete {self.path} to reset."
+        )
+
+    def _entry(self, index: int) -> tuple[int, int, int, int, int]:
+        entry = _ENTRY.unpack_from(self.buffer, _HEADER.size + index * _ENTRY.size)
+        offset, runs, body, name_offset, name_length = entry
+        if (
+            offset + runs * _RUN.size + body > len(self.buffer)
+            or name_offset + name_length > len(self.buffer)
+        ):
+            self._corrupted(f"project {index} points past the end of the file")
+        return entry
+
+    def _name_bytes(self, index: int) -> bytes:
+        _, _, _, name_offset, name_length = self._entry(index)
+        return self.buffer[name_offset:name_offset + name_length]
+
+    def name(self, index: int) -> str:
+        return self._name_bytes(index).decode()
+
+    def find(self, name: str) -> int | None:
+        """Return the index of project ``name``, by binary search."""
+        key = name.encode()
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            tracing.count("registry.bytes_read", _ENTRY.size)
+            if self._name_bytes(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self._name_bytes(low) == key:
+            return low
+        return None
+
+    def runs(self, index: int) -> list[tuple[int, int]]:
+        offset, runs, _, _, _ = self._entry(index)
+        tracing.count("registry.bytes_read", runs * _RUN.size)
+        end = offset + runs * _RUN.size
+        return list(_RUN.iter_unpack(self.buffer[offset:end]))
+
+    def section(self, index: int) -> tuple[bytes, bytes]:
+        """The raw runs and body of a project, to copy into a new file."""
+        offset, runs, body, _, _ = self._entry(index)
+        middle = offset + runs * _RUN.size
+        return self.buffer[offset:middle], self.buffer[middle:middle + body]
+
+    def body(self, index: int) -> bytes:
+        return self.section(index)[1]
+
+    def entries(self, index: int) -> dict:
+        body = self.body(index)
+        tracing.count("registry.bytes_read", len(body))
+        try:
+            entries = json.loads(body)
+        except ValueError as e:
+            self._corrupted(f"project {self.name(index)!r}: {e}")
+        if not isinstance(entries, dict):
+            self._corrupted(f"project {self.name(index)!r} is not an object")
+        return entries
+
+
+class PackedBackend:
+    """Stores the registry in ``registry.pack``, readable one project at a time.
+
+    Unscoped, ``load`` decodes every project. Scoped to ``projects``, it
+    decodes only those sections, with the ports of every other project as
+    ``other_ports``, read from the sections' runs when first needed.
+    ``save`` re-encodes the projects it loaded, copies the other sections
+    as they are, and writes nothing when no loaded project changed. GC
+    verification times live in ``verified.json``, as for the JSON backend.
+    """
+
+    def __init__(
+        self,
+        dir_path: Path,
+        readonly: bool = False,
+        projects: list[str] | None = None,
+    ):
+        self.dir_path = dir_path
+        self.path = dir_path / "registry.pack"
+        self.verified_path = dir_path / "verified.json"
+        self.readonly = readonly
+        self.projects = None if projects is None else sorted(set(projects))
+        self._file: _PackedFile | None = None
+        # Bodies of the loaded projects as stored, for save to diff against.
+        self._bodies: dict[str, bytes] = {}
+        self._verified_text: str | None = None
+        if not readonly and not self.path.exists():
+            _create_pack(dir_path)
+
+    def load(self) -> dict:
+        if not self.path.exists():
+            # Nothing was written in this format yet; the registry may still
+            # be an unmigrated registry.json.
+            from .registry import JsonBackend
+
+            data = JsonBackend(self.dir_path, readonly=True).load()
+            if self.projects is not None:
+                narrow_projects(data, self.projects)
+            return data
+
+        with tracing.phase("registry_load"):
+            self._file = _PackedFile.open(self.path)
+            if self.projects is None:
+                indexes = range(len(self._file))
+            else:
+                indexes = [self._file.find(name) for name in self.projects]
+            projects = {}
+            for index in indexes:
+                if index is None:
+                    continue
+                name = self._file.name(index)
+                projects[name] = self._file.entries(index)
+                if not self.readonly:
+                    self._bodies[name] = self._file.body(index)
+
+        data = {"projects": projects}
+        if self.projects is not None:
+            data["other_ports"] = OtherPorts(self.other_ports)
+        if not self.readonly:
+            self._verified_text, verified = _read_verified(self.verified_path)
+            if verified:
+                data["verified"] = verified
+        return data
+
+    def other_ports(self) -> list[tuple[int, int]]:
+        """Runs of the projects outside the scope, without decoding them."""
+        scope = set(self.projects)
+        return [
+            run
+            for index in range(len(self._file))
+            if self._file.name(index) not in scope
+            for run in self._file.runs(index)
+        ]
+
+    def save(self, data: dict) -> None:
+        if self.readonly:
+            return
+        projects = data.get("projects", {})
+        if self.projects is not None:
+            projects = {
+                name: projects[name] for name in self.projects if name in projects
+            }
+
+        with tracing.phase("registry_save"):
+            encoded = {
+                name: _encode_section(entries)
+                for name, entries in projects.items()
+                if entries
+            }
+            bodies = {name: body for name, (_, body) in encoded.items()}
+            if bodies != self._bodies:
+                sections = {name.encode(): section for name, section in encoded.items()}
+                if self.projects is not None:
+                    scope = set(self.projects)
+                    for index in range(len(self._file)):
+                        name = self._file.name(index)
+                        if name not in scope:
+                            sections[name.encode()] = self._file.section(index)
+                content = _pack_sections(sections)
+                atomic_write_bytes(self.path, content)
+                tracing.count("registry.bytes_written", len(content))
+                self._bodies = bodies
+                # Later saves copy sections from the file just written.
+                self._file.close()
+                self._file = _PackedFile.open(self.path)
+            self._verified_text = _write_verified(
+                self.verified_path, data.get("verified", {}), self._verified_text
+            )
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _create_pack(dir_path: Path) -> None:
+    """Write the first ``registry.pack``, from registry.json if there is one.
+
+    The caller holds the registry lock exclusively. The JSON file is
+    renamed afterwards so it is never imported twice.
+    """
+    from .registry import JsonBackend
+
+    json_path = dir_path / "registry.json"
+    projects = JsonBackend(dir_path, readonly=True).load().get("projects", {})
+    atomic_write_bytes(dir_path / "registry.pack", pack(projects))
+    if json_path.exists():
+        json_path.rename(json_path.with_suffix(".json.migrated"))
+
+
+def main(argv: list[str]) -> int:
+    usage = (
+        "usage: python -m worktree_env.registry_packed dump PACK\n"
+        "       python -m worktree_env.registry_packed load JSON PACK\n"
+    )
+    if len(argv) == 2 and argv[0] == "dump":
+        with open(argv[1], "rb") as f:
+            projects = unpack(f.read())
+        sys.stdout.write(json.dumps({"projects": projects}, indent=2) + "\n")
+        return 0
+    if len(argv) == 3 and argv[0] == "load":
+        with open(argv[1]) as f:
+            projects = json.load(f).get("projects", {})
+        atomic_write_bytes(Path(argv[2]), pack(projects))
+        return 0
+    sys.stderr.write(usage)
+    return 2
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv[1:]))
+    except RegistryCorruptedError as e:
+        sys.stderr.write(f"Error: {e}\n")
+        sys.exit(1)
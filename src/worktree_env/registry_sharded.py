@@ -0,0 +1,330 @@
+import bisect
+import fcntl
+import json
+import re
+import zlib
+from pathlib import Path
+
+from . import tracing
+from .errors import RegistryConflictError, RegistryCorruptedError
+from .fsutil import atomic_write_text
+from .registry import (
+    COMPACT_THRESHOLD,
+    JsonBackend,
+    OtherPorts,
+    _digest,
+    _read_verified,
+    _write_verified,
+    file_lock,
+)
+
+# Version 2 stores a block as [start, size] instead of listing its ports.
+INDEX_VERSION = 2
+
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def _shard_stem(project: str) -> str:
+    # Project names are free-form; the checksum keeps sanitized names unique.
+    checksum = zlib.crc32(project.encode())
+    return f"{_UNSAFE_CHARS.sub('_', project)[:64]}-{checksum:08x}"
+
+
+def _port_map(entries: dict) -> dict[str, list]:
+    """Index entries of a project: per path, its sorted ports or its block."""
+    return {path: _held(allocation) for path, allocation in entries.items()}
+
+
+def _held(allocation: dict) -> list:
+    block = allocation.get("block")
+    if block:
+        return [[block["start"], block["size"]]]
+    return sorted(set(allocation.get("ports", {}).values()))
+
+
+def _runs(held: list) -> list[tuple[int, int]]:
+    """The ``(first, last)`` runs of an index entry."""
+    return [
+        (item[0], item[0] + item[1] - 1) if isinstance(item, list) else (item, item)
+        for item in held
+    ]
+
+
+class ShardedBackend:
+    """Stores each project in its own file, plus a global index of ports.
+
+    ``projects/<name>.json`` holds one project's allocations and
+    ``ports.json`` maps every project and path to the ports it holds, or to
+    its block as ``[start, size]``, which is all other projects need to know
+    to avoid conflicts.
+
+    Unscoped, the backend loads every shard and the caller holds the
+    registry lock exclusively. Scoped to ``projects``, the caller holds the
+    registry lock shared and the backend locks just those shards for
+    writing. The other projects' ports are available as ``other_ports``,
+    read from the index the first time it is iterated; writers lock the
+    index then, so only commands that allocate ports wait on each other.
+    The index is rewritten only when ports changed. GC verification times
+    go to ``projects/<name>.verified``, so a GC sweep never rewrites a
+    shard.
+    """
+
+    def __init__(
+        self,
+        dir_path: Path,
+        readonly: bool = False,
+        projects: list[str] | None = None,
+    ):
+        self.shard_dir = dir_path / "projects"
+        self.index_path = dir_path / "ports.json"
+        self.index_lock_path = dir_path / "ports.lock"
+        self.readonly = readonly
+        self.projects = None if projects is None else sorted(set(projects))
+        self._locks = []
+        self._index_locked = False
+        self._digests: dict[str, bytes] = {}
+        self._ports: dict[str, dict[str, list[int]]] = {}
+        self._verified_texts: dict[str, str | None] = {}
+
+    def _shard_path(self, project: str) -> Path:
+        return self.shard_dir / f"{_shard_stem(project)}.json"
+
+    def load(self) -> dict:
+        with tracing.phase("registry_load"):
+            if self.projects is None:
+                projects = self._read_all_shards()
+            else:
+                if not self.readonly:
+                    self._lock_shards()
+                projects = {}
+                for name in self.projects:
+                    shard = self._read_shard(self._shard_path(name))
+                    if shard is not None and shard[1]:
+                        projects[name] = shard[1]
+
+        self._ports = {name: _port_map(entries) for name, entries in projects.items()}
+        data = {"projects": projects}
+        if not self.readonly:
+            verified = self._read_verified(projects)
+            if verified:
+                data["verified"] = verified
+        if self.projects is not None:
+            data["other_ports"] = OtherPorts(self.other_ports)
+        return data
+
+    def _read_verified(self, projects: dict) -> dict:
+        verified = {}
+        for name in projects:
+            text, stamps = _read_verified(self._verified_path(name))
+            self._verified_texts[name] = text
+            if stamps:
+                verified[name] = stamps
+        return verified
+
+    def _verified_path(self, project: str) -> Path:
+        return self.shard_dir / f"{_shard_stem(project)}.verified"
+
+    def _lock(self, path: Path) -> None:
+        lock = file_lock(path, fcntl.LOCK_EX)
+        lock.__enter__()
+        self._locks.append(lock)
+
+    def _lock_index(self) -> None:
+        if not self._index_locked:
+            self._lock(self.index_lock_path)
+            self._index_locked = True
+
+    def other_ports(self) -> list[tuple[int, int]]:
+        """Return runs of unloaded projects; writers lock the index until close.
+
+        The index is replaced atomically, so readers need no lock.
+        """
+        if not self.readonly:
+            self._lock_index()
+        return [
+            run
+            for name, paths in self._read_index().items()
+            if name not in self.projects
+            for held in paths.values()
+            for run in _runs(held)
+        ]
+
+    def _lock_shards(self) -> None:
+        # Readers need no shard lock since shards are replaced atomically.
+        # Writers lock in sorted order, so they never deadlock each other.
+        # Shards are always locked before the index, for the same reason.
+        self.shard_dir.mkdir(exist_ok=True)
+        for name in self.projects:
+            self._lock(self._shard_path(name).with_suffix(".lock"))
+
+    def _read_shard(self, path: Path) -> tuple[str, dict] | None:
+        """Return the project name and allocations stored in a shard."""
+        try:
+            text = path.read_text()
+        except FileNotFoundError:
+            return None
+        tracing.count("registry.bytes_read", len(text))
+        try:
+            shard = json.loads(text)
+            name, entries = shard["project"], shard["allocations"]
+        except (ValueError, KeyError, TypeError) as e:
+            raise RegistryCorruptedError(
+                f"Registry shard {path} is corrupted: {e}. "
+                "Back up and delete it to reset that project."
+            )
+        if not self.readonly:
+            self._digests[name] = _digest(text)
+        return name, entries
+
+    def _read_all_shards(self) -> dict:
+        projects = {}
+        for path in sorted(self.shard_dir.glob("*.json")):
+            shard = self._read_shard(path)
+            if shard is not None and shard[1]:
+                projects[shard[0]] = shard[1]
+        return projects
+
+    def _read_index(self) -> dict:
+        try:
+            text = self.index_path.read_text()
+        except FileNotFoundError:
+            return {}
+        tracing.count("registry.index_bytes_read", len(text))
+        try:
+            return json.loads(text)["projects"]
+        except (ValueError, KeyError, TypeError) as e:
+            raise RegistryCorruptedError(
+                f"Port index is corrupted: {e}. Run 'worktree-env gc' to rebuild it."
+            )
+
+    def _write_index(self, index: dict) -> None:
+        payload = {"version": INDEX_VERSION, "projects": index}
+        text = json.dumps(payload, separators=(",", ":")) + "\n"
+        atomic_write_text(self.index_path, text)
+        tracing.count("registry.index_bytes_written", len(text))
+
+    def save(self, data: dict) -> None:
+        if self.readonly:
+            return
+        projects = data.get("projects", {})
+        names = self.projects if self.projects is not None else sorted(
+            set(projects) | set(self._digests)
+        )
+        ports = {name: _port_map(projects.get(name, {})) for name in names}
+        held = {name: paths for name, paths in ports.items() if paths}
+
+        with tracing.phase("registry_save"):
+            if self.projects is None:
+                # Everything is loaded, so the index is rebuilt whenever it
+                # differs, which also drops reservations leaked by a crash.
+                if not self._index_matches(held):
+                    self._write_index(held)
+            elif held != self._ports:
+                self._update_index(ports)
+            # Shards are written after the index, so a crash in between
+            # leaves ports reserved rather than handed out twice.
+            verified = data.get("verified", {})
+            for name in names:
+                entries = projects.get(name, {})
+                self._write_shard(name, entries)
+                stamps = {
+                    path: verified_at
+                    for path, verified_at in verified.get(name, {}).items()
+                    if path in entries
+                }
+                self._verified_texts[name] = _write_verified(
+                    self._verified_path(name),
+                    stamps,
+                    self._verified_texts.get(name),
+                )
+        self._ports = held
+
+    def _index_matches(self, index: dict) -> bool:
+        try:
+            return self._read_index() == index and self.index_path.exists()
+        except RegistryCorruptedError:
+            return False
+
+    def _update_index(self, ports: dict[str, dict[str, list]]) -> None:
+        self._lock_index()
+        index = self._read_index()
+        # Ports are normally allocated with the index locked since it was
+        # read, so this only trips when ports were added without consulting
+        # other_ports.
+        claimed = sorted(
+            (first, last, name)
+            for name, paths in index.items()
+            if name not in ports
+            for held in paths.values()
+            for first, last in _runs(held)
+        )
+        starts = [first for first, _, _ in claimed]
+        for name, paths in ports.items():
+            previous = {
+                run
+                for held in self._ports.get(name, {}).values()
+                for run in _runs(held)
+            }
+            for held in paths.values():
+                for first, last in _runs(held):
+                    if (first, last) in previous:
+                        continue
+                    # Runs held by different allocations never overlap, so
+                    # only the last one starting at or before ``last`` can.
+                    i = bisect.bisect_right(starts, last) - 1
+                    if i >= 0 and claimed[i][1] >= first:
+                        raise RegistryConflictError(
+                            f"Port {max(first, claimed[i][0])} is already held "
+                            f"by project {claimed[i][2]!r}"
+                        )
+        for name, paths in ports.items():
+            if paths:
+                index[name] = paths
+            else:
+                index.pop(name, None)
+        self._write_index(index)
+
+    def _write_shard(self, name: str, entries: dict) -> None:
+        path = self._shard_path(name)
+        if not entries:
+            if self._digests.pop(name, None) is not None:
+                path.unlink(missing_ok=True)
+            return
+        shard = {"project": name, "allocations": entries}
+        if len(entries) >= COMPACT_THRESHOLD:
+            text = json.dumps(shard, separators=(",", ":")) + "\n"
+        else:
+            text = json.dumps(shard, indent=2) + "\n"
+        digest = _digest(text)
+        if digest == self._digests.get(name):
+            return
+        self.shard_dir.mkdir(exist_ok=True)
+        atomic_write_text(path, text)
+        tracing.count("registry.bytes_written", len(text))
+        self._digests[name] = digest
+
+    def close(self) -> None:
+        while self._locks:
+            self._locks.pop().__exit__(None, None, None)
+        self._index_locked = False
+
+
+def migrate_legacy_registry(dir_path: Path) -> None:
+    """Split an existing registry.json into shards.
+
+    The caller holds the registry lock exclusively. Shards left over from an
+    earlier sharded period are kept, with registry.json winning for
+    allocations present in both, so the rebuilt port index covers every
+    project. The JSON file is renamed afterwards so it is never imported
+    twice.
+    """
+    json_path = dir_path / "registry.json"
+    if not json_path.exists():
+        return
+    legacy = JsonBackend(dir_path, readonly=True).load()
+    backend = ShardedBackend(dir_path)
+    data = backend.load()
+    for project, entries in legacy.get("projects", {}).items():
+        data["projects"].setdefault(project, {}).update(entries)
+    backend.save(data)
+    json_path.rename(json_path.with_suffix(".json.migrated"))
@@ -0,0 +1,392 @@
+import json
+import sqlite3
+from pathlib import Path
+
+from . import tracing
+from .errors import RegistryCorruptedError
+SCHEMA_VERSION = 3
+
+# Version 2 only added the verified table, which readers never query, and
+# version 3 the block columns, which readers of older databases do without,
+# so read-only connections accept version 1 databases too.
+READABLE_SCHEMA_VERSION = 1
+
+# The schema version that added allocations.block_start and block_size.
+_BLOCK_COLUMNS_VERSION = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    name TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS allocations (
+    project TEXT NOT NULL REFERENCES projects(name),
+    path TEXT NOT NULL,
+    worktree TEXT,
+    env TEXT NOT NULL DEFAULT '{}',
+    extra TEXT NOT NULL DEFAULT '{}',
+    block_start INTEGER,
+    block_size INTEGER,
+    PRIMARY KEY (project, path)
+);
+CREATE INDEX IF NOT EXISTS allocations_with_blocks ON allocations (project)
+    WHERE block_start IS NOT NULL;
+CREATE TABLE IF NOT EXISTS ports (
+    project TEXT NOT NULL,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    PRIMARY KEY (project, path, name)
+);
+CREATE INDEX IF NOT EXISTS ports_by_port ON ports (port);
+CREATE TABLE IF NOT EXISTS verified (
+    project TEXT NOT NULL,
+    path TEXT NOT NULL,
+    verified_at INTEGER NOT NULL,
+    PRIMARY KEY (project, path)
+);
+"""
+
+_COLUMN_KEYS = ("worktree", "ports", "env")
+
+
+class SqliteBackend:
+    """Stores the registry in a SQLite database in WAL mode.
+
+    ``load`` still returns the nested dict the registry helpers work on, but
+    ``save`` only touches the rows of allocations that were added, changed
+    or removed since ``load``. Scoped to ``projects``, ``load`` reads only
+    their rows, with the ports of every other project as ``other_ports``,
+    read from the ports table through its port index only when they are
+    first needed. GC verification times are kept in their own table, so
+    re-stamping entries never rewrites their allocation rows.
+    """
+
+    def __init__(
+        self,
+        dir_path: Path,
+        readonly: bool = False,
+        projects: list[str] | None = None,
+    ):
+        self.path = dir_path / "registry.db"
+        self.json_path = dir_path / "registry.json"
+        self.readonly = readonly
+        self.projects = None if projects is None else sorted(set(projects))
+        self.conn = None
+        self.version = 0
+        self._loaded: dict[tuple[str, str], str] = {}
+        self._verified: dict[tuple[str, str], int] = {}
+        try:
+            if readonly:
+                self._connect_readonly()
+            else:
+                self.conn = sqlite3.connect(self.path, isolation_level=None)
+                self.conn.execute("PRAGMA journal_mode=WAL")
+                self.conn.execute("PRAGMA synchronous=NORMAL")
+                self._ensure_schema()
+        except sqlite3.DatabaseError as e:
+            raise RegistryCorruptedError(
+                f"Registry database is corrupted: {e}. "
+                f"Back up and delete {self.path} to reset."
+            )
+
+    def _connect_readonly(self) -> None:
+        """Open the database without creating or migrating it.
+
+        Before the first write the data may still live in registry.json, in
+        which case ``load`` reads that file instead.
+        """
+        if not self.path.exists():
+            return
+        conn = sqlite3.connect(f"{self.path.as_uri()}?mode=ro", uri=True)
+        (version,) = conn.execute("PRAGMA user_version").fetchone()
+        if version < READABLE_SCHEMA_VERSION:
+            conn.close()
+            return
+        self.conn = conn
+        self.version = version
+
+    def _ensure_schema(self) -> None:
+        (version,) = self.conn.execute("PRAGMA user_version").fetchone()
+        self.version = max(version, SCHEMA_VERSION)
+        if version >= SCHEMA_VERSION:
+            return
+        if 0 < version < _BLOCK_COLUMNS_VERSION:
+            self._add_block_columns()
+        self.conn.executescript(_SCHEMA)
+        if version == 0 and self.json_path.exists():
+            self._migrate_from_json()
+        self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _add_block_columns(self) -> None:
+        """Copy the blocks kept in ``extra`` into their own columns."""
+        self.conn.execute("ALTER TABLE allocations ADD COLUMN block_start INTEGER")
+        self.conn.execute("ALTER TABLE allocations ADD COLUMN block_size INTEGER")
+        blocks = [
+            (block["start"], block["size"], rowid)
+            for rowid, extra in self.conn.execute(
+                "SELECT rowid, extra FROM allocations "
+                "WHERE extra LIKE '%\"block\"%'"
+            )
+            for block in [json.loads(extra).get("block")]
+            if block
+        ]
+        self.conn.executemany(
+            "UPDATE allocations SET block_start = ?, block_size = ? "
+            "WHERE rowid = ?",
+            blocks,
+        )
+
+    def _migrate_from_json(self) -> None:
+        """One-shot import of an existing registry.json.
+
+        The JSON file is renamed afterwards so it is never imported twice.
+        """
+        try:
+            data = json.loads(self.json_path.read_text())
+        except (json.JSONDecodeError, ValueError) as e:
+            raise RegistryCorruptedError(
+                f"Cannot migrate {self.json_path}: {e}. "
+                "Fix or delete it and run the command again."
+            )
+        self.save(data)
+        self.json_path.rename(self.json_path.with_suffix(".json.migrated"))
+
+    def load(self) -> dict:
+        if self.conn is None:
+            from .registry import JsonBackend, narrow_projects
+
+            data = JsonBackend(self.path.parent, readonly=True).load()
+            if self.projects is not None:
+                narrow_projects(data, self.projects)
+            return data
+
+        with tracing.phase("registry_load"):
+            projects = self._read_projects()
+            if not self.readonly:
+                self._verified = self._read_verified()
+        self._loaded = {
+            (project, path): _fingerprint(allocation)
+            for project, entries in projects.items()
+            for path, allocation in entries.items()
+        }
+        tracing.count("registry.rows_read", len(self._loaded))
+        data = {"projects": projects}
+        if self._verified:
+            verified = data["verified"] = {}
+            for (project, path), verified_at in self._verified.items():
+                verified.setdefault(project, {})[path] = verified_at
+        if self.projects is not None:
+            from .registry import OtherPorts
+
+            data["other_ports"] = OtherPorts(self.other_ports)
+        return data
+
+    def _scope(self, negate: bool = False) -> tuple[str, list[str]]:
+        """Return a WHERE clause matching the loaded projects, and its values."""
+        if self.projects is None:
+            return "", []
+        marks = ", ".join("?" * len(self.projects))
+        operator = "NOT IN" if negate else "IN"
+        return f" WHERE project {operator} ({marks})", self.projects
+
+    def other_ports(self) -> list[tuple[int, int]]:
+        """Return the ports held by projects that were not loaded, as runs.
+
+        Loose ports come from the port index, one run each, and blocks from
+        the block columns, one run per block whatever its size.
+        """
+        where, values = self._scope(negate=True)
+        try:
+            runs = [
+                (port, port)
+                for (port,) in self.conn.execute(
+                    f"SELECT port FROM ports{where} ORDER BY port", values
+                )
+            ]
+            runs.extend(
+                (start, start + size - 1) for start, size in self._blocks(where, values)
+            )
+            return runs
+        except (sqlite3.DatabaseError, ValueError) as e:
+            raise RegistryCorruptedError(
+                f"Registry database is corrupted: {e}. "
+                f"Back up and delete {self.path} to reset."
+            )
+
+    def _blocks(self, where: str, values: list[str]):
+        """Yield ``(start, size)`` of the blocks of allocations matching ``where``."""
+        condition = f"{where} AND" if where else " WHERE"
+        if self.version >= _BLOCK_COLUMNS_VERSION:
+            yield from self.conn.execute(
+                "SELECT block_start, block_size FROM allocations"
+                f"{condition} block_start IS NOT NULL",
+                values,
+            )
+            return
+        # A reader of a database no writer has upgraded yet.
+        for (extra,) in self.conn.execute(
+            f"SELECT extra FROM allocations{condition} extra LIKE '%\"block\"%'",
+            values,
+        ):
+            block = json.loads(extra).get("block")
+            if block:
+                yield block["start"], block["size"]
+
+    def _read_verified(self) -> dict[tuple[str, str], int]:
+        where, values = self._scope()
+        try:
+            rows = self.conn.execute(
+                f"SELECT project, path, verified_at FROM verified{where}", values
+            )
+            return {(project, path): at for project, path, at in rows}
+        except sqlite3.DatabaseError as e:
+            raise RegistryCorruptedError(
+                f"Registry database is corrupted: {e}. "
+                f"Back up and delete {self.path} to reset."
+            )
+
+    def _read_projects(self) -> dict:
+        projects: dict[str, dict] = {}
+        where, values = self._scope()
+        try:
+            allocations = self.conn.execute(
+                "SELECT project, path, worktree, env, extra FROM allocations"
+                f"{where} ORDER BY rowid",
+                values,
+            )
+            for project, path, worktree, env, extra in allocations:
+                allocation = {}
+                if worktree is not None:
+                    allocation["worktree"] = worktree
+                allocation["ports"] = {}
+                allocation["env"] = json.loads(env)
+                allocation.update(json.loads(extra))
+                projects.setdefault(project, {})[path] = allocation
+
+            ports = self.conn.execute(
+                f"SELECT project, path, name, port FROM ports{where} ORDER BY rowid",
+                values,
+            )
+            for project, path, name, port in ports:
+                projects[project][path]["ports"][name] = port
+        except (sqlite3.DatabaseError, KeyError, ValueError) as e:
+            raise RegistryCorruptedError(
+                f"Registry database is corrupted: {e}. "
+                f"Back up and delete {self.path} to reset."
+            )
+        return projects
+
+    def save(self, data: dict) -> None:
+        if self.readonly:
+            return
+        current = {
+            (project, path): allocation
+            for project, entries in data.get("projects", {}).items()
+            for path, allocation in entries.items()
+        }
+        changed = {
+            key: allocation
+            for key, allocation in current.items()
+            if self._loaded.get(key) != _fingerprint(allocation)
+        }
+        removed = [key for key in self._loaded if key not in current]
+        verified = {
+            (project, path): verified_at
+            for project, stamps in data.get("verified", {}).items()
+            for path, verified_at in stamps.items()
+            if (project, path) in current
+        }
+        stamped = {
+            key: verified_at
+            for key, verified_at in verified.items()
+            if self._verified.get(key) != verified_at
+        }
+        unstamped = [key for key in self._verified if key not in verified]
+        if not changed and not removed and not stamped and not unstamped:
+            return
+
+        with tracing.phase("registry_save"):
+            self._write_rows(changed, removed, stamped, unstamped)
+        tracing.count("registry.rows_written", len(changed) + len(removed))
+        tracing.count("registry.verified_rows_written", len(stamped) + len(unstamped))
+
+        for key in removed:
+            del self._loaded[key]
+        for key, allocation in changed.items():
+            self._loaded[key] = _fingerprint(allocation)
+        self._verified = verified
+
+    def _write_rows(
+        self, changed: dict, removed: list, stamped: dict, unstamped: list
+    ) -> None:
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key in removed:
+                self._delete_row(*key)
+            for (project, path), allocation in changed.items():
+                self._delete_row(project, path)
+                self._insert_row(project, path, allocation)
+            self.conn.executemany(
+                "DELETE FROM verified WHERE project = ? AND path = ?", unstamped
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO verified (project, path, verified_at) "
+                "VALUES (?, ?, ?)",
+                [(project, path, at) for (project, path), at in stamped.items()],
+            )
+            # Only a removal can leave a project empty; the allocations
+            # primary key answers for each one without a scan.
+            self.conn.executemany(
+                "DELETE FROM projects WHERE name = ? AND NOT EXISTS "
+                "(SELECT 1 FROM allocations WHERE project = ?)",
+                [(project, project) for project in {p for p, _ in removed}],
+            )
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def _delete_row(self, project: str, path: str) -> None:
+        self.conn.execute(
+            "DELETE FROM ports WHERE project = ? AND path = ?", (project, path)
+        )
+        self.conn.execute(
+            "DELETE FROM allocations WHERE project = ? AND path = ?",
+            (project, path),
+        )
+
+    def _insert_row(self, project: str, path: str, allocation: dict) -> None:
+        extra = {k: v for k, v in allocation.items() if k not in _COLUMN_KEYS}
+        block = allocation.get("block") or {}
+        self.conn.execute(
+            "INSERT OR IGNORE INTO projects (name) VALUES (?)", (project,)
+        )
+        self.conn.execute(
+            "INSERT INTO allocations "
+            "(project, path, worktree, env, extra, block_start, block_size) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                project,
+                path,
+                allocation.get("worktree"),
+                json.dumps(allocation.get("env", {})),
+                json.dumps(extra),
+                block.get("start"),
+                block.get("size"),
+            ),
+        )
+        self.conn.executemany(
+            "INSERT INTO ports (project, path, name, port) VALUES (?, ?, ?, ?)",
+            [
+                (project, path, name, port)
+                for name, port in allocation.get("ports", {}).items()
+            ],
+        )
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+
+
+def _fingerprint(allocation: dict) -> str:
+    return json.dumps(allocation, sort_keys=True)
@@ -0,0 +1,108 @@
+import json
+import os
+import sys
+import zlib
+from pathlib import Path
+
+from . import tracing
+from .config import config_dir, load_project_config
+from .errors import AllocationNotFoundError
+from .fsutil import atomic_write_text
+from .operations import run_operation
+from .registry import registry_generation
+from .worktree import get_repo_root
+
+# Bump when the cached allocation's layout changes.
+CACHE_VERSION = 1
+
+
+def resolve_allocation(repo_root: Path | None = None) -> dict:
+    """Return the registry allocation of the worktree at ``repo_root``.
+
+    Defaults to the worktree containing the current directory. Raises
+    AllocationNotFoundError when the worktree was never initialized.
+
+    The allocation is cached under ``config_dir()/cache``, keyed on the
+    project and the registry generation of its files, so as long as the
+    registry is unchanged it is read back without locking or loading the
+    registry, or asking a running daemon.
+    """
+    repo_root = repo_root or get_repo_root()
+    project_config = load_project_config(repo_root)
+    path_key = str(repo_root)
+
+    key = [CACHE_VERSION, project_config.name, path_key]
+    generation = registry_generation(project_config.name)
+    cache_path = _cache_path(path_key)
+    if generation is not None:
+        key.append(generation)
+        allocation = _read_cached(cache_path, key)
+        if allocation is not None:
+            return allocation
+
+    tracing.count("allocation.cache_misses")
+    allocation = run_operation("show", project=project_config.name, path=path_key)
+
+    if not allocation:
+        raise AllocationNotFoundError(
+            "No allocation found. Run 'worktree-env init' first."
+        )
+    if generation is not None:
+        _write_cached(cache_path, key, allocation)
+    return allocation
+
+
+def _cache_path(path_key: str) -> Path:
+    checksum = zlib.crc32(path_key.encode())
+    return config_dir() / "cache" / f"allocation-{checksum:08x}.json"
+
+
+def _read_cached(cache_path: Path, key: list) -> dict | None:
+    try:
+        cached = json.loads(cache_path.read_text())
+        if cached["key"] == key:
+            tracing.count("allocation.cache_hits")
+            return cached["allocation"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def _write_cached(cache_path: Path, key: list, allocation: dict) -> None:
+    text = json.dumps({"key": key, "allocation": allocation}, separators=(",", ":"))
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_text(cache_path, text)
+    except OSError:
+        pass
+
+
+def merged_env(allocation: dict) -> dict[str, str]:
+    """Ports and rendered env vars of an allocation as one string mapping."""
+    merged = {
+        name: str(port) for name, port in allocation.get("ports", {}).items()
+    }
+    merged.update(allocation.get("env", {}))
+    return merged
+
+
+def exec_with_env(argv: list[str]) -> int:
+    """Replace this process with ``argv``, run with the worktree's env vars.
+
+    The allocation's ports and env vars are laid over ``os.environ`` and the
+    command is looked up on ``PATH`` and executed directly, without a shell
+    or direnv. Returns only when it cannot be started: 127 when the command
+    is not found and 126 when it cannot be executed, as shells do. The
+    trace, if any, is reported before the process is replaced.
+    """
+    env = dict(os.environ)
+    env.update(merged_env(resolve_allocation()))
+    tracing.report()
+    try:
+        os.execvpe(argv[0], argv, env)
+    except FileNotFoundError:
+        sys.stderr.write(f"Error: command not found: {argv[0]}\n")
+        return 127
+    except OSError as e:
+        sys.stderr.write(f"Error: cannot run {argv[0]}: {e.strerror}\n")
+        return 126
@@ -1,4 +1,46 @@
 import re
+from functools import lru_cache
+
+from .errors import TemplateCycleError
+
+_PLACEHOLDER = re.compile(r"\{([^}]+)\}")
+_ENV_PREFIX = "env."
+
+
+class CompiledTemplate:
+    """A template split once into literal text and placeholder keys.
+
+    ``literals`` always has one more item than ``keys``; rendering
+    interleaves them, substituting each key from the variables and keeping
+    unknown placeholders as written.
+    """
+
+    __slots__ = ("literals", "keys")
+
+    def __init__(self, template_str: str):
+        parts = _PLACEHOLDER.split(template_str)
+        self.literals = tuple(parts[0::2])
+        self.keys = tuple(parts[1::2])
+
+    def env_references(self) -> set[str]:
+        return {
+            key[len(_ENV_PREFIX):] for key in self.keys if key.startswith(_ENV_PREFIX)
+        }
+
+    def render(self, variables: dict[str, str]) -> str:
+        if not self.keys:
+            return self.literals[0]
+        pieces = [self.literals[0]]
+        for key, literal in zip(self.keys, self.literals[1:]):
+            value = variables.get(key)
+            pieces.append("{" + key + "}" if value is None else value)
+            pieces.append(literal)
+        return "".join(pieces)
+
+
+@lru_cache(maxsize=1024)
+def compile_template(template_str: str) -> CompiledTemplate:
+    return CompiledTemplate(template_str)
 
 
 def build_template_vars(
@@ -16,21 +58,55 @@ def build_template_vars(
 
 
 def render_template(template_str: str, variables: dict[str, str]) -> str:
-    def replacer(match: re.Match) -> str:
-        key = match.group(1)
-        if key in variables:
-            return variables[key]
-        return match.group(0)
+    return compile_template(template_str).render(variables)
+
+
+@lru_cache(maxsize=64)
+def _compile_env(
+    templates: tuple[tuple[str, str], ...],
+) -> tuple[tuple[str, CompiledTemplate], ...]:
+    """Compile env templates and order them so references render first.
+
+    Cached on the (name, template) pairs, so a config is only compiled once
+    per process however many worktrees it is rendered for.
+    """
+    compiled = {name: compile_template(template) for name, template in templates}
+    order: list[str] = []
+    state: dict[str, str] = {}
+
+    def visit(name: str, chain: list[str]) -> None:
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            cycle = chain[chain.index(name):] + [name]
+            raise TemplateCycleError(
+                "Env templates reference each other in a cycle: "
+                + " -> ".join(cycle)
+            )
+        state[name] = "visiting"
+        for ref in sorted(compiled[name].env_references()):
+            if ref in compiled:
+                visit(ref, chain + [name])
+        state[name] = "done"
+        order.append(name)
 
-    return re.sub(r"\{([^}]+)\}", replacer, template_str)
+    for name in compiled:
+        visit(name, [])
+    return tuple((name, compiled[name]) for name in order)
 
 
 def render_env(
     env_specs: dict[str, dict],
     template_vars: dict[str, str],
 ) -> dict[str, str]:
-    result = {}
-    for var_name, spec in env_specs.items():
-        template = spec.get("template", "")
-        result[var_name] = render_template(template, template_vars)
-    return result
+    """Render every env spec, letting templates reference ``{env.NAME}``."""
+    templates = tuple(
+        (var_name, spec.get("template", "")) for var_name, spec in env_specs.items()
+    )
+    variables = dict(template_vars)
+    rendered = {}
+    for var_name, template in _compile_env(templates):
+        value = template.render(variables)
+        rendered[var_name] = value
+        variables[_ENV_PREFIX + var_name] = value
+    return {var_name: rendered[var_name] for var_name in env_specs}
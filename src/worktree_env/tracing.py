@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+from contextlib import nullcontext
+
+TRACE_ENV_VAR = "WORKTREE_ENV_TRACE"
+TRACE_FORMATS = ("human", "json")
+
+# Returned by phase() while tracing is off, so instrumented code pays for a
+# global lookup and a no-op context manager and nothing else.
+_DISABLED = nullcontext()
+
+
+class Tracer:
+    """Collects phase timings and counters for one command invocation."""
+
+    def __init__(self, format: str = "human"):
+        self.format = format
+        self.started = time.perf_counter()
+        # [name, depth, start, duration], in the order phases were entered.
+        self.phases: list[list] = []
+        self.counters: dict[str, int] = {}
+        self.depth = 0
+
+    def render(self) -> str:
+        total = time.perf_counter() - self.started
+        if self.format == "json":
+            return self._render_json(total)
+        return self._render_human(total)
+
+    def _render_human(self, total: float) -> str:
+        lines = [f"trace: {total * 1e3:.2f} ms total"]
+        for name, depth, _, duration in self.phases:
+            label = "  " * (depth + 1) + name
+            elapsed = "-" if duration is None else f"{duration * 1e3:.3f}"
+            lines.append(f"{label:<40} {elapsed:>10} ms")
+        for name, value in self.counters.items():
+            lines.append(f"  {name:<38} {value:>10}")
+        return "\n".join(lines) + "\n"
+
+    def _render_json(self, total: float) -> str:
+        import json
+
+        events = [
+            {
+                "type": "phase",
+                "name": name,
+                "depth": depth,
+                "start_ms": _ms(start - self.started),
+                "duration_ms": _ms(duration),
+            }
+            for name, depth, start, duration in self.phases
+        ]
+        events += [
+            {"type": "counter", "name": name, "value": value}
+            for name, value in self.counters.items()
+        ]
+        events.append({"type": "total", "duration_ms": _ms(total)})
+        return "".join(json.dumps(event) + "\n" for event in events)
+
+
+class _Phase:
+    __slots__ = ("tracer", "entry")
+
+    def __init__(self, tracer: Tracer, name: str):
+        self.tracer = tracer
+        self.entry = [name, tracer.depth, 0.0, None]
+
+    def __enter__(self):
+        self.tracer.phases.append(self.entry)
+        self.tracer.depth += 1
+        self.entry[2] = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.entry[3] = time.perf_counter() - self.entry[2]
+        self.tracer.depth -= 1
+
+
+_tracer: Tracer | None = None
+
+
+def _ms(seconds: float | None) -> float | None:
+    return None if seconds is None else round(seconds * 1e3, 3)
+
+
+def enable(format: str = "human") -> None:
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(format)
+
+
+def enable_from_env() -> None:
+    """Enable tracing if WORKTREE_ENV_TRACE is set to a non-empty value.
+
+    ``json`` selects JSON lines; any other value the human summary.
+    """
+    value = os.environ.get(TRACE_ENV_VAR, "")
+    if value and value != "0":
+        enable("json" if value == "json" else "human")
+
+
+def phase(name: str):
+    """Context manager timing one phase; free when tracing is disabled."""
+    if _tracer is None:
+        return _DISABLED
+    return _Phase(_tracer, name)
+
+
+def count(name: str, value: int = 1) -> None:
+    """Add ``value`` to a counter."""
+    if _tracer is not None:
+        _tracer.counters[name] = _tracer.counters.get(name, 0) + value
+
+
+def report(stream=None) -> None:
+    """Write the collected trace to stderr and stop tracing."""
+    global _tracer
+    if _tracer is None:
+        return
+    tracer, _tracer = _tracer, None
+    (stream or sys.stderr).write(tracer.render())
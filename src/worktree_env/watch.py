@@ -0,0 +1,351 @@
+"""Keep a repository's worktrees initialized as their configs and list change.
+
+``worktree-env watch`` watches the ``.worktree-env.toml`` of every worktree,
+the global ``config.toml`` and the repository's ``.git/worktrees``
+directory, with inotify where available and by polling their stat
+otherwise. Events only say that something may have changed: once a burst
+of them has settled, ``Syncer`` lists the worktrees again, compares each
+config with the one it last applied, and sends the difference to the
+registry as a single ``sync`` operation.
+"""
+
+import os
+import select
+import struct
+import time
+from pathlib import Path
+
+from .allocation import WorktreeTarget
+from .config import config_dir, load_global_config, load_project_config
+from .errors import ConfigNotFoundError
+from .operations import run_operation
+from .worktree import (
+    get_git_common_dir,
+    get_worktree_name,
+    list_worktrees,
+    sanitize_name,
+)
+
+# Quiet time that ends a burst of events. Editors and git write several
+# files, or the same file several times, for a single change.
+DEBOUNCE = 0.2
+
+# How often the polling fallback compares the watched files.
+POLL_INTERVAL = 1.0
+
+CONFIG_NAME = ".worktree-env.toml"
+
+
+def watch_spec(worktrees: list[Path], git_common_dir: Path) -> dict[str, set | None]:
+    """Directories to watch, each with the names in it that matter.
+
+    Directories are watched rather than files so that configs saved by
+    renaming a new file over the old one keep being seen. None stands for
+    every name in the directory.
+    """
+    spec: dict[str, set | None] = {str(root): {CONFIG_NAME} for root in worktrees}
+    spec[str(config_dir())] = {"config.toml"}
+    spec[str(git_common_dir)] = {"worktrees"}
+    spec[str(git_common_dir / "worktrees")] = None
+    return spec
+
+
+class Syncer:
+    """Apply what changed in a repository's worktrees since the last sync."""
+
+    def __init__(self, repo_root: Path):
+        self.repo_root = repo_root
+        self.git_common_dir = get_git_common_dir(repo_root)
+        # Path -> project config last applied to it, as a dict.
+        self.applied: dict[str, dict] = {}
+        self.global_config = None
+        self.worktrees: list[Path] = []
+
+    def scan(self, global_config) -> tuple[list[WorktreeTarget], list[dict]]:
+        """Return the worktrees to (re)allocate and the allocations to release.
+
+        A worktree is (re)allocated when it is new or its config changed,
+        and every one is when the global config changed. The allocation of
+        a worktree that is gone, or that moved to another project name, is
+        released.
+        """
+        self.worktrees = list_worktrees(self.repo_root)
+        current = {}
+        for root in self.worktrees:
+            try:
+                config = load_project_config(root)
+            except ConfigNotFoundError:
+                continue
+            name = sanitize_name(get_worktree_name(root))
+            current[str(root)] = WorktreeTarget(root, name, config)
+
+        refresh = global_config != self.global_config
+        targets = [
+            target
+            for path, target in current.items()
+            if refresh or self.applied.get(path) != target.config.as_dict()
+        ]
+        released = [
+            {"project": config["name"], "path": path}
+            for path, config in self.applied.items()
+            if path not in current or current[path].config.name != config["name"]
+        ]
+        return targets, released
+
+    def sync(self) -> tuple[list[WorktreeTarget], dict] | None:
+        """Scan and apply the changes in one registry transaction.
+
+        Returns the targets and the operation's result, or None when nothing
+        changed.
+        """
+        global_config = load_global_config()
+        targets, released = self.scan(global_config)
+        if not targets and not released:
+            self.global_config = global_config
+            return None
+
+        result = run_operation(
+            "sync",
+            targets=[
+                {
+                    "path": str(target.path),
+                    "name": target.name,
+                    "config": target.config.as_dict(),
+                }
+                for target in targets
+            ],
+            released=released,
+            port_range=list(global_config.port_range),
+            port_strategy=global_config.port_strategy,
+        )
+        for entry in released:
+            self.applied.pop(entry["path"], None)
+        for target in targets:
+            self.applied[str(target.path)] = target.config.as_dict()
+        self.global_config = global_config
+        return targets, result
+
+
+class PollingWatcher:
+    """Watches a spec by comparing the stat of the watched names."""
+
+    name = "polling"
+
+    def __init__(self, interval: float = POLL_INTERVAL):
+        self.interval = interval
+        self.spec: dict[str, set | None] = {}
+        self.snapshot: dict = {}
+
+    def set_spec(self, spec: dict[str, set | None]) -> bool:
+        """Watch ``spec`` from now on. Returns whether it differs from before.
+
+        An unchanged spec keeps the previous snapshot, so changes made
+        since it was taken are still reported.
+        """
+        if spec == self.spec:
+            return False
+        self.spec = spec
+        self.snapshot = self._take()
+        return True
+
+    def wait(self, timeout: float | None) -> bool:
+        """Return True once something changed, or False after ``timeout``."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self._take()
+            if snapshot != self.snapshot:
+                self.snapshot = snapshot
+                return True
+            delay = self.interval
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                delay = min(delay, remaining)
+            time.sleep(delay)
+
+    def close(self) -> None:
+        pass
+
+    def _take(self) -> dict:
+        snapshot = {}
+        for directory, names in self.spec.items():
+            if names is None:
+                try:
+                    names = os.listdir(directory)
+                except OSError:
+                    names = ()
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (st.st_ino, st.st_mtime_ns, st.st_size)
+        return snapshot
+
+
+# From <sys/inotify.h>.
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_MOVE_SELF = 0x800
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ONLYDIR = 0x1000000
+_IN_CLOEXEC = 0o2000000
+_IN_NONBLOCK = 0o4000
+
+_WATCH_MASK = (
+    _IN_MODIFY
+    | _IN_ATTRIB
+    | _IN_CLOSE_WRITE
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+    | _IN_DELETE_SELF
+    | _IN_MOVE_SELF
+    | _IN_ONLYDIR
+)
+
+_EVENT = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """Watches a spec with Linux inotify, through libc.
+
+    Raises OSError when inotify is not available.
+    """
+
+    name = "inotify"
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            self._add_watch = libc.inotify_add_watch
+            self._rm_watch = libc.inotify_rm_watch
+            init = libc.inotify_init1
+        except (OSError, AttributeError) as e:
+            raise OSError(f"inotify is not available: {e}")
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = init(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        # Watch descriptor -> (directory, names that matter or None).
+        self.watches: dict[int, tuple[str, set | None]] = {}
+
+    def set_spec(self, spec: dict[str, set | None]) -> bool:
+        """Watch ``spec`` from now on. Returns whether what is watched changed.
+
+        Directories that do not exist are skipped; the parent's watch
+        reports their creation, and the next call adds them.
+        """
+        before = dict(self.watches)
+        by_dir = {directory: wd for wd, (directory, _) in self.watches.items()}
+        for directory, wd in by_dir.items():
+            if directory not in spec:
+                self._rm_watch(self.fd, wd)
+                del self.watches[wd]
+        for directory, names in spec.items():
+            # Adding an existing watch again returns its descriptor.
+            wd = self._add_watch(self.fd, os.fsencode(directory), _WATCH_MASK)
+            if wd >= 0:
+                self.watches[wd] = (directory, names)
+        return self.watches != before
+
+    def wait(self, timeout: float | None) -> bool:
+        """Return True once a relevant event arrived, or False after ``timeout``."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None
+            if deadline is not None:
+                remaining = max(deadline - time.monotonic(), 0)
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+            if not ready:
+                return False
+            if self._relevant(self._read()):
+                return True
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+    def _read(self) -> bytes:
+        chunks = []
+        while True:
+            try:
+                chunk = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def _relevant(self, buffer: bytes) -> bool:
+        relevant = False
+        offset = 0
+        while offset + _EVENT.size <= len(buffer):
+            wd, mask, _, length = _EVENT.unpack_from(buffer, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(buffer[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & (_IN_Q_OVERFLOW | _IN_DELETE_SELF | _IN_MOVE_SELF):
+                relevant = True
+                continue
+            if mask & _IN_IGNORED:
+                self.watches.pop(wd, None)
+                relevant = True
+                continue
+            watched = self.watches.get(wd)
+            if watched is not None and (watched[1] is None or name in watched[1]):
+                relevant = True
+        return relevant
+
+
+def open_watcher(poll: bool = False):
+    """An inotify watcher, or a polling one if asked or inotify is missing."""
+    if not poll:
+        try:
+            return InotifyWatcher()
+        except OSError:
+            pass
+    return PollingWatcher()
+
+
+def watch(syncer: Syncer, watcher, on_sync, on_error, debounce: float = DEBOUNCE):
+    """Sync now, then after every burst of changes, until interrupted.
+
+    ``on_sync`` gets what each sync returned when something changed, and
+    ``on_error`` any WorktreeEnvError or unparsable config; the worktrees it
+    concerned are retried on the next change. When a sync changes what is
+    watched, such as a new worktree's config, it is followed by another
+    sync, so changes made before the new watches were in place are not
+    missed.
+    """
+    from .errors import WorktreeEnvError
+
+    while True:
+        try:
+            result = syncer.sync()
+        except (WorktreeEnvError, ValueError) as e:
+            on_error(e)
+        else:
+            if result is not None:
+                on_sync(*result)
+        if watcher.set_spec(watch_spec(syncer.worktrees, syncer.git_common_dir)):
+            continue
+
+        watcher.wait(None)
+        while watcher.wait(debounce):
+            pass
@@ -1,24 +1,146 @@
+import os
 import re
-import subprocess
+import stat
 from pathlib import Path
 
+from . import tracing
 from .errors import NotAGitRepoError
 
+# Environment variables that change how git locates the repository. When
+# any of them is set, discovery is left to git itself.
+_GIT_DISCOVERY_VARS = (
+    "GIT_DIR",
+    "GIT_CEILING_DIRECTORIES",
+    "GIT_DISCOVERY_ACROSS_FILESYSTEM",
+)
+
 
 def get_repo_root(path: Path | None = None) -> Path:
+    with tracing.phase("repo_root"):
+        start = Path(path).resolve() if path else Path.cwd()
+        root = _discover_repo_root(start)
+        if root is not None:
+            return root
+        return _git_repo_root(start)
+
+
+def _discover_repo_root(start: Path) -> Path | None:
+    """Find the worktree root by walking up from ``start`` without forking git.
+
+    A directory counts as the root when it contains a ``.git`` directory or a
+    ``.git`` file pointing at an existing gitdir, which is how linked
+    worktrees are laid out. Returns None when the layout is one git
+    resolves differently (environment overrides, being inside a gitdir,
+    crossing a filesystem boundary) or when no root was found, so the
+    caller can ask git.
+    """
+    work_tree = os.environ.get("GIT_WORK_TREE")
+    if work_tree:
+        return Path(work_tree).resolve()
+    if any(var in os.environ for var in _GIT_DISCOVERY_VARS):
+        return None
+    if ".git" in start.parts:
+        return None
+
+    try:
+        device = os.stat(start).st_dev
+    except OSError:
+        return None
+
+    for directory in (start, *start.parents):
+        try:
+            if os.stat(directory).st_dev != device:
+                return None
+            git_path = directory / ".git"
+            git_stat = os.stat(git_path)
+        except FileNotFoundError:
+            continue
+        except OSError:
+            return None
+
+        if stat.S_ISDIR(git_stat.st_mode):
+            return directory
+        if stat.S_ISREG(git_stat.st_mode) and _gitdir_file_target(git_path):
+            return directory
+        return None
+    return None
+
+
+def _gitdir_file_target(git_file: Path) -> Path | None:
+    try:
+        content = git_file.read_text().strip()
+    except OSError:
+        return None
+    if not content.startswith("gitdir:"):
+        return None
+    target = Path(content[len("gitdir:"):].strip())
+    if not target.is_absolute():
+        target = git_file.parent / target
+    return target if target.is_dir() else None
+
+
+def _git_repo_root(start: Path) -> Path:
+    import subprocess
+
+    tracing.count("git.subprocesses")
     try:
         result = subprocess.run(
             ["git", "rev-parse", "--show-toplevel"],
             capture_output=True,
             text=True,
             check=True,
-            cwd=path or Path.cwd(),
+            cwd=start,
         )
         return Path(result.stdout.strip())
+    except (subprocess.CalledProcessError, OSError):
+        raise NotAGitRepoError(f"Not a git repository: {start}")
+
+
+def list_worktrees(repo_root: Path) -> list[Path]:
+    """Return the existing, non-bare worktrees of the repository at ``repo_root``."""
+    import subprocess
+
+    tracing.count("git.subprocesses")
+    try:
+        with tracing.phase("git_worktree_list"):
+            result = subprocess.run(
+                ["git", "worktree", "list", "--porcelain"],
+                capture_output=True,
+                text=True,
+                check=True,
+                cwd=repo_root,
+            )
     except subprocess.CalledProcessError:
-        raise NotAGitRepoError(
-            f"Not a git repository: {path or Path.cwd()}"
+        raise NotAGitRepoError(f"Not a git repository: {repo_root}")
+
+    worktrees = []
+    for block in result.stdout.split("\n\n"):
+        lines = block.splitlines()
+        if not lines or not lines[0].startswith("worktree ") or "bare" in lines:
+            continue
+        path = Path(lines[0][len("worktree "):])
+        if path.is_dir():
+            worktrees.append(path)
+    return worktrees
+
+
+def get_git_common_dir(repo_root: Path) -> Path:
+    """Return the git directory shared by every worktree of the repository."""
+    import subprocess
+
+    tracing.count("git.subprocesses")
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--git-common-dir"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=repo_root,
         )
+    except (subprocess.CalledProcessError, OSError):
+        raise NotAGitRepoError(f"Not a git repository: {repo_root}")
+    # Older git prints the path relative to the working directory.
+    return (repo_root / result.stdout.strip()).resolve()
 
 
 def get_worktree_name(path: Path) -> str:
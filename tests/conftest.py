@@ -2,7 +2,7 @@ import subprocess
 
 import pytest
 
-from worktree_env.config import ProjectConfig
+from worktree_env.config import REGISTRY_BACKENDS, ProjectConfig
 
 
 @pytest.fixture
@@ -17,6 +17,12 @@ def sample_project_config():
     )
 
 
+@pytest.fixture(autouse=True)
+def _isolated_config_dir(tmp_path, monkeypatch):
+    # Keep config caches and registries written by tests out of ~/.config.
+    monkeypatch.setenv("WORKTREE_ENV_CONFIG_DIR", str(tmp_path / "default-config"))
+
+
 @pytest.fixture
 def registry_dir(tmp_path, monkeypatch):
     config_dir = tmp_path / "config"
@@ -25,6 +31,29 @@ def registry_dir(tmp_path, monkeypatch):
     return config_dir
 
 
+@pytest.fixture(params=REGISTRY_BACKENDS)
+def registry_backend(request, registry_dir):
+    """Configure ``registry_dir`` for each registry backend in turn.
+
+    Tests of a single backend pin it with
+    ``pytest.mark.parametrize("registry_backend", [name], indirect=True)``.
+    """
+    (registry_dir / "config.toml").write_text(
+        f'[registry]\nbackend = "{request.param}"\n'
+    )
+    return request.param
+
+
+@pytest.fixture
+def alloc():
+    """Build a registry allocation: ``alloc("a", PORT=4000)``."""
+
+    def alloc(worktree, **ports):
+        return {"worktree": worktree, "ports": ports, "env": {}}
+
+    return alloc
+
+
 @pytest.fixture
 def git_worktree(tmp_path):
     repo = tmp_path / "my-repo"
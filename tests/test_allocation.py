@@ -0,0 +1,143 @@
+from pathlib import Path
+
+from worktree_env.allocation import WorktreeTarget, allocate_worktrees
+from worktree_env.config import ProjectConfig
+from worktree_env.registry import get_allocation, remove_allocation, set_allocation
+
+
+def _target(path, ports, env=None, port_block=None):
+    if not isinstance(ports, dict):
+        ports = {name: {} for name in ports}
+    config = ProjectConfig(
+        name="myapp", ports=ports, env=env or {}, port_block=port_block
+    )
+    return WorktreeTarget(Path(path), Path(path).name, config)
+
+
+class TestAllocateWorktrees:
+    def test_allocates_and_stores(self):
+        data = {"projects": {}}
+        target = _target(
+            "/repo/main", ["PORT"], {"URL": {"template": "http://x:{port.PORT}"}}
+        )
+        [allocation] = allocate_worktrees(data, [target], (4000, 4999))
+        assert allocation == {
+            "worktree": "main",
+            "ports": {"PORT": 4000},
+            "env": {"URL": "http://x:4000"},
+        }
+        assert get_allocation(data, "myapp", "/repo/main") == allocation
+
+    def test_batch_allocates_distinct_ports(self):
+        data = {"projects": {}}
+        targets = [_target(f"/repo/wt{i}", ["PORT", "LIVE"]) for i in range(3)]
+        allocations = allocate_worktrees(data, targets, (4000, 4999))
+        ports = [p for a in allocations for p in a["ports"].values()]
+        assert sorted(ports) == list(range(4000, 4006))
+
+    def test_reuses_existing_ports(self):
+        data = {"projects": {}}
+        set_allocation(
+            data, "myapp", "/repo/main", {"worktree": "main", "ports": {"PORT": 4500}}
+        )
+        [allocation] = allocate_worktrees(
+            data, [_target("/repo/main", ["PORT", "LIVE"])], (4000, 4999)
+        )
+        assert allocation["ports"] == {"PORT": 4500, "LIVE": 4000}
+
+    def test_frees_ports_of_dropped_names(self):
+        data = {"projects": {}}
+        set_allocation(
+            data, "myapp", "/repo/main", {"worktree": "main", "ports": {"OLD": 4000}}
+        )
+        [allocation] = allocate_worktrees(
+            data, [_target("/repo/main", ["PORT"])], (4000, 4999)
+        )
+        assert allocation["ports"] == {"PORT": 4000}
+
+
+class TestBlockAllocation:
+    def test_ports_sit_at_their_offsets(self):
+        data = {"projects": {}}
+        ports = {"PORT": {}, "METRICS": {"offset": 2}, "DEBUG": {}}
+        target = _target("/repo/main", ports, port_block=10)
+        [allocation] = allocate_worktrees(data, [target], (4000, 4999))
+        assert allocation["block"] == {"start": 4000, "size": 10}
+        assert allocation["ports"] == {"PORT": 4000, "METRICS": 4002, "DEBUG": 4001}
+
+    def test_worktrees_get_separate_aligned_blocks(self):
+        data = {"projects": {}}
+        set_allocation(
+            data, "other", "/other", {"worktree": "x", "ports": {"PORT": 4003}}
+        )
+        targets = [_target(f"/repo/wt{i}", ["PORT"], port_block=10) for i in range(2)]
+        allocations = allocate_worktrees(data, targets, (4000, 4999))
+        assert [a["block"]["start"] for a in allocations] == [4010, 4020]
+
+    def test_keeps_block_and_follows_new_names(self):
+        data = {"projects": {}}
+        target = _target("/repo/main", ["PORT"], port_block=4)
+        allocate_worktrees(data, [target], (4000, 4999))
+        set_allocation(
+            data, "other", "/other", {"worktree": "x", "ports": {"PORT": 4004}}
+        )
+
+        target = _target("/repo/main", ["PORT", "DEBUG"], port_block=4)
+        [allocation] = allocate_worktrees(data, [target], (4000, 4999))
+        assert allocation["ports"] == {"PORT": 4000, "DEBUG": 4001}
+
+    def test_loose_ports_avoid_reserved_blocks(self):
+        data = {"projects": {}}
+        block = {"start": 4000, "size": 4}
+        set_allocation(
+            data,
+            "other",
+            "/other",
+            {"worktree": "x", "ports": {"PORT": 4000}, "block": block},
+        )
+        [allocation] = allocate_worktrees(
+            data, [_target("/repo/main", ["PORT"])], (4000, 4999)
+        )
+        assert allocation["ports"] == {"PORT": 4004}
+        assert "block" not in allocation
+
+    def test_resized_block_is_reallocated(self):
+        data = {"projects": {}}
+        target = _target("/repo/main", ["PORT"], port_block=4)
+        allocate_worktrees(data, [target], (4000, 4999))
+        [allocation] = allocate_worktrees(
+            data, [_target("/repo/main", ["PORT"], port_block=8)], (4000, 4999)
+        )
+        assert allocation["block"] == {"start": 4000, "size": 8}
+
+
+class TestHashStrategy:
+    def _allocate(self, data, path, ports=("PORT", "LIVE"), port_block=None):
+        target = _target(path, ports, port_block=port_block)
+        [allocation] = allocate_worktrees(data, [target], (4000, 8999), "hash")
+        return allocation
+
+    def test_same_ports_on_every_machine(self):
+        first = self._allocate({"projects": {}}, "/home/a/repo/feature")
+        second = self._allocate({"projects": {}}, "/home/b/src/feature")
+        assert first["ports"] == second["ports"]
+        assert first["ports"] != {"PORT": 4000, "LIVE": 4001}
+
+    def test_same_ports_after_release(self):
+        data = {"projects": {}}
+        allocation = self._allocate(data, "/repo/feature")
+        remove_allocation(data, "myapp", "/repo/feature")
+        assert self._allocate(data, "/repo/feature")["ports"] == allocation["ports"]
+
+    def test_probes_past_taken_port(self):
+        expected = self._allocate({"projects": {}}, "/repo/feature", ["PORT"])
+        port = expected["ports"]["PORT"]
+        data = {"projects": {}}
+        set_allocation(data, "other", "/x", {"worktree": "x", "ports": {"P": port}})
+        allocation = self._allocate(data, "/repo/feature", ["PORT"])
+        assert allocation["ports"] == {"PORT": port + 1}
+
+    def test_blocks_are_hashed_too(self):
+        allocation = self._allocate({"projects": {}}, "/repo/feature", port_block=10)
+        assert allocation["block"]["start"] % 10 == 0
+        assert allocation["block"]["start"] != 4000
@@ -1,8 +1,13 @@
+import json
 import os
+import subprocess
+from unittest.mock import patch
 
+import pytest
 from click.testing import CliRunner
 
 from worktree_env.cli import main
+from worktree_env.registry import locked_registry, set_allocation
 
 
 class TestInitCommand:
@@ -65,6 +70,75 @@ class TestInitCommand:
 
         assert port1 == port2
 
+    def test_init_all_worktrees(self, git_worktree, registry_dir, tmp_path):
+        config = (
+            '[project]\nname = "testapp"\n\n'
+            "[ports]\nPORT = {}\n"
+        )
+        linked = tmp_path / "linked"
+        subprocess.run(
+            ["git", "worktree", "add", "--detach", str(linked)],
+            cwd=git_worktree,
+            capture_output=True,
+            check=True,
+        )
+        (git_worktree / ".worktree-env.toml").write_text(config)
+        (linked / ".worktree-env.toml").write_text(config)
+
+        runner = CliRunner()
+        os.chdir(git_worktree)
+        env = {"WORKTREE_ENV_CONFIG_DIR": str(registry_dir)}
+
+        result = runner.invoke(
+            main, ["init", "--all"], env=env, catch_exceptions=False
+        )
+
+        assert result.exit_code == 0
+        assert "Initialized 2 worktrees" in result.output
+        assert "export PORT=4000" in (git_worktree / ".envrc").read_text()
+        assert "export PORT=4001" in (linked / ".envrc").read_text()
+
+    def test_reinit_skips_direnv_allow_when_unchanged(
+        self, git_worktree, registry_dir
+    ):
+        toml = git_worktree / ".worktree-env.toml"
+        toml.write_text('[project]\nname = "testapp"\n\n[ports]\nPORT = {}\n')
+
+        runner = CliRunner()
+        os.chdir(git_worktree)
+        env = {"WORKTREE_ENV_CONFIG_DIR": str(registry_dir)}
+
+        with patch("worktree_env.envrc.ensure_direnv"), patch(
+            "worktree_env.envrc.direnv_allowed", return_value=True
+        ), patch("worktree_env.envrc.run_direnv_allow") as allow:
+            runner.invoke(main, ["init"], env=env, catch_exceptions=False)
+            assert allow.call_count == 1
+
+            result = runner.invoke(main, ["init"], env=env, catch_exceptions=False)
+            assert allow.call_count == 1
+            assert "(unchanged)" in result.output
+
+    def test_reinit_retries_direnv_allow_when_not_allowed(
+        self, git_worktree, registry_dir
+    ):
+        toml = git_worktree / ".worktree-env.toml"
+        toml.write_text('[project]\nname = "testapp"\n\n[ports]\nPORT = {}\n')
+
+        runner = CliRunner()
+        os.chdir(git_worktree)
+        env = {"WORKTREE_ENV_CONFIG_DIR": str(registry_dir)}
+
+        with patch("worktree_env.envrc.ensure_direnv"), patch(
+            "worktree_env.envrc.direnv_allowed", return_value=False
+        ), patch(
+            "worktree_env.envrc.run_direnv_allow", return_value=False
+        ) as allow:
+            result = runner.invoke(main, ["init"], env=env, catch_exceptions=False)
+            assert "'direnv allow' failed" in result.stderr
+
+            runner.invoke(main, ["init"], env=env, catch_exceptions=False)
+            assert allow.call_count == 2
+
 
 class TestShowCommand:
     def test_show_after_init(self, git_worktree, registry_dir):
@@ -121,6 +195,37 @@ class TestReleaseCommand:
         assert not (git_worktree / ".envrc").exists()
 
 
+class TestOutputs:
+    def test_init_writes_outputs_and_release_deletes_them(
+        self, git_worktree, registry_dir
+    ):
+        (git_worktree / ".worktree-env.toml").write_text(
+            '[project]\nname = "testapp"\n\n'
+            "[ports]\nPORT = {}\n\n"
+            "[outputs]\n"
+            '".env" = { format = "dotenv" }\n'
+            '"config/env.json" = { format = "json" }\n'
+        )
+        runner = CliRunner()
+        os.chdir(git_worktree)
+        env = {"WORKTREE_ENV_CONFIG_DIR": str(registry_dir)}
+
+        result = runner.invoke(main, ["init"], env=env, catch_exceptions=False)
+        assert result.exit_code == 0
+        assert "PORT=4000" in (git_worktree / ".env").read_text()
+        config_json = git_worktree / "config" / "env.json"
+        assert json.loads(config_json.read_text()) == {"PORT": "4000"}
+        assert f"Output:   {config_json}\n" in result.output
+
+        result = runner.invoke(main, ["init"], env=env, catch_exceptions=False)
+        assert f"Output:   {config_json} (unchanged)" in result.output
+
+        result = runner.invoke(main, ["release"], env=env, catch_exceptions=False)
+        assert result.exit_code == 0
+        assert not (git_worktree / ".env").exists()
+        assert not config_json.exists()
+
+
 class TestStatusCommand:
     def test_status_shows_worktrees(self, git_worktree, registry_dir):
         toml = git_worktree / ".worktree-env.toml"
@@ -140,6 +245,149 @@ class TestStatusCommand:
         assert "testapp" in result.output
 
 
+class TestExecCommand:
+    def test_exec_through_click(self, git_worktree, registry_dir, monkeypatch):
+        (git_worktree / ".worktree-env.toml").write_text(
+            '[project]\nname = "testapp"\n\n[ports]\nPORT = {}\n'
+        )
+        os.chdir(git_worktree)
+        env = {"WORKTREE_ENV_CONFIG_DIR": str(registry_dir)}
+        runner = CliRunner()
+        runner.invoke(main, ["init"], env=env, catch_exceptions=False)
+        calls = []
+        monkeypatch.setattr(os, "execvpe", lambda *args: calls.append(args))
+
+        result = runner.invoke(
+            main, ["exec", "--", "ls", "-l"], env=env, catch_exceptions=False
+        )
+
+        [(file, argv, exec_env)] = calls
+        assert (file, argv) == ("ls", ["ls", "-l"])
+        assert exec_env["PORT"] == "4000"
+        assert result.exit_code == 0
+
+    def test_exec_without_init(self, git_worktree, registry_dir):
+        (git_worktree / ".worktree-env.toml").write_text(
+            '[project]\nname = "testapp"\n'
+        )
+        os.chdir(git_worktree)
+        result = CliRunner().invoke(
+            main,
+            ["exec", "true"],
+            env={"WORKTREE_ENV_CONFIG_DIR": str(registry_dir)},
+        )
+        assert result.exit_code == 1
+        assert "No allocation found" in result.output
+
+
+class TestStatusAll:
+    @pytest.fixture
+    def registered(self, registry_dir, tmp_path):
+        (registry_dir / "config.toml").write_text("[ports]\nrange = [4000, 4009]\n")
+        (tmp_path / "app" / "a").mkdir(parents=True)
+        (tmp_path / "api" / "b").mkdir(parents=True)
+        with locked_registry() as data:
+            for project, name, port in [
+                ("app", "a", 4000),
+                ("app", "gone", 4001),
+                ("api", "b", 4005),
+            ]:
+                allocation = {"worktree": name, "ports": {"PORT": port}, "env": {}}
+                path = str(tmp_path / project / name)
+                set_allocation(data, project, path, allocation)
+        os.chdir(tmp_path)
+        return {"WORKTREE_ENV_CONFIG_DIR": str(registry_dir)}
+
+    def _status(self, env, *args):
+        result = CliRunner().invoke(
+            main, ["status", *args], env=env, catch_exceptions=False
+        )
+        assert result.exit_code == 0
+        return result.output
+
+    def test_jsonl_without_a_repository(self, registered, tmp_path):
+        lines = self._status(registered, "--all", "--format", "jsonl").splitlines()
+        items = [json.loads(line) for line in lines]
+        assert [(i["kind"], i.get("worktree")) for i in items] == [
+            ("worktree", "a"),
+            ("worktree", "gone"),
+            ("worktree", "b"),
+            ("range", None),
+        ]
+        assert items[0] == {
+            "kind": "worktree",
+            "project": "app",
+            "path": str(tmp_path / "app" / "a"),
+            "worktree": "a",
+            "ports": {"PORT": 4000},
+        }
+        assert items[-1]["allocated"] == 3
+        assert items[-1]["free_runs"] == 2
+        assert items[-1]["largest_free_run"] == 4
+
+    def test_json(self, registered):
+        output = self._status(registered, "--all", "--format", "json")
+        document = json.loads(output)
+        assert [w["worktree"] for w in document["worktrees"]] == ["a", "gone", "b"]
+        assert document["range"]["utilization"] == 0.3
+
+    def test_json_without_worktrees(self, registered):
+        output = self._status(registered, "--project", "none", "--format", "json")
+        assert json.loads(output)["worktrees"] == []
+
+    def test_filters(self, registered, tmp_path):
+        def worktrees(*args):
+            output = self._status(registered, "--format", "jsonl", *args)
+            items = [json.loads(line) for line in output.splitlines()]
+            return [item["worktree"] for item in items if item["kind"] == "worktree"]
+
+        assert worktrees("--project", "api") == ["b"]
+        assert worktrees("--all", "--path-prefix", str(tmp_path / "app")) == [
+            "a",
+            "gone",
+        ]
+        assert worktrees("--all", "--stale") == ["gone"]
+
+    def test_table(self, registered):
+        output = self._status(registered, "--all")
+        header = output.splitlines()[0].split()
+        assert header == ["Project", "Worktree", "Path", "Ports"]
+        assert "PORT=4005" in output
+        assert output.endswith(
+            "Ports 4000-4009: 3 of 10 allocated (30.0%), 2 free runs, "
+            "largest 4 (42.9% fragmentation)\n"
+        )
+
+    def test_table_without_matches(self, registered):
+        output = self._status(registered, "--project", "none")
+        assert output.startswith("No matching worktrees.\n")
+
+
+class TestWhoCommand:
+    def test_who_shows_owner(self, git_worktree, registry_dir):
+        (git_worktree / ".worktree-env.toml").write_text(
+            '[project]\nname = "testapp"\n\n[ports]\nPORT = {}\n'
+        )
+        runner = CliRunner()
+        os.chdir(git_worktree)
+        env = {"WORKTREE_ENV_CONFIG_DIR": str(registry_dir)}
+        runner.invoke(main, ["init"], env=env, catch_exceptions=False)
+
+        result = runner.invoke(main, ["who", "4000"], env=env, catch_exceptions=False)
+
+        assert result.exit_code == 0
+        assert "Project:  testapp" in result.output
+        assert f"Path:     {git_worktree}" in result.output
+        assert "Port:     4000 (PORT)" in result.output
+
+    def test_who_unallocated_port(self, registry_dir):
+        result = CliRunner().invoke(
+            main, ["who", "4000"], env={"WORKTREE_ENV_CONFIG_DIR": str(registry_dir)}
+        )
+        assert result.exit_code == 1
+        assert "Port 4000 is not allocated." in result.output
+
+
 class TestGcCommand:
     def test_gc_no_stale(self, registry_dir):
         runner = CliRunner()
@@ -1,3 +1,6 @@
+import os
+import time
+
 import pytest
 
 from worktree_env.config import (
@@ -7,7 +10,7 @@ from worktree_env.config import (
     load_global_config,
     load_project_config,
 )
-from worktree_env.errors import ConfigNotFoundError
+from worktree_env.errors import ConfigNotFoundError, InvalidConfigError
 
 
 class TestLoadProjectConfig:
@@ -35,6 +38,73 @@ class TestLoadProjectConfig:
             load_project_config(tmp_path)
 
 
+class TestPortBlock:
+    def _load(self, tmp_path, ports):
+        toml = tmp_path / ".worktree-env.toml"
+        toml.write_text(f'[project]\nname = "myapp"\n\n[ports]\n{ports}')
+        return load_project_config(tmp_path)
+
+    def test_block_size_is_not_a_port(self, tmp_path):
+        config = self._load(
+            tmp_path, "block_size = 10\nPORT = {}\nMETRICS = { offset = 2 }\n"
+        )
+        assert config.port_block == 10
+        assert list(config.ports) == ["PORT", "METRICS"]
+        assert config.port_offsets() == {"PORT": 0, "METRICS": 2}
+
+    def test_no_block_by_default(self, tmp_path):
+        assert self._load(tmp_path, "PORT = {}\n").port_block is None
+
+    @pytest.mark.parametrize(
+        "ports, message",
+        [
+            ("block_size = 0\n", "positive integer"),
+            ("block_size = 1\nA = {}\nB = {}\n", "too small"),
+            ("block_size = 4\nA = { offset = 4 }\n", "offset 4"),
+            ("block_size = 4\nA = { offset = 1 }\nB = { offset = 1 }\n", "share"),
+        ],
+    )
+    def test_rejects_invalid_blocks(self, tmp_path, ports, message):
+        with pytest.raises(InvalidConfigError, match=message):
+            self._load(tmp_path, ports)
+
+
+class TestOutputs:
+    def _load(self, tmp_path, outputs):
+        toml = tmp_path / ".worktree-env.toml"
+        toml.write_text(f'[project]\nname = "myapp"\n\n[outputs]\n{outputs}')
+        return load_project_config(tmp_path)
+
+    def test_loads_outputs(self, tmp_path):
+        config = self._load(
+            tmp_path,
+            '".env" = { format = "dotenv" }\n'
+            '"compose.override.yml" = { format = "compose", services = ["web"] }\n',
+        )
+        assert config.outputs == {
+            ".env": {"format": "dotenv"},
+            "compose.override.yml": {"format": "compose", "services": ["web"]},
+        }
+
+    def test_no_outputs_by_default(self, tmp_path):
+        assert self._load(tmp_path, "").outputs == {}
+
+    @pytest.mark.parametrize(
+        "outputs, message",
+        [
+            ('".env" = { format = "ini" }\n', "unknown format"),
+            ('"/tmp/.env" = { format = "dotenv" }\n', "inside the worktree"),
+            ('"../.env" = { format = "dotenv" }\n', "inside the worktree"),
+            ('".envrc" = { format = "dotenv" }\n', "managed .envrc"),
+            ('"c.yml" = { format = "compose" }\n', "needs services"),
+            ('"c.yml" = { format = "compose", services = [] }\n', "needs services"),
+        ],
+    )
+    def test_rejects_invalid_outputs(self, tmp_path, outputs, message):
+        with pytest.raises(InvalidConfigError, match=message):
+            self._load(tmp_path, outputs)
+
+
 class TestLoadGlobalConfig:
     def test_returns_defaults_when_no_file(self, registry_dir):
         config = load_global_config()
@@ -46,8 +116,117 @@ class TestLoadGlobalConfig:
         config = load_global_config()
         assert config.port_range == (5000, 5999)
 
+    def test_port_strategy(self, registry_dir):
+        assert load_global_config().port_strategy == "lowest"
+        config_file = registry_dir / "config.toml"
+        config_file.write_text('[ports]\nstrategy = "hash"\n')
+        assert load_global_config().port_strategy == "hash"
+
+    def test_rejects_unknown_port_strategy(self, registry_dir):
+        config_file = registry_dir / "config.toml"
+        config_file.write_text('[ports]\nstrategy = "random"\n')
+        with pytest.raises(InvalidConfigError, match="random"):
+            load_global_config()
+
+
+def _age(path, seconds=60):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+class TestConfigCache:
+    def _write_project(self, tmp_path, name="myapp"):
+        toml = tmp_path / ".worktree-env.toml"
+        toml.write_text(f'[project]\nname = "{name}"\n\n[ports]\nPORT = {{}}\n')
+        _age(toml)
+        return toml
+
+    def test_warm_load_skips_toml(self, tmp_path, registry_dir, monkeypatch):
+        self._write_project(tmp_path)
+        first = load_project_config(tmp_path)
+
+        def fail(path):
+            raise AssertionError("TOML parsed on warm path")
+
+        monkeypatch.setattr("worktree_env.config._load_toml", fail)
+        assert load_project_config(tmp_path) == first
+        assert list((registry_dir / "cache").iterdir())
+
+    def test_invalidates_on_change(self, tmp_path, registry_dir):
+        toml = self._write_project(tmp_path)
+        assert load_project_config(tmp_path).name == "myapp"
+
+        toml.write_text('[project]\nname = "renamed"\n')
+        _age(toml, 30)
+        assert load_project_config(tmp_path).name == "renamed"
+
+    def test_does_not_cache_recently_modified_file(self, tmp_path, registry_dir):
+        toml = tmp_path / ".worktree-env.toml"
+        toml.write_text('[project]\nname = "myapp"\n')
+        load_project_config(tmp_path)
+        assert not (registry_dir / "cache").exists()
+
+    def test_global_config_round_trips(self, registry_dir, monkeypatch):
+        config_file = registry_dir / "config.toml"
+        config_file.write_text("[ports]\nrange = [5000, 5999]\n")
+        _age(config_file)
+        load_global_config()
+
+        monkeypatch.setattr("worktree_env.config._load_toml", None)
+        assert load_global_config().port_range == (5000, 5999)
+
+    def test_skips_cache_for_toml_dates(self, tmp_path, registry_dir):
+        toml = tmp_path / ".worktree-env.toml"
+        toml.write_text(
+            '[project]\nname = "myapp"\n\n[env]\nSINCE = { default = 2024-01-01 }\n'
+        )
+        _age(toml)
+        assert load_project_config(tmp_path).name == "myapp"
+        assert load_project_config(tmp_path).name == "myapp"
+        assert not (registry_dir / "cache").exists()
+
+    def test_ignores_corrupted_cache(self, tmp_path, registry_dir):
+        self._write_project(tmp_path)
+        load_project_config(tmp_path)
+        for cache_file in (registry_dir / "cache").iterdir():
+            cache_file.write_text("{not json")
+        assert load_project_config(tmp_path).name == "myapp"
+
 
 class TestConfigDir:
     def test_respects_env_override(self, monkeypatch, tmp_path):
         monkeypatch.setenv("WORKTREE_ENV_CONFIG_DIR", str(tmp_path))
         assert config_dir() == tmp_path
+
+
+class TestGcConfig:
+    def test_default_interval(self, registry_dir):
+        assert load_global_config().gc_interval == 600
+
+    def test_loads_interval(self, registry_dir):
+        (registry_dir / "config.toml").write_text("[gc]\ninterval = 60\n")
+        assert load_global_config().gc_interval == 60
+
+    @pytest.mark.parametrize("value", ["-1", '"600"', "1.5", "true"])
+    def test_rejects_invalid_interval(self, registry_dir, value):
+        (registry_dir / "config.toml").write_text(f"[gc]\ninterval = {value}\n")
+        with pytest.raises(InvalidConfigError, match="gc interval"):
+            load_global_config()
+
+
+class TestRegistryBackendConfig:
+    def test_defaults_to_json(self, registry_dir):
+        assert load_global_config().registry_backend == "json"
+
+    def test_loads_sqlite_backend(self, registry_dir):
+        (registry_dir / "config.toml").write_text(
+            '[registry]\nbackend = "sqlite"\n'
+        )
+        assert load_global_config().registry_backend == "sqlite"
+
+    def test_rejects_unknown_backend(self, registry_dir):
+        (registry_dir / "config.toml").write_text(
+            '[registry]\nbackend = "redis"\n'
+        )
+        with pytest.raises(InvalidConfigError, match="redis"):
+            load_global_config()
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from click.testing import CliRunner
+
+from worktree_env.cli import main
+from worktree_env.client import DaemonUnavailable, daemon_request, socket_path
+from worktree_env.daemon import Daemon, daemon_running
+from worktree_env.errors import DaemonError, PortsExhaustedError
+from worktree_env.operations import run_operation, stream_operation
+from worktree_env.registry import held_registry
+
+
+def _target(path, ports=("PORT",)):
+    return {
+        "path": str(path),
+        "name": path.name,
+        "config": {"name": "myapp", "ports": {p: {} for p in ports}, "env": {}},
+    }
+
+
+def _start_daemon(save_errors=()):
+    """Serve in a thread; saves raise the ``save_errors`` in turn (None saves)."""
+    ready = threading.Event()
+    started = {}
+    errors = list(save_errors)
+
+    def serve():
+        with held_registry() as (data, save):
+
+            def failing_save():
+                error = errors.pop(0) if errors else None
+                if error is not None:
+                    raise error
+                save()
+
+            started["daemon"] = Daemon(data, failing_save)
+            asyncio.run(started["daemon"].serve(socket_path(), ready=ready.set))
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    assert ready.wait(5)
+    return started["daemon"], thread
+
+
+@pytest.fixture
+def running_daemon(registry_dir):
+    daemon, thread = _start_daemon()
+    yield daemon
+    daemon.stop()
+    thread.join(5)
+
+
+class TestDaemonRequests:
+    def test_ping(self, running_daemon):
+        assert daemon_running()
+
+    def test_init_persists_before_answering(self, running_daemon, registry_dir, tmp_path):
+        result = run_operation(
+            "init", targets=[_target(tmp_path)], port_range=[4000, 4999], gc_max_age=None
+        )
+        assert result["allocations"][0]["ports"] == {"PORT": 4000}
+
+        saved = json.loads((registry_dir / "registry.json").read_text())
+        assert saved["projects"]["myapp"][str(tmp_path)]["ports"] == {"PORT": 4000}
+
+    def test_show_status_release(self, running_daemon, tmp_path):
+        run_operation(
+            "init", targets=[_target(tmp_path)], port_range=[4000, 4999], gc_max_age=None
+        )
+        shown = run_operation("show", project="myapp", path=str(tmp_path))
+        assert shown["ports"] == {"PORT": 4000}
+        assert list(run_operation("status", project="myapp")) == [str(tmp_path)]
+        assert run_operation("release", project="myapp", path=str(tmp_path)) is True
+        assert run_operation("show", project="myapp", path=str(tmp_path)) is None
+
+    def test_concurrent_clients_get_distinct_ports(self, running_daemon, tmp_path):
+        paths = []
+        for i in range(20):
+            path = tmp_path / f"wt{i}"
+            path.mkdir()
+            paths.append(path)
+
+        def init(path):
+            result = run_operation(
+                "init", targets=[_target(path)], port_range=[4000, 4999], gc_max_age=None
+            )
+            return result["allocations"][0]["ports"]["PORT"]
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            ports = list(pool.map(init, paths))
+        assert sorted(ports) == list(range(4000, 4020))
+
+    def test_reraises_daemon_errors(self, running_daemon, tmp_path):
+        with pytest.raises(PortsExhaustedError):
+            run_operation(
+                "init",
+                targets=[_target(tmp_path, ports=("A", "B"))],
+                port_range=[4000, 4000],
+                gc_max_age=None,
+            )
+
+    def test_cli_show_goes_through_daemon(self, running_daemon, git_worktree, registry_dir):
+        (git_worktree / ".worktree-env.toml").write_text(
+            '[project]\nname = "myapp"\n\n[ports]\nPORT = {}\n'
+        )
+        run_operation(
+            "init", targets=[_target(git_worktree)], port_range=[4000, 4999], gc_max_age=None
+        )
+        os.chdir(git_worktree)
+        result = CliRunner().invoke(
+            main,
+            ["show"],
+            env={"WORKTREE_ENV_CONFIG_DIR": str(registry_dir)},
+            catch_exceptions=False,
+        )
+        assert result.output == "PORT=4000\n"
+
+    def test_socket_removed_on_stop(self, registry_dir):
+        daemon, thread = _start_daemon()
+        daemon.stop()
+        thread.join(5)
+        assert not socket_path().exists()
+
+    def test_failed_operation_is_rolled_back(self, running_daemon, tmp_path):
+        run_operation(
+            "init", targets=[_target(tmp_path)], port_range=[4000, 4999], gc_max_age=None
+        )
+        other = tmp_path / "other"
+        other.mkdir()
+        with pytest.raises(PortsExhaustedError):
+            run_operation(
+                "init",
+                targets=[_target(other), _target(tmp_path, ports=("PORT", "B", "C"))],
+                port_range=[4000, 4001],
+                gc_max_age=None,
+            )
+        assert run_operation("show", project="myapp", path=str(other)) is None
+        assert run_operation("show", project="myapp", path=str(tmp_path))["ports"] == {
+            "PORT": 4000
+        }
+
+    def test_who_after_rollback(self, running_daemon, tmp_path):
+        run_operation(
+            "init", targets=[_target(tmp_path)], port_range=[4000, 4999], gc_max_age=None
+        )
+        other = tmp_path / "other"
+        other.mkdir()
+        with pytest.raises(PortsExhaustedError):
+            run_operation(
+                "init",
+                targets=[_target(other, ports=("A", "B"))],
+                port_range=[4000, 4001],
+                gc_max_age=None,
+            )
+        assert run_operation("who", port=4000)["path"] == str(tmp_path)
+        assert run_operation("who", port=4001) is None
+
+    def test_streams_status(self, running_daemon, tmp_path, monkeypatch):
+        monkeypatch.setattr("worktree_env.daemon.STREAM_BUFFER", 0)
+        paths = []
+        for i in range(3):
+            paths.append(tmp_path / f"wt{i}")
+            paths[-1].mkdir()
+        run_operation(
+            "init",
+            targets=[_target(path) for path in paths],
+            port_range=[4000, 4999],
+            gc_max_age=None,
+        )
+
+        items = list(stream_operation("status_stream", port_range=[4000, 4999]))
+
+        assert [item.get("path") for item in items] == [*map(str, paths), None]
+        assert items[-1]["allocated"] == 3
+
+    def test_stream_reraises_daemon_errors(self, running_daemon):
+        with pytest.raises(DaemonError, match="Bad request"):
+            list(stream_operation("status_stream", port_range=[4000, 4999], bad=1))
+
+    @pytest.mark.parametrize("error", [OSError("disk full"), ValueError("bad data")])
+    def test_failed_save_is_rolled_back(self, registry_dir, tmp_path, error):
+        daemon, thread = _start_daemon(save_errors=[None, error])
+        try:
+            run_operation(
+                "init",
+                targets=[_target(tmp_path)],
+                port_range=[4000, 4999],
+                gc_max_age=None,
+            )
+            with pytest.raises(DaemonError, match="Could not persist"):
+                run_operation("release", project="myapp", path=str(tmp_path))
+
+            shown = run_operation("show", project="myapp", path=str(tmp_path))
+            assert shown["ports"] == {"PORT": 4000}
+        finally:
+            daemon.stop()
+            thread.join(5)
+
+        saved = json.loads((registry_dir / "registry.json").read_text())
+        assert str(tmp_path) in saved["projects"]["myapp"]
+
+
+class TestClientFallback:
+    def test_unavailable_without_socket(self, registry_dir):
+        with pytest.raises(DaemonUnavailable):
+            daemon_request("ping")
+
+    def test_unavailable_with_stale_socket(self, registry_dir):
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(str(socket_path()))
+        stale.close()
+
+        with pytest.raises(DaemonUnavailable):
+            daemon_request("ping")
+        assert run_operation("status", project="myapp") == {}
@@ -1,3 +1,6 @@
+import json
+import subprocess
+from pathlib import Path
 from unittest.mock import patch
 
 import pytest
@@ -5,7 +8,10 @@ import pytest
 from worktree_env.envrc import (
     _detect_shell,
     _ensure_shell_hook,
+    direnv_allowed,
     ensure_direnv,
+    run_direnv_allow,
+    update_envrc,
     write_envrc,
 )
 from worktree_env.errors import WorktreeEnvError
@@ -50,6 +56,29 @@ class TestEnsureShellHook:
         assert "export FOO=bar" in rc
         assert 'eval "$(direnv hook zsh)"' in rc
 
+    def test_skips_reading_rc_once_cached(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("pathlib.Path.home", lambda: tmp_path)
+        (tmp_path / ".zshrc").write_text('eval "$(direnv hook zsh)"\n')
+        assert _ensure_shell_hook("zsh") is False
+
+        read_text = Path.read_text
+
+        def guarded(self, *args, **kwargs):
+            assert self.name != ".zshrc", "rc file read again"
+            return read_text(self, *args, **kwargs)
+
+        monkeypatch.setattr("pathlib.Path.read_text", guarded)
+        assert _ensure_shell_hook("zsh") is False
+
+    def test_rereads_rc_after_change(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("pathlib.Path.home", lambda: tmp_path)
+        rc = tmp_path / ".zshrc"
+        rc.write_text('eval "$(direnv hook zsh)"\n')
+        _ensure_shell_hook("zsh")
+
+        rc.write_text("export FOO=bar\n")
+        assert _ensure_shell_hook("zsh") is True
+
 
 class TestEnsureDirenv:
     def test_succeeds_when_installed_and_hook_present(self, monkeypatch):
@@ -76,6 +105,80 @@ class TestEnsureDirenv:
             ensure_direnv()
             mock_hook.assert_called_once_with("zsh")
 
+    @pytest.mark.parametrize("direnv", [None, "/usr/local/bin/direnv"])
+    def test_native_hook_makes_direnv_optional(
+        self, tmp_path, monkeypatch, direnv
+    ):
+        monkeypatch.setattr("pathlib.Path.home", lambda: tmp_path)
+        monkeypatch.setattr("shutil.which", lambda _: direnv)
+        monkeypatch.setenv("SHELL", "/bin/zsh")
+        rc = 'eval "$(worktree-env hook zsh)"\n'
+        (tmp_path / ".zshrc").write_text(rc)
+
+        assert ensure_direnv() is (direnv is not None)
+        assert (tmp_path / ".zshrc").read_text() == rc
+
+    def test_native_hook_check_is_cached(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("pathlib.Path.home", lambda: tmp_path)
+        monkeypatch.setattr("shutil.which", lambda _: None)
+        monkeypatch.setenv("SHELL", "/bin/zsh")
+        (tmp_path / ".zshrc").write_text('eval "$(worktree-env hook zsh)"\n')
+        assert ensure_direnv() is False
+
+        read_text = Path.read_text
+
+        def guarded(self, *args, **kwargs):
+            assert self.name != ".zshrc", "rc file read again"
+            return read_text(self, *args, **kwargs)
+
+        monkeypatch.setattr("pathlib.Path.read_text", guarded)
+        assert ensure_direnv() is False
+
+
+class TestDirenvAllowed:
+    def _status(self, monkeypatch, stdout):
+        result = subprocess.CompletedProcess([], 0, stdout=stdout, stderr="")
+        monkeypatch.setattr("subprocess.run", lambda *a, **kw: result)
+
+    @pytest.mark.parametrize(
+        "allowed,expected", [(True, True), (0, True), (False, False), (1, False)]
+    )
+    def test_reads_status_json(self, tmp_path, monkeypatch, allowed, expected):
+        found = {"path": str(tmp_path / ".envrc"), "allowed": allowed}
+        self._status(monkeypatch, json.dumps({"state": {"foundRC": found}}))
+        assert direnv_allowed(tmp_path) is expected
+
+    def test_other_envrc_is_not_allowed(self, tmp_path, monkeypatch):
+        found = {"path": str(tmp_path.parent / ".envrc"), "allowed": True}
+        self._status(monkeypatch, json.dumps({"state": {"foundRC": found}}))
+        assert direnv_allowed(tmp_path) is False
+
+    @pytest.mark.parametrize("stdout", ["", "Found RC allowed true", "{}"])
+    def test_unexpected_output_is_not_allowed(self, tmp_path, monkeypatch, stdout):
+        self._status(monkeypatch, stdout)
+        assert direnv_allowed(tmp_path) is False
+
+    def test_skips_status_while_allowed_envrc_is_unchanged(
+        self, tmp_path, monkeypatch
+    ):
+        envrc = tmp_path / ".envrc"
+        envrc.write_text("export PORT=4000\n")
+        calls = []
+
+        def run(args, **kwargs):
+            calls.append(args)
+            return subprocess.CompletedProcess(args, 0, stdout="", stderr="")
+
+        monkeypatch.setattr("shutil.which", lambda _: "/usr/local/bin/direnv")
+        monkeypatch.setattr("subprocess.run", run)
+        assert run_direnv_allow(tmp_path) is True
+        assert direnv_allowed(tmp_path) is True
+        assert calls == [["direnv", "allow"]]
+
+        envrc.write_text("export PORT=4001\n")
+        assert direnv_allowed(tmp_path) is False
+        assert calls[-1] == ["direnv", "status", "--json"]
+
 
 class TestWriteEnvrc:
     def test_writes_file(self, tmp_path):
@@ -109,3 +212,23 @@ class TestWriteEnvrc:
         lines = [l for l in content.splitlines() if l.startswith("export")]
         keys = [l.split("=")[0].replace("export ", "") for l in lines]
         assert keys == sorted(keys)
+
+
+class TestUpdateEnvrc:
+    def test_writes_new_file(self, tmp_path):
+        assert update_envrc(tmp_path, {"A": "1"}, {"PORT": 4000}) is True
+        assert "export PORT=4000" in (tmp_path / ".envrc").read_text()
+
+    def test_leaves_identical_file_untouched(self, tmp_path):
+        update_envrc(tmp_path, {"A": "1"}, {"PORT": 4000})
+        envrc = tmp_path / ".envrc"
+        before = envrc.stat()
+
+        assert update_envrc(tmp_path, {"A": "1"}, {"PORT": 4000}) is False
+        after = envrc.stat()
+        assert (after.st_ino, after.st_mtime_ns) == (before.st_ino, before.st_mtime_ns)
+
+    def test_rewrites_changed_file(self, tmp_path):
+        update_envrc(tmp_path, {"A": "1"}, {})
+        assert update_envrc(tmp_path, {"A": "2"}, {}) is True
+        assert "export A=2" in (tmp_path / ".envrc").read_text()
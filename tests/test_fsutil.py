@@ -0,0 +1,44 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from worktree_env.fsutil import atomic_write_text
+
+
+class TestAtomicWriteText:
+    def test_creates_file(self, tmp_path):
+        path = tmp_path / "out.txt"
+        atomic_write_text(path, "hello\n")
+        assert path.read_text() == "hello\n"
+
+    def test_replaces_existing_file(self, tmp_path):
+        path = tmp_path / "out.txt"
+        path.write_text("old")
+        atomic_write_text(path, "new")
+        assert path.read_text() == "new"
+
+    def test_keeps_old_file_when_replace_fails(self, tmp_path):
+        path = tmp_path / "out.txt"
+        path.write_text("old")
+        with patch("os.replace", side_effect=OSError("boom")):
+            with pytest.raises(OSError):
+                atomic_write_text(path, "new")
+        assert path.read_text() == "old"
+        assert list(tmp_path.iterdir()) == [path]
+
+    def test_new_file_follows_umask(self, tmp_path):
+        path = tmp_path / "out.txt"
+        old = os.umask(0o027)
+        try:
+            atomic_write_text(path, "hello\n")
+        finally:
+            os.umask(old)
+        assert path.stat().st_mode & 0o777 == 0o640
+
+    def test_keeps_mode_of_replaced_file(self, tmp_path):
+        path = tmp_path / "out.txt"
+        path.write_text("old")
+        path.chmod(0o664)
+        atomic_write_text(path, "new")
+        assert path.stat().st_mode & 0o777 == 0o664
@@ -0,0 +1,155 @@
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+
+import pytest
+from click.testing import CliRunner
+
+from worktree_env import hook
+from worktree_env.cli import main
+from worktree_env.hook import STATE_VAR, _diff, hook_env
+
+
+def _state(env, saved):
+    return {"env": env, "saved": saved}
+
+
+class TestDiff:
+    def test_applies_env_and_records_state(self, monkeypatch):
+        monkeypatch.setenv("PORT", "1")
+        monkeypatch.delenv("DB", raising=False)
+        out = _diff("bash", _state({}, {}), {"PORT": "4000", "DB": "app"})
+        lines = out.splitlines()
+        assert lines[:2] == ["export PORT='4000';", "export DB='app';"]
+        [assignment] = shlex.split(lines[2].removeprefix("export ").rstrip(";"))
+        name, value = assignment.split("=", 1)
+        assert name == STATE_VAR
+        assert json.loads(value) == {
+            "env": {"PORT": "4000", "DB": "app"},
+            "saved": {"PORT": "1", "DB": None},
+        }
+
+    def test_nothing_to_do(self, monkeypatch):
+        monkeypatch.setenv("PORT", "4000")
+        assert _diff("bash", _state({}, {}), {}) == ""
+        state = _state({"PORT": "4000"}, {"PORT": None})
+        assert _diff("bash", state, {"PORT": "4000"}) == ""
+
+    def test_leaving_restores_previous_values(self, monkeypatch):
+        monkeypatch.setenv("PORT", "4000")
+        monkeypatch.setenv("DB", "app")
+        state = _state({"PORT": "4000", "DB": "app"}, {"PORT": "1", "DB": None})
+        assert _diff("bash", state, {}) == (
+            f"export PORT='1';\nunset DB;\nunset {STATE_VAR};\n"
+        )
+
+    def test_switching_keeps_the_original_values(self, monkeypatch):
+        monkeypatch.setenv("PORT", "4000")
+        state = _state({"PORT": "4000"}, {"PORT": "1"})
+        out = _diff("bash", state, {"PORT": "4005"})
+        assert out.startswith("export PORT='4005';\n")
+        assert '"saved": {"PORT": "1"}' in out
+
+    def test_quoting(self, monkeypatch):
+        monkeypatch.delenv("A", raising=False)
+        assert _diff("zsh", _state({}, {}), {"A": "it's"}).startswith(
+            "export A='it'\\''s';\n"
+        )
+        assert _diff("fish", _state({}, {}), {"A": "it's \\ x"}).startswith(
+            "set -gx A 'it\\'s \\\\ x';\n"
+        )
+        assert _diff("fish", _state({"A": "1"}, {"A": None}), {}) == (
+            f"set -e A;\nset -e {STATE_VAR};\n"
+        )
+
+    def test_skips_names_that_are_not_variables(self, monkeypatch):
+        out = _diff("bash", _state({}, {}), {"NOT-A-NAME": "1"})
+        assert out == ""
+
+
+@pytest.fixture
+def initialized(git_worktree, registry_dir, monkeypatch):
+    config = git_worktree / ".worktree-env.toml"
+    config.write_text('[project]\nname = "testapp"\n')
+    registry = registry_dir / "registry.json"
+    allocation = {"worktree": "my_repo", "ports": {"PORT": 4000}, "env": {}}
+    registry.write_text(
+        json.dumps({"projects": {"testapp": {str(git_worktree): allocation}}})
+    )
+    past = time.time() - 60
+    for path in (config, registry):
+        os.utime(path, (past, past))
+    monkeypatch.chdir(git_worktree)
+    monkeypatch.delenv(STATE_VAR, raising=False)
+    monkeypatch.delenv("PORT", raising=False)
+    return git_worktree
+
+
+class TestHookEnv:
+    def test_exports_allocation(self, initialized, capsys):
+        assert hook_env("bash") == 0
+        assert capsys.readouterr().out.startswith("export PORT='4000';\n")
+
+    def test_warm_path_does_not_resolve(self, initialized, capsys, monkeypatch):
+        (initialized / "sub").mkdir()
+        hook_env("bash")
+        monkeypatch.chdir(initialized / "sub")
+        monkeypatch.setattr(hook, "_resolve_entry", None)
+        hook_env("bash")
+        assert capsys.readouterr().out.count("export PORT='4000';") == 2
+
+    def test_registry_change_invalidates(self, initialized, registry_dir, capsys):
+        hook_env("bash")
+        registry = registry_dir / "registry.json"
+        data = json.loads(registry.read_text())
+        data["projects"]["testapp"][str(initialized)]["ports"]["PORT"] = 4001
+        registry.write_text(json.dumps(data))
+        past = time.time() - 30
+        os.utime(registry, (past, past))
+        hook_env("bash")
+        assert "export PORT='4001';" in capsys.readouterr().out
+
+    def test_outside_a_worktree(self, tmp_path, registry_dir, monkeypatch, capsys):
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.delenv(STATE_VAR, raising=False)
+        assert hook_env("bash") == 0
+        assert capsys.readouterr().out == ""
+
+    def test_uninitialized_worktree(
+        self, git_worktree, registry_dir, monkeypatch, capsys
+    ):
+        monkeypatch.chdir(git_worktree)
+        monkeypatch.delenv(STATE_VAR, raising=False)
+        assert hook_env("bash") == 0
+        assert capsys.readouterr().out == ""
+
+    def test_fresh_registry_is_applied_but_not_cached(
+        self, initialized, registry_dir, capsys
+    ):
+        os.utime(registry_dir / "registry.json")
+        hook_env("bash")
+        assert capsys.readouterr().out.startswith("export PORT='4000';\n")
+        assert not (registry_dir / "cache" / "hook-env.json").exists()
+
+    def test_unsupported_shell(self, capsys):
+        assert hook_env("tcsh") == 2
+
+
+class TestHookCommand:
+    @pytest.mark.parametrize("shell", ["bash", "zsh", "fish"])
+    def test_prints_hook(self, shell):
+        result = CliRunner().invoke(main, ["hook", shell], catch_exceptions=False)
+        assert f"hook-env {shell}" in result.output
+
+    def test_bash_hook_applies_env(self, initialized, registry_dir):
+        script = CliRunner().invoke(main, ["hook", "bash"]).output
+        result = subprocess.run(
+            ["bash", "--norc", "-c", f'{script}\n_worktree_env_hook; echo "$PORT"'],
+            capture_output=True,
+            text=True,
+            env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        )
+        assert result.stdout == "4000\n", result.stderr
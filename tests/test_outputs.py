@@ -0,0 +1,79 @@
+import json
+import os
+
+import pytest
+
+from worktree_env.outputs import render_output, render_outputs, write_output
+
+ENV = {"PORT": "4000", "URL": "http://localhost:4000/a b", "PRICE": "$5"}
+
+
+class TestRenderOutput:
+    def test_dotenv(self):
+        content = render_output("dotenv", ENV, {})
+        assert content.splitlines()[1:] == [
+            "PORT=4000",
+            "PRICE='$5'",
+            "URL='http://localhost:4000/a b'",
+        ]
+
+    def test_dotenv_escapes_single_quotes(self):
+        content = render_output("dotenv", {"A": "it's \"x\"\nnext"}, {})
+        assert content.splitlines()[1] == 'A="it\'s \\"x\\"\\nnext"'
+
+    def test_json(self):
+        assert json.loads(render_output("json", ENV, {})) == ENV
+
+    def test_compose(self):
+        content = render_output("compose", ENV, {"services": ["web", "worker"]})
+        assert content.splitlines()[1:] == [
+            "services:",
+            "  web:",
+            "    environment:",
+            '      PORT: "4000"',
+            '      PRICE: "$$5"',
+            '      URL: "http://localhost:4000/a b"',
+            "  worker:",
+            "    environment:",
+            '      PORT: "4000"',
+            '      PRICE: "$$5"',
+            '      URL: "http://localhost:4000/a b"',
+        ]
+
+    def test_compose_without_env(self):
+        content = render_output("compose", {}, {"services": ["web"]})
+        assert "    environment: {}" in content.splitlines()
+
+    def test_systemd(self):
+        content = render_output("systemd", ENV, {})
+        assert content.splitlines()[1:] == [
+            "PORT=4000",
+            'PRICE="\\$5"',
+            'URL="http://localhost:4000/a b"',
+        ]
+
+
+class TestWriteOutput:
+    def test_creates_parent_directories(self, tmp_path):
+        path = tmp_path / "config" / "env.json"
+        assert write_output(path, "{}\n") is True
+        assert path.read_text() == "{}\n"
+
+    def test_leaves_unchanged_file_alone(self, tmp_path):
+        [(path, content)] = render_outputs(
+            tmp_path, {".env": {"format": "dotenv"}}, ENV
+        )
+        assert write_output(path, content) is True
+        os.utime(path, (0, 0))
+        assert write_output(path, content) is False
+        assert path.stat().st_mtime == 0
+
+        assert write_output(path, content + "X=1\n") is True
+        assert path.stat().st_mtime != 0
+
+
+@pytest.mark.parametrize("fmt", ["dotenv", "json", "compose", "systemd"])
+def test_output_is_deterministic(fmt):
+    options = {"services": ["web"]}
+    reordered = dict(reversed(list(ENV.items())))
+    assert render_output(fmt, ENV, options) == render_output(fmt, reordered, options)
@@ -1,7 +1,12 @@
 import pytest
 
 from worktree_env.errors import PortsExhaustedError
-from worktree_env.ports import allocate_ports
+from worktree_env.ports import (
+    BlockAllocator,
+    PortAllocator,
+    allocate_ports,
+    range_usage,
+)
 
 
 class TestAllocatePorts:
@@ -32,3 +37,97 @@ class TestAllocatePorts:
     def test_empty_port_names(self):
         result = allocate_ports([], set(), (4000, 4999))
         assert result == {}
+
+    def test_ignores_ports_outside_range(self):
+        result = allocate_ports(["PORT"], {80, 9000}, (4000, 4999))
+        assert result == {"PORT": 4000}
+
+
+class TestPortAllocator:
+    def test_hands_out_lowest_free_ports(self):
+        allocator = PortAllocator((4000, 4009), {4000, 4001, 4003})
+        assert [allocator.allocate() for _ in range(3)] == [4002, 4004, 4005]
+
+    def test_is_free(self):
+        allocator = PortAllocator((4000, 4009), {4001})
+        assert allocator.is_free(4000)
+        assert not allocator.is_free(4001)
+        assert not allocator.is_free(3999)
+
+    def test_mark_used_after_allocation(self):
+        allocator = PortAllocator((4000, 4009))
+        assert allocator.allocate() == 4000
+        allocator.mark_used(4001)
+        assert allocator.allocate() == 4002
+
+    def test_preferred_port(self):
+        allocator = PortAllocator((4000, 4009), {4000})
+        assert allocator.allocate(preferred=4005) == 4005
+
+    def test_probes_past_taken_preferred_port(self):
+        allocator = PortAllocator((4000, 4009), {4005, 4006})
+        assert allocator.allocate(preferred=4005) == 4007
+
+    def test_probing_wraps_to_lowest_free(self):
+        allocator = PortAllocator((4000, 4009), {4000, 4008, 4009})
+        assert allocator.allocate(preferred=4008) == 4001
+
+    def test_raises_when_full(self):
+        allocator = PortAllocator((4000, 4001), {4000})
+        assert allocator.allocate() == 4001
+        with pytest.raises(PortsExhaustedError):
+            allocator.allocate()
+
+
+class TestBlockAllocator:
+    def test_blocks_are_aligned(self):
+        allocator = BlockAllocator((4001, 4099), 10)
+        assert [allocator.allocate() for _ in range(3)] == [4010, 4020, 4030]
+
+    def test_skips_blocks_with_used_ports(self):
+        allocator = BlockAllocator((4000, 4099), 10, [(4005, 4005), (4010, 4019)])
+        assert allocator.allocate() == 4020
+
+    def test_fills_holes_between_runs(self):
+        allocator = BlockAllocator((4000, 4099), 4, [(4000, 4003), (4008, 4011)])
+        assert allocator.allocate() == 4004
+        assert allocator.allocate() == 4012
+
+    def test_mark_used(self):
+        allocator = BlockAllocator((4000, 4099), 10)
+        allocator.mark_used(4003, 4003)
+        assert allocator.allocate() == 4010
+
+    def test_raises_when_no_block_fits(self):
+        allocator = BlockAllocator((4000, 4014), 10, [(4000, 4000)])
+        with pytest.raises(PortsExhaustedError, match="block of 10"):
+            allocator.allocate()
+
+    def test_preferred_block(self):
+        allocator = BlockAllocator((4000, 4099), 10, [(4050, 4050)])
+        assert allocator.allocate(preferred=4043) == 4060
+        assert allocator.allocate(preferred=4095) == 4000
+
+
+class TestRangeUsage:
+    def test_empty_range(self):
+        usage = range_usage((4000, 4009), set())
+        assert usage["allocated"] == 0
+        assert usage["free_runs"] == 1
+        assert usage["largest_free_run"] == 10
+        assert usage["fragmentation"] == 0.0
+
+    def test_counts_free_runs(self):
+        usage = range_usage((4000, 4009), {3999, 4000, 4003, 4004, 4009, 5000})
+        assert usage["allocated"] == 4
+        assert usage["utilization"] == 0.4
+        # Free: 4001-4002 and 4005-4008.
+        assert usage["free_runs"] == 2
+        assert usage["largest_free_run"] == 4
+        assert usage["fragmentation"] == pytest.approx(1 / 3)
+
+    def test_full_range(self):
+        usage = range_usage((4000, 4001), {4000, 4001})
+        assert usage["free"] == 0
+        assert usage["free_runs"] == 0
+        assert usage["fragmentation"] == 0.0
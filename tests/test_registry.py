@@ -1,14 +1,22 @@
 import json
+import time
 
 import pytest
 
 from worktree_env.errors import RegistryCorruptedError
 from worktree_env.registry import (
+    COMPACT_THRESHOLD,
+    GC_PARALLEL_THRESHOLD,
+    PortIndex,
+    find_port_owner,
     gc_stale_entries,
     get_all_allocated_ports,
     get_allocation,
+    iter_allocations,
     locked_registry,
+    read_registry,
     remove_allocation,
+    restore_project,
     set_allocation,
 )
 
@@ -45,6 +53,71 @@ class TestLockedRegistry:
         saved = json.loads(reg.read_text())
         assert "test" in saved["projects"]
 
+    def test_skips_write_when_unchanged(self, registry_dir):
+        reg = registry_dir / "registry.json"
+        reg.write_text(json.dumps({"projects": {"myapp": {}}}, indent=2) + "\n")
+        before = reg.stat().st_mtime_ns
+
+        with locked_registry() as data:
+            assert "myapp" in data["projects"]
+
+        assert reg.stat().st_mtime_ns == before
+
+    def test_gc_sweep_leaves_registry_file_alone(self, registry_dir, tmp_path):
+        with locked_registry() as data:
+            set_allocation(data, "myapp", str(tmp_path), {"worktree": "a"})
+        reg = registry_dir / "registry.json"
+        before = reg.stat()
+
+        with locked_registry() as data:
+            gc_stale_entries(data)
+
+        after = reg.stat()
+        assert (after.st_ino, after.st_mtime_ns) == (before.st_ino, before.st_mtime_ns)
+        verified = json.loads((registry_dir / "verified.json").read_text())
+        assert list(verified["myapp"]) == [str(tmp_path)]
+
+        with locked_registry() as data:
+            assert data["verified"] == verified
+
+    def test_compact_encoding_for_large_registries(self, registry_dir):
+        with locked_registry() as data:
+            data["projects"]["big"] = {
+                f"/p{i}": {"worktree": "w"} for i in range(COMPACT_THRESHOLD)
+            }
+
+        text = (registry_dir / "registry.json").read_text()
+        assert "\n  " not in text
+        assert len(json.loads(text)["projects"]["big"]) == COMPACT_THRESHOLD
+
+
+class TestReadRegistry:
+    def test_reads_existing_registry(self, registry_dir):
+        reg = registry_dir / "registry.json"
+        reg.write_text(json.dumps({"projects": {"myapp": {}}}))
+
+        with read_registry() as data:
+            assert "myapp" in data["projects"]
+
+    def test_never_writes(self, registry_dir):
+        with read_registry() as data:
+            data["projects"]["test"] = {}
+
+        assert not (registry_dir / "registry.json").exists()
+
+    def test_empty_when_config_dir_missing(self, tmp_path, monkeypatch):
+        missing = tmp_path / "missing"
+        monkeypatch.setenv("WORKTREE_ENV_CONFIG_DIR", str(missing))
+
+        with read_registry() as data:
+            assert data == {"projects": {}}
+        assert not missing.exists()
+
+    def test_readers_share_the_lock(self, registry_dir):
+        with read_registry():
+            with read_registry() as data:
+                assert data == {"projects": {}}
+
 
 class TestAllocationCRUD:
     def test_set_and_get(self):
@@ -87,6 +160,141 @@ class TestGetAllAllocatedPorts:
         assert get_all_allocated_ports({"projects": {}}) == set()
 
 
+class TestPortIndex:
+    def _indexed(self, projects):
+        data = {"projects": projects}
+        data["port_index"] = PortIndex(data["projects"])
+        return data
+
+    def test_built_on_first_use(self):
+        data = self._indexed({"app": {"/a": {"ports": {"PORT": 4000}}}})
+        assert data["port_index"]._owners is None
+        assert get_all_allocated_ports(data) == {4000}
+        assert data["port_index"].owners == {4000: ("app", "/a", "PORT")}
+
+    def test_follows_set_and_remove(self):
+        data = self._indexed({"app": {"/a": {"ports": {"PORT": 4000}}}})
+        get_all_allocated_ports(data)
+
+        set_allocation(data, "app", "/a", {"ports": {"PORT": 4005}})
+        set_allocation(data, "api", "/b", {"ports": {"PORT": 4000, "LIVE": 4001}})
+        assert get_all_allocated_ports(data) == {4000, 4001, 4005}
+
+        remove_allocation(data, "api", "/b")
+        assert data["port_index"].owners == {4005: ("app", "/a", "PORT")}
+
+    def test_follows_gc(self, tmp_path):
+        data = self._indexed(
+            {
+                "app": {
+                    str(tmp_path): {"ports": {"PORT": 4000}},
+                    "/nonexistent": {"ports": {"PORT": 4001}},
+                }
+            }
+        )
+        get_all_allocated_ports(data)
+        gc_stale_entries(data)
+        assert get_all_allocated_ports(data) == {4000}
+
+    def test_follows_restored_projects(self):
+        data = self._indexed({"app": {"/a": {"ports": {"PORT": 4000}}}})
+        get_all_allocated_ports(data)
+        saved = {"/a": {"ports": {"PORT": 4000}}}
+
+        set_allocation(data, "app", "/b", {"ports": {"PORT": 4001}})
+        set_allocation(data, "api", "/c", {"ports": {"PORT": 4002}})
+        restore_project(data, "app", saved)
+        restore_project(data, "api", None)
+
+        assert data["projects"] == {"app": saved}
+        assert data["port_index"].owners == {4000: ("app", "/a", "PORT")}
+
+    def test_block_ports_without_a_name(self):
+        allocation = {
+            "worktree": "a",
+            "ports": {"PORT": 4001},
+            "block": {"start": 4000, "size": 4},
+        }
+        data = self._indexed({"app": {"/a": allocation}})
+        assert get_all_allocated_ports(data) == {4000, 4001, 4002, 4003}
+        assert find_port_owner(data, 4001)["name"] == "PORT"
+        assert find_port_owner(data, 4003)["name"] is None
+
+    def test_rebuilds_when_stale(self):
+        allocation = {"worktree": "a", "ports": {"PORT": 4000}}
+        data = self._indexed({"app": {"/a": allocation}})
+        get_all_allocated_ports(data)
+        # Changed in place, behind the index's back.
+        allocation["ports"]["PORT"] = 4007
+
+        assert find_port_owner(data, 4000) is None
+        assert find_port_owner(data, 4007)["path"] == "/a"
+
+
+class TestFindPortOwner:
+    def test_without_an_index(self):
+        data = {"projects": {"app": {"/a": {"worktree": "a", "ports": {"LIVE": 4001}}}}}
+        assert find_port_owner(data, 4001) == {
+            "project": "app",
+            "path": "/a",
+            "worktree": "a",
+            "name": "LIVE",
+        }
+
+    def test_unallocated_port(self):
+        assert find_port_owner({"projects": {}}, 4000) is None
+
+
+class TestIterAllocations:
+    def _data(self, tmp_path):
+        (tmp_path / "a").mkdir()
+        return {
+            "projects": {
+                "app": {
+                    str(tmp_path / "a"): {"worktree": "a"},
+                    str(tmp_path / "gone"): {"worktree": "gone"},
+                },
+                "api": {str(tmp_path / "ab"): {"worktree": "ab"}},
+            }
+        }
+
+    def _worktrees(self, items):
+        return [allocation["worktree"] for _, _, allocation in items]
+
+    def test_all_in_registry_order(self, tmp_path):
+        data = self._data(tmp_path)
+        assert self._worktrees(iter_allocations(data)) == ["a", "gone", "ab"]
+
+    def test_project(self, tmp_path):
+        data = self._data(tmp_path)
+        assert self._worktrees(iter_allocations(data, "api")) == ["ab"]
+        assert self._worktrees(iter_allocations(data, "missing")) == []
+
+    def test_path_prefix_matches_whole_directories(self, tmp_path):
+        data = self._data(tmp_path)
+        prefix = str(tmp_path / "a")
+        items = iter_allocations(data, path_prefix=prefix)
+        assert self._worktrees(items) == ["a"]
+        items = iter_allocations(data, path_prefix=str(tmp_path) + "/")
+        assert self._worktrees(items) == ["a", "gone", "ab"]
+
+    def test_stale_only(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("worktree_env.registry.STALE_BATCH", 1)
+        data = self._data(tmp_path)
+        assert self._worktrees(iter_allocations(data, stale_only=True)) == [
+            "gone",
+            "ab",
+        ]
+
+    def test_registry_may_change_between_items(self, tmp_path):
+        data = self._data(tmp_path)
+        items = iter_allocations(data)
+        next(items)
+        remove_allocation(data, "app", str(tmp_path / "gone"))
+        set_allocation(data, "web", "/web", {"worktree": "web"})
+        assert self._worktrees(items) == ["gone", "ab"]
+
+
 class TestGcStaleEntries:
     def test_removes_nonexistent_paths(self, tmp_path):
         existing_path = str(tmp_path)
@@ -114,3 +322,66 @@ class TestGcStaleEntries:
         }
         gc_stale_entries(data)
         assert "myapp" not in data["projects"]
+
+    def test_stamps_surviving_entries_outside_allocations(self, tmp_path):
+        data = {"projects": {"myapp": {str(tmp_path): {"worktree": "ok"}}}}
+        gc_stale_entries(data)
+        assert isinstance(data["verified"]["myapp"][str(tmp_path)], int)
+        assert data["projects"]["myapp"][str(tmp_path)] == {"worktree": "ok"}
+
+    def test_skips_recently_verified_entries(self):
+        now = int(time.time())
+        data = {
+            "projects": {
+                "myapp": {"/recent": {"worktree": "a"}, "/old": {"worktree": "b"}}
+            },
+            "verified": {"myapp": {"/recent": now, "/old": now - 7200}},
+        }
+        removed = gc_stale_entries(data, max_age=3600)
+        assert removed == ["myapp: /old"]
+        assert "/recent" in data["projects"]["myapp"]
+        assert data["verified"] == {"myapp": {"/recent": now}}
+
+    def test_migrates_inline_verified_at(self, tmp_path):
+        now = int(time.time())
+        data = {
+            "projects": {
+                "myapp": {
+                    "/recent": {"worktree": "a", "verified_at": now},
+                    str(tmp_path): {"worktree": "b", "verified_at": now - 7200},
+                }
+            }
+        }
+        assert gc_stale_entries(data, max_age=3600) == []
+        assert data["projects"]["myapp"][str(tmp_path)] == {"worktree": "b"}
+        assert data["verified"]["myapp"][str(tmp_path)] >= now
+
+    def test_full_sweep_ignores_verified_at(self):
+        data = {
+            "projects": {"myapp": {"/recent": {"worktree": "a"}}},
+            "verified": {"myapp": {"/recent": int(time.time())}},
+        }
+        assert gc_stale_entries(data) == ["myapp: /recent"]
+        assert data["verified"] == {}
+
+    def test_release_forgets_verification(self):
+        data = {
+            "projects": {"myapp": {"/a": {"worktree": "a"}}},
+            "verified": {"myapp": {"/a": int(time.time())}},
+        }
+        remove_allocation(data, "myapp", "/a")
+        assert data["verified"] == {}
+
+    def test_checks_many_paths_concurrently(self, tmp_path):
+        entries = {}
+        for i in range(GC_PARALLEL_THRESHOLD * 2):
+            path = tmp_path / f"wt{i}"
+            if i % 2:
+                path.mkdir()
+            entries[str(path)] = {"worktree": f"wt{i}"}
+        data = {"projects": {"myapp": entries}}
+
+        removed = gc_stale_entries(data)
+
+        assert len(removed) == GC_PARALLEL_THRESHOLD
+        assert len(data["projects"]["myapp"]) == GC_PARALLEL_THRESHOLD
@@ -0,0 +1,162 @@
+import json
+
+from worktree_env.operations import run_operation, stream_operation
+from worktree_env.registry import (
+    gc_stale_entries,
+    get_all_allocated_ports,
+    get_allocation,
+    held_registry,
+    locked_registry,
+    read_registry,
+    remove_allocation,
+    set_allocation,
+)
+
+
+def _blocked(allocation, start, size):
+    return {**allocation, "block": {"start": start, "size": size}}
+
+
+class TestBackendContract:
+    def test_round_trip(self, registry_dir, registry_backend, alloc):
+        with locked_registry() as data:
+            set_allocation(data, "app", "/a", alloc("a", PORT=4000, LIVE=4001))
+            set_allocation(data, "api", "/b", {**alloc("b"), "note": [1, None]})
+
+        expected = {
+            "app": {"/a": alloc("a", PORT=4000, LIVE=4001)},
+            "api": {"/b": {**alloc("b"), "note": [1, None]}},
+        }
+        with read_registry() as data:
+            assert data["projects"] == expected
+        with locked_registry() as data:
+            assert data["projects"] == expected
+        if registry_backend != "json":
+            assert not (registry_dir / "registry.json").exists()
+
+    def test_remove(self, registry_backend, alloc):
+        with locked_registry() as data:
+            set_allocation(data, "app", "/a", alloc("a", PORT=4000))
+            set_allocation(data, "api", "/b", alloc("b", PORT=4001))
+
+        with locked_registry() as data:
+            assert remove_allocation(data, "app", "/a") is True
+            assert remove_allocation(data, "app", "/a") is False
+        with read_registry() as data:
+            assert data["projects"] == {"api": {"/b": alloc("b", PORT=4001)}}
+
+        with locked_registry(["api"]) as data:
+            assert remove_allocation(data, "api", "/b") is True
+        with read_registry() as data:
+            assert data["projects"] == {}
+
+    def test_scoped_load(self, registry_backend, alloc):
+        with locked_registry() as data:
+            set_allocation(data, "app", "/a", alloc("a", PORT=4000))
+            set_allocation(data, "api", "/b", _blocked(alloc("b"), 4010, 3))
+
+        with read_registry(["api"]) as data:
+            assert data["projects"]["api"] == {
+                "/b": _blocked(alloc("b"), 4010, 3)
+            }
+        with locked_registry(["app"]) as data:
+            assert get_allocation(data, "app", "/a") == alloc("a", PORT=4000)
+            assert get_all_allocated_ports(data) == {4000, 4010, 4011, 4012}
+            if registry_backend != "json":
+                # A block is one run, however many ports it holds.
+                assert data["other_ports"].runs() == [(4010, 4012)]
+            remove_allocation(data, "app", "/a")
+
+        with read_registry() as data:
+            assert list(data["projects"]) == ["api"]
+
+    def test_scoped_save_keeps_other_projects(self, registry_backend, alloc):
+        with locked_registry() as data:
+            set_allocation(data, "app", "/a", alloc("a", PORT=4000))
+            set_allocation(data, "api", "/b", alloc("b", PORT=4001))
+
+        with locked_registry(["app"]) as data:
+            set_allocation(data, "app", "/c", alloc("c", PORT=4002))
+        with locked_registry(["api"]) as data:
+            set_allocation(data, "api", "/b", alloc("b", PORT=4003))
+
+        with read_registry() as data:
+            assert data["projects"] == {
+                "app": {"/a": alloc("a", PORT=4000), "/c": alloc("c", PORT=4002)},
+                "api": {"/b": alloc("b", PORT=4003)},
+            }
+
+    def test_held_registry_saves_repeatedly(self, registry_backend, alloc):
+        with held_registry() as (data, save):
+            set_allocation(data, "app", "/a", alloc("a", PORT=4000))
+            save()
+            set_allocation(data, "app", "/b", alloc("b", PORT=4001))
+            save()
+            remove_allocation(data, "app", "/a")
+            set_allocation(data, "app", "/c", alloc("c", PORT=4002))
+            save()
+        with read_registry(["app"]) as data:
+            assert set(data["projects"]["app"]) == {"/b", "/c"}
+
+    def test_gc_stamps_round_trip(self, registry_backend, alloc, tmp_path):
+        with locked_registry() as data:
+            set_allocation(data, "app", str(tmp_path), alloc("a", PORT=4000))
+        with locked_registry() as data:
+            gc_stale_entries(data)
+
+        with locked_registry(["app"]) as data:
+            assert list(data["verified"]["app"]) == [str(tmp_path)]
+            remove_allocation(data, "app", str(tmp_path))
+        with locked_registry() as data:
+            assert data.get("verified", {}) == {}
+
+    def test_scoped_init_skips_ports_of_other_projects(
+        self, registry_backend, alloc, tmp_path
+    ):
+        # The other worktrees exist, so an unscoped gc keeps them.
+        for name in ("a", "b", "c"):
+            (tmp_path / name).mkdir()
+        with locked_registry() as data:
+            set_allocation(data, "api", str(tmp_path / "b"), alloc("b", PORT=4000))
+            set_allocation(
+                data, "web", str(tmp_path / "c"), _blocked(alloc("c"), 4001, 3)
+            )
+
+        target = {
+            "path": str(tmp_path / "a"),
+            "name": "wt",
+            "config": {"name": "app", "ports": {"PORT": {}}, "env": {}},
+        }
+        result = run_operation(
+            "init", targets=[target], port_range=[4000, 4999], gc_max_age=None
+        )
+        assert result["allocations"][0]["ports"] == {"PORT": 4004}
+
+    def test_migrates_registry_json_on_write(
+        self, registry_dir, registry_backend, alloc
+    ):
+        legacy = {"projects": {"app": {"/a": alloc("a", PORT=4000)}}}
+        (registry_dir / "registry.json").write_text(json.dumps(legacy))
+
+        with read_registry(["app"]) as data:
+            assert data["projects"] == legacy["projects"]
+        with locked_registry() as data:
+            assert data["projects"] == legacy["projects"]
+        with read_registry() as data:
+            assert data["projects"] == legacy["projects"]
+        if registry_backend != "json":
+            assert not (registry_dir / "registry.json").exists()
+            assert (registry_dir / "registry.json.migrated").exists()
+
+    def test_scoped_status_counts_the_whole_range(self, registry_backend, alloc):
+        with locked_registry() as data:
+            set_allocation(data, "app", "/a", alloc("a", PORT=4000))
+            set_allocation(data, "api", "/b", alloc("b", PORT=4001))
+            set_allocation(data, "web", "/c", _blocked(alloc("c"), 4010, 3))
+
+        *worktrees, usage = stream_operation(
+            "status_stream", port_range=[4000, 4099], project="app"
+        )
+        assert [item["path"] for item in worktrees] == ["/a"]
+        assert usage["kind"] == "range"
+        assert usage["allocated"] == 5
@@ -0,0 +1,215 @@
+import fcntl
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from worktree_env import registry_journal
+from worktree_env.errors import RegistryCorruptedError
+from worktree_env.registry import (
+    get_allocation,
+    held_registry,
+    locked_registry,
+    read_registry,
+    remove_allocation,
+    set_allocation,
+)
+from worktree_env.registry_journal import compact_when_idle
+
+pytestmark = [
+    pytest.mark.parametrize("registry_backend", ["journal"], indirect=True),
+    pytest.mark.usefixtures("registry_backend"),
+]
+
+
+@pytest.fixture(autouse=True)
+def spawned(monkeypatch):
+    """Directories a background compactor was started for."""
+    spawned = []
+    monkeypatch.setattr(registry_journal, "_spawn_compactor", spawned.append)
+    return spawned
+
+
+def _records(registry_dir):
+    text = (registry_dir / "journal.jsonl").read_text()
+    return [json.loads(line) for line in text.splitlines()]
+
+
+def _snapshot(registry_dir):
+    return json.loads((registry_dir / "snapshot.json").read_text())["projects"]
+
+
+class TestJournalBackend:
+    def test_save_appends_only_changes(self, registry_dir, alloc):
+        with locked_registry() as data:
+            set_allocation(data, "app", "/a", alloc("a", PORT=4000))
+            set_allocation(data, "app", "/b", alloc("b", PORT=4001))
+        before = (registry_dir / "snapshot.json").stat().st_mtime_ns
+
+        with locked_registry() as data:
+            set_allocation(data, "app", "/a", alloc("a", PORT=4002))
+            remove_allocation(data, "app", "/b")
+        with locked_registry():
+            pass
+
+        assert [(r["op"], r["path"]) for r in _records(registry_dir)] == [
+            ("set", "/a"),
+            ("set", "/b"),
+            ("set", "/a"),
+            ("remove", "/b"),
+        ]
+        assert (registry_dir / "snapshot.json").stat().st_mtime_ns == before
+        with read_registry() as data:
+            assert data == {"projects": {"app": {"/a": alloc("a", PORT=4002)}}}
+
+    def test_scoped_writer_diffs_only_its_project(self, registry_dir, alloc):
+        with locked_registry() as data:
+            set_allocation(data, "app", "/a", alloc("a", PORT=4000))
+            set_allocation(data, "api", "/b", alloc("b", PORT=4001))
+
+        with locked_registry(["app"]) as data:
+            assert list(data["projects"]) == ["app"]
+            assert list(data["other_ports"]) == [4001]
+            remove_allocation(data, "app", "/a")
+
+        assert _records(registry_dir)[-1] == {
+            "op": "remove",
+            "project": "app",
+            "path": "/a",
+        }
+        with read_registry() as data:
+            assert list(data["projects"]) == ["api"]
+
+    def test_torn_record_is_ignored_and_cut(self, registry_dir, alloc):
+        with locked_registry() as data:
+            set_allocation(data, "app", "/a", alloc("a", PORT=4000))
+        with open(registry_dir / "journal.jsonl", "a") as f:
+            f.write('{"op":"set","project":"app","pa')
+
+        with locked_registry() as data:
+            assert list(data["projects"]["app"]) == ["/a"]
+            set_allocation(data, "app", "/b", alloc("b", PORT=4001))
+
+        assert [r["path"] for r in _records(registry_dir)] == ["/a", "/b"]
+
+    def test_corrupted_record(self, registry_dir):
+        (registry_dir / "snapshot.json").write_text('{"projects": {}}')
+        (registry_dir / "journal.jsonl").write_text("{not json\n")
+        with pytest.raises(RegistryCorruptedError):
+            with locked_registry():
+                pass
+
+    def test_migrates_registry_json(self, registry_dir, alloc):
+        (registry_dir / "registry.json").write_text(
+            json.dumps({"projects": {"app": {"/a": alloc("a", PORT=4000)}}})
+        )
+        with read_registry() as data:
+            assert get_allocation(data, "app", "/a") == alloc("a", PORT=4000)
+
+        with locked_registry():
+            pass
+        assert not (registry_dir / "registry.json").exists()
+        assert (registry_dir / "registry.json.migrated").exists()
+        assert _snapshot(registry_dir) == {"app": {"/a": alloc("a", PORT=4000)}}
+
+
+class TestCompaction:
+    def _fill(self, registry_dir, count):
+        for i in range(count):
+            with locked_registry() as data:
+                allocation = {"worktree": f"wt{i}", "ports": {"PORT": 4000 + i}}
+                set_allocation(data, "app", f"/wt{i}", allocation)
+
+    def test_threshold_starts_background_compactor(
+        self, registry_dir, spawned, monkeypatch
+    ):
+        monkeypatch.setattr(registry_journal, "COMPACT_MIN_BYTES", 250)
+        self._fill(registry_dir, 2)
+        assert spawned == []
+        self._fill(registry_dir, 6)
+        assert spawned[0] == registry_dir
+
+    def test_compact_folds_journal_into_snapshot(self, registry_dir):
+        self._fill(registry_dir, 3)
+        with locked_registry() as data:
+            remove_allocation(data, "app", "/wt1")
+
+        assert compact_when_idle(registry_dir)
+        assert (registry_dir / "journal.jsonl").read_text() == ""
+        assert sorted(_snapshot(registry_dir)["app"]) == ["/wt0", "/wt2"]
+
+    def test_replaying_a_folded_journal_changes_nothing(self, registry_dir):
+        self._fill(registry_dir, 3)
+        journal = (registry_dir / "journal.jsonl").read_text()
+        with read_registry() as expected:
+            pass
+
+        compact_when_idle(registry_dir)
+        # As if the compactor crashed before truncating the journal.
+        (registry_dir / "journal.jsonl").write_text(journal)
+        with read_registry() as data:
+            assert data == expected
+
+    def test_gives_up_while_registry_is_locked(self, registry_dir):
+        self._fill(registry_dir, 1)
+        with open(registry_dir / "registry.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            assert not compact_when_idle(registry_dir, timeout=0.1)
+        assert _records(registry_dir)
+
+    def test_held_registry_compacts_inline(
+        self, registry_dir, spawned, monkeypatch, alloc
+    ):
+        monkeypatch.setattr(registry_journal, "COMPACT_MIN_BYTES", 200)
+        with held_registry() as (data, save):
+            for i in range(6):
+                allocation = {"worktree": f"wt{i}", "ports": {"PORT": 4000 + i}}
+                set_allocation(data, "app", f"/wt{i}", allocation)
+                save()
+        assert spawned == []
+        assert len(_snapshot(registry_dir)["app"]) > 1
+        assert len(_records(registry_dir)) < 6
+
+    def test_compactor_entry_point(self, registry_dir):
+        self._fill(registry_dir, 2)
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        argv = [sys.executable, "-m", "worktree_env.registry_journal"]
+        subprocess.run([*argv, str(registry_dir)], env=env, check=True)
+        assert (registry_dir / "journal.jsonl").read_text() == ""
+        assert len(_snapshot(registry_dir)["app"]) == 2
+
+
+class TestReaderCache:
+    def test_replays_only_new_records(self, registry_dir, alloc):
+        with locked_registry() as data:
+            set_allocation(data, "app", "/a", alloc("a", PORT=4000))
+        with read_registry():
+            pass
+        state = registry_journal._cache[registry_dir / "snapshot.json"]
+        offset = state.offset
+
+        with locked_registry() as data:
+            set_allocation(data, "app", "/b", alloc("b", PORT=4001))
+        with read_registry() as data:
+            assert registry_journal._cache[state.snapshot_path] is state
+            assert state.offset > offset
+            assert sorted(data["projects"]["app"]) == ["/a", "/b"]
+            data["projects"]["app"].clear()
+        with read_registry() as data:
+            assert sorted(data["projects"]["app"]) == ["/a", "/b"]
+
+    def test_rereads_after_compaction(self, registry_dir, alloc):
+        with locked_registry() as data:
+            set_allocation(data, "app", "/a", alloc("a", PORT=4000))
+        with read_registry():
+            pass
+        with locked_registry() as data:
+            set_allocation(data, "app", "/b", alloc("b", PORT=4001))
+        compact_when_idle(registry_dir)
+        with locked_registry() as data:
+            remove_allocation(data, "app", "/a")
+
+        with read_registry() as data:
+            assert list(data["projects"]["app"]) == ["/b"]
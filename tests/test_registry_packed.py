@@ -0,0 +1,99 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from worktree_env import tracing
+from worktree_env.errors import RegistryCorruptedError
+from worktree_env.registry import locked_registry, read_registry, set_allocation
+from worktree_env.registry_packed import pack, unpack
+
+
+def _stat(path):
+    st = path.stat()
+    return st.st_ino, st.st_mtime_ns
+
+
+class TestPack:
+    def test_round_trips(self, alloc):
+        projects = {
+            "web": {
+                "/w/a": {
+                    "worktree": "a",
+                    "ports": {"PORT": 4010},
+                    "env": {"URL": "http://localhost:4010/ü"},
+                    "block": {"start": 4010, "size": 10},
+                }
+            },
+            "api": {"/w/b": alloc("b", PORT=4000), "/w/c": {"custom": [1, None]}},
+        }
+        assert unpack(pack(projects)) == projects
+
+    def test_empty_projects_are_dropped(self):
+        assert unpack(pack({"app": {}})) == {}
+
+    @pytest.mark.parametrize(
+        "mangle", [lambda b: b"", lambda b: b"X" + b[1:], lambda b: b[:-5]]
+    )
+    def test_corrupted(self, mangle, alloc):
+        encoded = pack({"app": {"/a": alloc("a", PORT=4000)}})
+        with pytest.raises(RegistryCorruptedError):
+            unpack(mangle(encoded))
+
+
+@pytest.mark.parametrize("registry_backend", ["packed"], indirect=True)
+@pytest.mark.usefixtures("registry_backend")
+class TestPackedBackend:
+    def test_scoped_load_decodes_only_its_project(
+        self, registry_dir, monkeypatch, alloc
+    ):
+        with locked_registry() as data:
+            for n in range(20):
+                set_allocation(data, f"p{n:02}", "/a", alloc("a", PORT=4000 + n))
+        assert not (registry_dir / "registry.json").exists()
+
+        monkeypatch.setattr(tracing, "_tracer", None)
+        tracing.enable("json")
+        with read_registry(["p07"]) as data:
+            assert data["projects"] == {"p07": {"/a": alloc("a", PORT=4007)}}
+        counters = tracing._tracer.counters
+        section = json.dumps({"/a": alloc("a", PORT=4007)}, separators=(",", ":"))
+        # A handful of table entries for the binary search, then the section.
+        assert counters["registry.bytes_read"] <= len(section) + 5 * 24
+
+    def test_unchanged_registry_is_not_rewritten(self, registry_dir, alloc):
+        with locked_registry(["app"]) as data:
+            set_allocation(data, "app", "/a", alloc("a", PORT=4000))
+        before = _stat(registry_dir / "registry.pack")
+
+        with locked_registry(["app"]):
+            pass
+        with locked_registry():
+            pass
+        assert _stat(registry_dir / "registry.pack") == before
+
+    def test_corrupted_file(self, registry_dir):
+        (registry_dir / "registry.pack").write_bytes(b"garbage")
+        with pytest.raises(RegistryCorruptedError, match="Back up and delete"):
+            with read_registry(["app"]):
+                pass
+
+
+def test_dump_and_load_round_trip(tmp_path, alloc):
+    projects = {"app": {"/a": alloc("a", PORT=4000)}}
+    source = tmp_path / "registry.json"
+    source.write_text(json.dumps({"projects": projects}))
+    packed = tmp_path / "registry.pack"
+
+    def run(*args):
+        return subprocess.run(
+            [sys.executable, "-m", "worktree_env.registry_packed", *args],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+
+    run("load", str(source), str(packed))
+    assert unpack(packed.read_bytes()) == projects
+    assert json.loads(run("dump", str(packed))) == {"projects": projects}
@@ -0,0 +1,251 @@
+import json
+import threading
+import time
+
+import pytest
+
+from worktree_env.errors import RegistryConflictError, RegistryCorruptedError
+from worktree_env.operations import run_operation
+from worktree_env.registry import (
+    gc_stale_entries,
+    get_allocation,
+    locked_registry,
+    read_registry,
+    remove_allocation,
+    set_allocation,
+)
+from worktree_env.registry_sharded import ShardedBackend
+
+pytestmark = [
+    pytest.mark.parametrize("registry_backend", ["sharded"], indirect=True),
+    pytest.mark.usefixtures("registry_backend"),
+]
+
+
+def _index(registry_dir):
+    return json.loads((registry_dir / "ports.json").read_text())["projects"]
+
+
+def _init_params(path, project, ports=("PORT",)):
+    return {
+        "targets": [
+            {
+                "path": str(path),
+                "name": path.name,
+                "config": {
+                    "name": project,
+                    "ports": {name: {} for name in ports},
+                    "env": {},
+                },
+            }
+        ],
+        "port_range": [4000, 4999],
+        "gc_max_age": None,
+    }
+
+
+class TestShardedBackend:
+    def test_one_file_per_project_and_port_index(self, registry_dir, alloc):
+        with locked_registry() as data:
+            set_allocation(data, "app", "/a", alloc("a", PORT=4000))
+            set_allocation(data, "api", "/b", alloc("b", PORT=4001, LIVE=4002))
+
+        shards = sorted(p.name for p in (registry_dir / "projects").glob("*.json"))
+        assert len(shards) == 2
+        assert not (registry_dir / "registry.json").exists()
+        assert _index(registry_dir) == {
+            "app": {"/a": [4000]},
+            "api": {"/b": [4001, 4002]},
+        }
+
+        with read_registry() as data:
+            assert get_allocation(data, "api", "/b") == alloc(
+                "b", PORT=4001, LIVE=4002
+            )
+
+    def test_unchanged_ports_leave_index_alone(self, registry_dir, alloc):
+        with locked_registry(["app"]) as data:
+            set_allocation(data, "app", "/a", alloc("a", PORT=4000))
+        before = (registry_dir / "ports.json").stat()
+
+        with locked_registry(["app"]) as data:
+            data["projects"]["app"]["/a"]["env"] = {"DB": "app_a"}
+
+        after = (registry_dir / "ports.json").stat()
+        assert (after.st_ino, after.st_mtime_ns) == (before.st_ino, before.st_mtime_ns)
+
+    def test_release_drops_shard_and_index_entry(self, registry_dir, alloc):
+        with locked_registry(["app"]) as data:
+            set_allocation(data, "app", "/a", alloc("a", PORT=4000))
+        with locked_registry(["app"]) as data:
+            assert remove_allocation(data, "app", "/a")
+
+        assert list((registry_dir / "projects").glob("*.json")) == []
+        assert _index(registry_dir) == {}
+
+    def test_gc_stamps_leave_shard_alone(self, registry_dir, tmp_path, alloc):
+        with locked_registry(["app"]) as data:
+            set_allocation(data, "app", str(tmp_path), alloc("a", PORT=4000))
+        (shard,) = (registry_dir / "projects").glob("*.json")
+        before = shard.stat()
+
+        with locked_registry(["app"]) as data:
+            gc_stale_entries(data)
+
+        after = shard.stat()
+        assert (after.st_ino, after.st_mtime_ns) == (before.st_ino, before.st_mtime_ns)
+        assert shard.with_suffix(".verified").exists()
+        with locked_registry(["app"]) as data:
+            assert list(data["verified"]["app"]) == [str(tmp_path)]
+            remove_allocation(data, "app", str(tmp_path))
+        assert list((registry_dir / "projects").iterdir()) == [
+            shard.with_suffix(".lock")
+        ]
+
+    def test_unchecked_claim_of_held_port_conflicts(self, registry_dir, alloc):
+        # Neither side consults other_ports, so the index is not locked
+        # between load and save; the first writer releases it on close.
+        first = ShardedBackend(registry_dir, projects=["app"])
+        second = ShardedBackend(registry_dir, projects=["api"])
+        data_a, data_b = first.load(), second.load()
+        set_allocation(data_a, "app", "/a", alloc("a", PORT=4000))
+        set_allocation(data_b, "api", "/b", alloc("b", PORT=4000))
+        first.save(data_a)
+        first.close()
+        try:
+            with pytest.raises(RegistryConflictError):
+                second.save(data_b)
+        finally:
+            second.close()
+        assert _index(registry_dir) == {"app": {"/a": [4000]}}
+
+    def test_blocks_are_indexed_as_start_and_size(self, registry_dir, alloc):
+        blocked = {**alloc("a", PORT=4010), "block": {"start": 4010, "size": 50}}
+        with locked_registry(["app"]) as data:
+            set_allocation(data, "app", "/a", blocked)
+        assert _index(registry_dir) == {"app": {"/a": [[4010, 50]]}}
+
+        second = ShardedBackend(registry_dir, projects=["api"])
+        data = second.load()
+        set_allocation(data, "api", "/b", alloc("b", PORT=4059))
+        try:
+            with pytest.raises(RegistryConflictError, match="4059"):
+                second.save(data)
+        finally:
+            second.close()
+
+    def test_unscoped_save_rebuilds_leaked_index(self, registry_dir, alloc):
+        with locked_registry() as data:
+            set_allocation(data, "app", "/a", alloc("a", PORT=4000))
+        (registry_dir / "ports.json").write_text(
+            json.dumps({"version": 1, "projects": {"gone": {"/x": [4001]}}})
+        )
+
+        with locked_registry():
+            pass
+
+        assert _index(registry_dir) == {"app": {"/a": [4000]}}
+
+    def test_migrates_registry_json(self, registry_dir, alloc):
+        (registry_dir / "registry.json").write_text(
+            json.dumps({"projects": {"app": {"/a": alloc("a", PORT=4000)}}})
+        )
+        (registry_dir / "config.toml").write_text('[registry]\nbackend = "sharded"\n')
+
+        with read_registry(["app"]) as data:
+            assert get_allocation(data, "app", "/a") == alloc("a", PORT=4000)
+
+        assert not (registry_dir / "registry.json").exists()
+        assert (registry_dir / "registry.json.migrated").exists()
+        assert _index(registry_dir) == {"app": {"/a": [4000]}}
+
+    def test_migration_keeps_existing_shards(self, registry_dir, alloc):
+        with locked_registry(["api"]) as data:
+            set_allocation(data, "api", "/b", alloc("b", PORT=4001))
+        (registry_dir / "registry.json").write_text(
+            json.dumps({"projects": {"app": {"/a": alloc("a", PORT=4000)}}})
+        )
+
+        with read_registry() as data:
+            assert set(data["projects"]) == {"app", "api"}
+        assert _index(registry_dir) == {
+            "app": {"/a": [4000]},
+            "api": {"/b": [4001]},
+        }
+
+    def test_corrupted_shard(self, registry_dir, alloc):
+        with locked_registry(["app"]) as data:
+            set_allocation(data, "app", "/a", alloc("a", PORT=4000))
+        (shard,) = (registry_dir / "projects").glob("*.json")
+        shard.write_text("{not json")
+
+        with pytest.raises(RegistryCorruptedError):
+            with read_registry(["app"]):
+                pass
+
+    def test_project_names_are_not_paths(self, registry_dir, alloc):
+        with locked_registry(["../evil/app"]) as data:
+            set_allocation(data, "../evil/app", "/a", alloc("a", PORT=4000))
+
+        (shard,) = (registry_dir / "projects").glob("*.json")
+        assert shard.parent == registry_dir / "projects"
+
+
+class TestShardedStress:
+    def test_distinct_projects_do_not_serialize(self, registry_dir):
+        hold = 0.2
+
+        def run(projects):
+            def work(project):
+                with locked_registry([project]):
+                    time.sleep(hold)
+
+            threads = [threading.Thread(target=work, args=(p,)) for p in projects]
+            began = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            return time.perf_counter() - began
+
+        same = run(["app"] * 4)
+        distinct = run(["app", "api", "web", "docs"])
+        assert same >= 4 * hold
+        assert distinct < 2 * hold
+
+    def test_concurrent_inits_across_projects_get_unique_ports(
+        self, registry_dir, tmp_path
+    ):
+        projects = ["app", "api", "web", "docs"]
+        paths = {}
+        for project in projects:
+            for i in range(5):
+                path = tmp_path / f"{project}{i}"
+                path.mkdir()
+                paths.setdefault(project, []).append(path)
+
+        errors = []
+
+        def init_all(project):
+            try:
+                for path in paths[project]:
+                    run_operation("init", **_init_params(path, project, ("A", "B")))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=init_all, args=(p,)) for p in projects]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        with read_registry() as data:
+            ports = [
+                port
+                for entries in data["projects"].values()
+                for allocation in entries.values()
+                for port in allocation["ports"].values()
+            ]
+        assert len(ports) == 40
+        assert len(set(ports)) == 40
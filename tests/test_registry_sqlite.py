@@ -0,0 +1,151 @@
+import json
+import sqlite3
+
+import pytest
+
+from worktree_env.errors import RegistryCorruptedError
+from worktree_env.registry import (
+    gc_stale_entries,
+    locked_registry,
+    read_registry,
+    remove_allocation,
+    set_allocation,
+)
+from worktree_env.registry_sqlite import SqliteBackend
+
+pytestmark = [
+    pytest.mark.parametrize("registry_backend", ["sqlite"], indirect=True),
+    pytest.mark.usefixtures("registry_backend"),
+]
+
+
+class TestSqliteBackend:
+    def test_remove_deletes_rows(self, registry_dir, alloc):
+        with locked_registry() as data:
+            set_allocation(data, "myapp", "/a", alloc("a", PORT=4000))
+        with locked_registry() as data:
+            assert remove_allocation(data, "myapp", "/a") is True
+
+        conn = sqlite3.connect(registry_dir / "registry.db")
+        for table in ("projects", "allocations", "ports"):
+            assert conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone() == (0,)
+
+    def test_removing_last_allocation_drops_only_its_project(
+        self, registry_dir, alloc
+    ):
+        with locked_registry() as data:
+            set_allocation(data, "myapp", "/a", alloc("a", PORT=4000))
+            set_allocation(data, "myapp", "/b", alloc("b", PORT=4001))
+            set_allocation(data, "other", "/c", alloc("c", PORT=4002))
+
+        conn = sqlite3.connect(registry_dir / "registry.db")
+        with locked_registry(["myapp"]) as data:
+            remove_allocation(data, "myapp", "/a")
+        assert conn.execute("SELECT name FROM projects ORDER BY name").fetchall() == [
+            ("myapp",),
+            ("other",),
+        ]
+        with locked_registry(["myapp"]) as data:
+            remove_allocation(data, "myapp", "/b")
+        assert conn.execute("SELECT name FROM projects").fetchall() == [("other",)]
+
+    def test_save_only_touches_changed_rows(self, registry_dir, alloc):
+        with locked_registry() as data:
+            set_allocation(data, "myapp", "/a", alloc("a", PORT=4000))
+            set_allocation(data, "other", "/b", alloc("b", PORT=4001))
+
+        conn = sqlite3.connect(registry_dir / "registry.db")
+        (rowid_b,) = conn.execute(
+            "SELECT rowid FROM allocations WHERE path = '/b'"
+        ).fetchone()
+
+        with locked_registry() as data:
+            set_allocation(data, "myapp", "/a", alloc("a", PORT=4005))
+
+        assert conn.execute(
+            "SELECT rowid FROM allocations WHERE path = '/b'"
+        ).fetchone() == (rowid_b,)
+        assert conn.execute(
+            "SELECT port FROM ports WHERE path = '/a'"
+        ).fetchall() == [(4005,)]
+
+    def test_gc_stamps_do_not_rewrite_allocations(
+        self, registry_dir, tmp_path, alloc
+    ):
+        with locked_registry() as data:
+            set_allocation(data, "myapp", str(tmp_path), alloc("a", PORT=4000))
+
+        conn = sqlite3.connect(registry_dir / "registry.db")
+        (rowid,) = conn.execute("SELECT rowid FROM allocations").fetchone()
+
+        with locked_registry() as data:
+            gc_stale_entries(data)
+
+        assert conn.execute("SELECT rowid FROM allocations").fetchall() == [(rowid,)]
+        ((project, path, verified_at),) = conn.execute(
+            "SELECT project, path, verified_at FROM verified"
+        ).fetchall()
+        assert (project, path) == ("myapp", str(tmp_path))
+
+        with locked_registry() as data:
+            assert data["verified"] == {"myapp": {str(tmp_path): verified_at}}
+            remove_allocation(data, "myapp", str(tmp_path))
+        assert conn.execute("SELECT COUNT(*) FROM verified").fetchone() == (0,)
+
+    def test_upgrade_moves_blocks_into_columns(self, registry_dir):
+        conn = sqlite3.connect(registry_dir / "registry.db")
+        conn.executescript(
+            """
+            CREATE TABLE projects (name TEXT PRIMARY KEY);
+            CREATE TABLE allocations (
+                project TEXT NOT NULL, path TEXT NOT NULL, worktree TEXT,
+                env TEXT NOT NULL DEFAULT '{}', extra TEXT NOT NULL DEFAULT '{}',
+                PRIMARY KEY (project, path)
+            );
+            CREATE TABLE ports (
+                project TEXT NOT NULL, path TEXT NOT NULL, name TEXT NOT NULL,
+                port INTEGER NOT NULL, PRIMARY KEY (project, path, name)
+            );
+            INSERT INTO projects VALUES ('other');
+            INSERT INTO allocations VALUES
+                ('other', '/b', 'b', '{}', '{"block": {"start": 4010, "size": 4}}');
+            PRAGMA user_version = 1;
+            """
+        )
+        conn.close()
+
+        with read_registry(["myapp"]) as data:
+            assert data["other_ports"].runs() == [(4010, 4013)]
+        with locked_registry(["myapp"]) as data:
+            assert data["other_ports"].runs() == [(4010, 4013)]
+
+        conn = sqlite3.connect(registry_dir / "registry.db")
+        assert conn.execute(
+            "SELECT block_start, block_size FROM allocations"
+        ).fetchall() == [(4010, 4)]
+
+    def test_keeps_extra_allocation_keys(self, registry_dir):
+        backend = SqliteBackend(registry_dir)
+        backend.save({"projects": {"p": {"/a": {"worktree": "a", "note": [1]}}}})
+        backend.close()
+
+        backend = SqliteBackend(registry_dir)
+        assert backend.load()["projects"]["p"]["/a"]["note"] == [1]
+        backend.close()
+
+    def test_raises_on_corrupted_database(self, registry_dir):
+        (registry_dir / "registry.db").write_text("not a database" * 100)
+
+        with pytest.raises(RegistryCorruptedError):
+            with locked_registry():
+                pass
+
+    def test_read_registry_does_not_migrate(self, registry_dir, alloc):
+        legacy = {"projects": {"myapp": {"/a": alloc("a", PORT=4000)}}}
+        (registry_dir / "registry.json").write_text(json.dumps(legacy))
+
+        with read_registry() as data:
+            assert data == legacy
+
+        assert not (registry_dir / "registry.db").exists()
+        assert (registry_dir / "registry.json").exists()
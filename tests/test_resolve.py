@@ -0,0 +1,117 @@
+import json
+import os
+import time
+
+import pytest
+
+from worktree_env import resolve
+from worktree_env.errors import AllocationNotFoundError
+from worktree_env.registry import (
+    locked_registry,
+    registry_generation,
+    set_allocation,
+)
+
+
+def _write_registry(registry_dir, repo, port):
+    path = registry_dir / "registry.json"
+    allocation = {"worktree": "my_repo", "ports": {"PORT": port}, "env": {"A": "1"}}
+    path.write_text(json.dumps({"projects": {"testapp": {str(repo): allocation}}}))
+    past = time.time() - 60
+    os.utime(path, (past, past))
+
+
+@pytest.fixture
+def repo(git_worktree, registry_dir):
+    (git_worktree / ".worktree-env.toml").write_text('[project]\nname = "testapp"\n')
+    _write_registry(registry_dir, git_worktree, 4000)
+    return git_worktree
+
+
+def _registry_reads(monkeypatch):
+    reads = []
+    original = resolve.run_operation
+
+    def run_operation(name, **params):
+        reads.append(name)
+        return original(name, **params)
+
+    monkeypatch.setattr(resolve, "run_operation", run_operation)
+    return reads
+
+
+class TestResolveAllocation:
+    def test_cached_until_registry_changes(self, repo, registry_dir, monkeypatch):
+        reads = _registry_reads(monkeypatch)
+        assert resolve.resolve_allocation(repo)["ports"] == {"PORT": 4000}
+        assert resolve.resolve_allocation(repo)["ports"] == {"PORT": 4000}
+        assert reads == ["show"]
+
+        _write_registry(registry_dir, repo, 4001)
+        assert resolve.resolve_allocation(repo)["ports"] == {"PORT": 4001}
+        assert reads == ["show", "show"]
+
+    def test_not_cached_while_registry_is_fresh(
+        self, repo, registry_dir, monkeypatch
+    ):
+        os.utime(registry_dir / "registry.json")
+        reads = _registry_reads(monkeypatch)
+        resolve.resolve_allocation(repo)
+        resolve.resolve_allocation(repo)
+        assert reads == ["show", "show"]
+
+    def test_missing_allocation(self, git_worktree, registry_dir):
+        (git_worktree / ".worktree-env.toml").write_text(
+            '[project]\nname = "testapp"\n'
+        )
+        with pytest.raises(AllocationNotFoundError):
+            resolve.resolve_allocation(git_worktree)
+
+
+def _age(directory):
+    """Backdate the files just written, as if they were written a minute ago."""
+    past = time.time() - 60
+    for path in directory.rglob("*"):
+        if path.stat().st_mtime > past + 30:
+            os.utime(path, (past, past))
+
+
+class TestRegistryGeneration:
+    def test_changes_with_the_project(self, registry_dir, registry_backend):
+        with locked_registry() as data:
+            set_allocation(data, "app", "/a", {"worktree": "a", "ports": {}})
+            set_allocation(data, "api", "/b", {"worktree": "b", "ports": {}})
+        _age(registry_dir)
+        before = {name: registry_generation(name) for name in ("app", "api")}
+
+        with locked_registry(["app"]) as data:
+            set_allocation(data, "app", "/a", {"worktree": "a", "ports": {"P": 1}})
+        _age(registry_dir)
+
+        assert registry_generation("app") != before["app"]
+        if registry_backend == "sharded":
+            assert registry_generation("api") == before["api"]
+
+    def test_none_right_after_a_write(self, registry_dir):
+        with locked_registry() as data:
+            set_allocation(data, "app", "/a", {"worktree": "a", "ports": {}})
+        assert registry_generation("app") is None
+
+
+class TestExecWithEnv:
+    def test_replaces_process_with_merged_env(self, repo, monkeypatch):
+        monkeypatch.chdir(repo)
+        monkeypatch.setenv("KEPT", "yes")
+        calls = []
+        monkeypatch.setattr(resolve.os, "execvpe", lambda *args: calls.append(args))
+        resolve.exec_with_env(["env", "-0"])
+        [(file, argv, env)] = calls
+        assert (file, argv) == ("env", ["env", "-0"])
+        assert env["PORT"] == "4000"
+        assert env["A"] == "1"
+        assert env["KEPT"] == "yes"
+
+    def test_command_not_found(self, repo, monkeypatch, capsys):
+        monkeypatch.chdir(repo)
+        assert resolve.exec_with_env(["no-such-command-here"]) == 127
+        assert "command not found" in capsys.readouterr().err
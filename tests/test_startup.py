@@ -0,0 +1,184 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+# Modules the `show` fast path must not import once the config cache is
+# warm. Each of them costs several milliseconds of startup and is only
+# needed by other commands or by a cold config load.
+FORBIDDEN_ON_SHOW = [
+    "tomllib",
+    "click",
+    "subprocess",
+    "concurrent.futures",
+    "tempfile",
+    "shutil",
+    "hashlib",
+    "sqlite3",
+    "dataclasses",
+    "inspect",
+]
+
+# A warm show may take at most this many times as long as a bare
+# `python -c pass` on the same machine. Both are timed as the best of a few
+# runs after a warm-up, so a first run compiling bytecode or a busy machine
+# doesn't count; FORBIDDEN_ON_SHOW and SHOW_MODULES say what to look at
+# when it fails, and benchmarks/bench_startup.py breaks the time down.
+SHOW_BUDGET_RATIO = 4
+
+# The only worktree_env modules the show path may import.
+SHOW_MODULES = {
+    "worktree_env",
+    "worktree_env.__main__",
+    "worktree_env.client",
+    "worktree_env.config",
+    "worktree_env.errors",
+    "worktree_env.fsutil",
+    "worktree_env.operations",
+    "worktree_env.registry",
+    "worktree_env.resolve",
+    "worktree_env.tracing",
+    "worktree_env.worktree",
+}
+
+SHOW = (
+    "import sys; sys.argv = ['worktree-env', 'show']; "
+    "from worktree_env.__main__ import main; main()"
+)
+
+EXEC = (
+    "import sys; sys.argv = ['worktree-env', 'exec', '--', 'sh', '-c', "
+    "'echo $PORT']; from worktree_env.__main__ import main; main()"
+)
+
+
+def _importtime(cwd, code):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        if self_us.strip().isdigit():
+            modules[name.strip()] = int(self_us)
+    return result, modules
+
+
+def _best_time(cwd, code, runs=5):
+    """Best wall time of ``runs`` runs of ``python -c code``, after a warm-up."""
+    subprocess.run([sys.executable, "-c", code], cwd=cwd, capture_output=True)
+    best = float("inf")
+    for _ in range(runs):
+        began = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=cwd, capture_output=True)
+        best = min(best, time.perf_counter() - began)
+    return best
+
+
+@pytest.fixture
+def initialized_worktree(git_worktree, registry_dir):
+    config = git_worktree / ".worktree-env.toml"
+    config.write_text('[project]\nname = "testapp"\n\n[ports]\nPORT = {}\n')
+    past = time.time() - 60
+    os.utime(config, (past, past))
+    (registry_dir / "registry.json").write_text(
+        json.dumps(
+            {
+                "projects": {
+                    "testapp": {
+                        str(git_worktree): {
+                            "worktree": "my_repo",
+                            "ports": {"PORT": 4000},
+                            "env": {},
+                        }
+                    }
+                }
+            }
+        )
+    )
+    return git_worktree
+
+
+class TestShowStartup:
+    def test_show_fast_path_output(self, initialized_worktree):
+        result, _ = _importtime(initialized_worktree, SHOW)
+        assert result.returncode == 0, result.stderr
+        assert result.stdout == "PORT=4000\n"
+
+    def test_show_fast_path_error(self, git_worktree, registry_dir):
+        (git_worktree / ".worktree-env.toml").write_text(
+            '[project]\nname = "testapp"\n'
+        )
+        result, _ = _importtime(git_worktree, SHOW)
+        assert result.returncode == 1
+        assert "Error: No allocation found" in result.stderr
+
+    def test_warm_show_skips_heavy_imports(self, initialized_worktree):
+        _importtime(initialized_worktree, SHOW)
+        result, modules = _importtime(initialized_worktree, SHOW)
+        assert result.stdout == "PORT=4000\n"
+        assert "worktree_env.resolve" in modules
+        imported = [name for name in FORBIDDEN_ON_SHOW if name in modules]
+        assert imported == []
+
+    def test_show_imports_only_its_modules(self, initialized_worktree):
+        _importtime(initialized_worktree, SHOW)
+        _, modules = _importtime(initialized_worktree, SHOW)
+        own = {name for name in modules if name.startswith("worktree_env")}
+        assert own <= SHOW_MODULES
+
+    def test_warm_show_time_budget(self, initialized_worktree):
+        floor = _best_time(initialized_worktree, "pass")
+        show = _best_time(initialized_worktree, SHOW)
+        assert show < SHOW_BUDGET_RATIO * floor, (
+            f"show took {show * 1000:.1f} ms, "
+            f"python -c pass {floor * 1000:.1f} ms"
+        )
+
+
+class TestExecStartup:
+    def test_exec_runs_command_with_env(self, initialized_worktree):
+        result, _ = _importtime(initialized_worktree, EXEC)
+        assert result.returncode == 0, result.stderr
+        assert result.stdout == "4000\n"
+
+    def test_warm_exec_imports_only_show_modules(self, initialized_worktree):
+        _importtime(initialized_worktree, EXEC)
+        result, modules = _importtime(initialized_worktree, EXEC)
+        assert result.stdout == "4000\n"
+        own = {name for name in modules if name.startswith("worktree_env")}
+        assert own <= SHOW_MODULES
+        assert [name for name in FORBIDDEN_ON_SHOW if name in modules] == []
+
+
+class TestHookEnvStartup:
+    def test_warm_hook_env_imports_only_the_hook(
+        self, initialized_worktree, registry_dir
+    ):
+        past = time.time() - 60
+        os.utime(registry_dir / "registry.json", (past, past))
+        code = (
+            "import sys; sys.argv = ['worktree-env', 'hook-env', 'bash']; "
+            "from worktree_env.__main__ import main; main()"
+        )
+        _importtime(initialized_worktree, code)
+        result, modules = _importtime(initialized_worktree, code)
+        assert result.stdout.startswith("export PORT='4000';")
+        own = {name for name in modules if name.startswith("worktree_env")}
+        assert own == {"worktree_env", "worktree_env.__main__", "worktree_env.hook"}
+        assert "pathlib" not in modules
+
+
+class TestCliImports:
+    def test_cli_import_is_lazy(self, tmp_path):
+        _, modules = _importtime(tmp_path, "import worktree_env.cli")
+        for name in ["worktree_env.registry", "worktree_env.envrc", "subprocess"]:
+            assert name not in modules
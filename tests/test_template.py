@@ -1,4 +1,12 @@
-from worktree_env.template import build_template_vars, render_env, render_template
+import pytest
+
+from worktree_env.errors import TemplateCycleError
+from worktree_env.template import (
+    build_template_vars,
+    compile_template,
+    render_env,
+    render_template,
+)
 
 
 class TestBuildTemplateVars:
@@ -32,6 +40,27 @@ class TestRenderTemplate:
         )
         assert result == "app_feat"
 
+    def test_no_placeholders(self):
+        assert render_template("plain", {"project": "a"}) == "plain"
+
+    def test_adjacent_placeholders(self):
+        result = render_template("{a}{b}", {"a": "1", "b": "2"})
+        assert result == "12"
+
+
+class TestCompileTemplate:
+    def test_splits_literals_and_keys(self):
+        compiled = compile_template("pre{project}mid{port.PORT}")
+        assert compiled.literals == ("pre", "mid", "")
+        assert compiled.keys == ("project", "port.PORT")
+
+    def test_env_references(self):
+        compiled = compile_template("{env.A}:{project}:{env.B}")
+        assert compiled.env_references() == {"A", "B"}
+
+    def test_is_cached(self):
+        assert compile_template("{x}") is compile_template("{x}")
+
 
 class TestRenderEnv:
     def test_renders_env_specs(self):
@@ -53,3 +82,39 @@ class TestRenderEnv:
     def test_empty_template(self):
         result = render_env({"X": {}}, {"project": "a"})
         assert result == {"X": ""}
+
+    def test_references_other_env_vars(self):
+        specs = {
+            "DATABASE_URL": {"template": "postgres://localhost/{env.DB_NAME}"},
+            "DB_NAME": {"template": "{project}_dev_{worktree}"},
+        }
+        result = render_env(specs, {"project": "app", "worktree": "main"})
+        assert result == {
+            "DATABASE_URL": "postgres://localhost/app_dev_main",
+            "DB_NAME": "app_dev_main",
+        }
+        assert list(result) == ["DATABASE_URL", "DB_NAME"]
+
+    def test_chained_references(self):
+        specs = {
+            "C": {"template": "{env.B}!"},
+            "B": {"template": "{env.A}-b"},
+            "A": {"template": "{project}"},
+        }
+        assert render_env(specs, {"project": "p"})["C"] == "p-b!"
+
+    def test_unknown_env_reference_kept(self):
+        result = render_env({"X": {"template": "{env.MISSING}"}}, {})
+        assert result == {"X": "{env.MISSING}"}
+
+    def test_raises_on_cycle(self):
+        specs = {
+            "A": {"template": "{env.B}"},
+            "B": {"template": "{env.A}"},
+        }
+        with pytest.raises(TemplateCycleError, match="A -> B -> A"):
+            render_env(specs, {})
+
+    def test_raises_on_self_reference(self):
+        with pytest.raises(TemplateCycleError):
+            render_env({"A": {"template": "{env.A}"}}, {})
@@ -0,0 +1,144 @@
+import io
+import json
+import os
+
+import pytest
+from click.testing import CliRunner
+
+from worktree_env import tracing
+from worktree_env.cli import main
+from worktree_env.ports import PortAllocator
+
+
+@pytest.fixture(autouse=True)
+def _reset_tracer(monkeypatch):
+    monkeypatch.delenv(tracing.TRACE_ENV_VAR, raising=False)
+    monkeypatch.setattr(tracing, "_tracer", None)
+
+
+def _report() -> str:
+    stream = io.StringIO()
+    tracing.report(stream)
+    return stream.getvalue()
+
+
+class TestTracer:
+    def test_disabled_by_default(self):
+        with tracing.phase("work"):
+            tracing.count("things")
+        assert _report() == ""
+
+    def test_disabled_phase_is_shared(self):
+        assert tracing.phase("a") is tracing.phase("b")
+
+    def test_human_summary_nests_phases(self):
+        tracing.enable()
+        with tracing.phase("outer"):
+            with tracing.phase("inner"):
+                tracing.count("things", 3)
+        tracing.count("things")
+
+        lines = _report().splitlines()
+        assert lines[0].startswith("trace: ")
+        assert lines[1].split()[0] == "outer"
+        assert lines[2].startswith("    inner")
+        assert lines[3].split() == ["things", "4"]
+
+    def test_json_lines(self):
+        tracing.enable("json")
+        with tracing.phase("work"):
+            tracing.count("things", 2)
+
+        events = [json.loads(line) for line in _report().splitlines()]
+        assert [event["type"] for event in events] == ["phase", "counter", "total"]
+        assert events[0]["name"] == "work"
+        assert events[0]["depth"] == 0
+        assert events[0]["duration_ms"] >= 0
+        assert events[1] == {"type": "counter", "name": "things", "value": 2}
+
+    def test_report_stops_tracing(self):
+        tracing.enable()
+        _report()
+        tracing.count("things")
+        assert _report() == ""
+
+    @pytest.mark.parametrize(
+        "value,expected",
+        [("1", "human"), ("human", "human"), ("json", "json"), ("0", None), ("", None)],
+    )
+    def test_enable_from_env(self, monkeypatch, value, expected):
+        monkeypatch.setenv(tracing.TRACE_ENV_VAR, value)
+        tracing.enable_from_env()
+        assert (tracing._tracer and tracing._tracer.format) == expected
+
+    def test_allocator_counts_probes(self):
+        tracing.enable("json")
+        allocator = PortAllocator((4000, 4999), range(4000, 4100))
+        allocator.allocate()
+
+        counters = {
+            event["name"]: event["value"]
+            for event in map(json.loads, _report().splitlines())
+            if event["type"] == "counter"
+        }
+        assert counters["ports.allocated"] == 1
+        assert counters["ports.probed"] > 0
+
+
+class TestTraceCli:
+    @pytest.fixture
+    def initialized(self, git_worktree, registry_dir, tmp_path, monkeypatch):
+        (git_worktree / ".worktree-env.toml").write_text(
+            '[project]\nname = "myapp"\n\n[ports]\nPORT = {}\n'
+        )
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        direnv = bin_dir / "direnv"
+        direnv.write_text("#!/bin/sh\nexit 0\n")
+        direnv.chmod(0o755)
+        monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+        monkeypatch.setenv("SHELL", "/bin/sh")
+        monkeypatch.chdir(git_worktree)
+        return git_worktree
+
+    def test_init_trace_json(self, initialized):
+        result = CliRunner().invoke(
+            main, ["--trace-format", "json", "init"], catch_exceptions=False
+        )
+        assert result.exit_code == 0
+
+        events = [
+            json.loads(line)
+            for line in result.stderr.splitlines()
+            if line.startswith("{")
+        ]
+        phases = {event["name"] for event in events if event["type"] == "phase"}
+        assert {
+            "repo_root",
+            "project_config",
+            "init_operation",
+            "lock_wait",
+            "gc",
+            "allocate",
+            "registry_save",
+            "envrc_write",
+            "direnv_allow",
+        } <= phases
+        counters = {
+            event["name"]: event["value"]
+            for event in events
+            if event["type"] == "counter"
+        }
+        assert counters["ports.allocated"] == 1
+        assert counters["registry.bytes_written"] > 0
+        assert counters["envrc.written"] == 1
+
+    def test_trace_from_env(self, initialized, monkeypatch):
+        monkeypatch.setenv(tracing.TRACE_ENV_VAR, "1")
+        result = CliRunner().invoke(main, ["status"], catch_exceptions=False)
+        assert result.stderr.startswith("trace: ")
+        assert "status_stream_operation" in result.stderr
+
+    def test_no_trace_output_by_default(self, initialized):
+        result = CliRunner().invoke(main, ["status"], catch_exceptions=False)
+        assert result.stderr == ""
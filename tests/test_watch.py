@@ -0,0 +1,179 @@
+import os
+import subprocess
+
+import pytest
+
+from worktree_env import watch as watching
+from worktree_env.registry import read_registry
+
+CONFIG = '[project]\nname = "testapp"\n\n[ports]\nPORT = {}\n'
+
+
+@pytest.fixture
+def syncer(git_worktree, registry_dir):
+    (git_worktree / ".worktree-env.toml").write_text(CONFIG)
+    return watching.Syncer(git_worktree)
+
+
+def _add_worktree(repo, path):
+    subprocess.run(
+        ["git", "worktree", "add", "--detach", str(path)],
+        cwd=repo,
+        capture_output=True,
+        check=True,
+    )
+    (path / ".worktree-env.toml").write_text(CONFIG)
+
+
+def _synced(syncer):
+    result = syncer.sync()
+    if result is None:
+        return None
+    targets, outcome = result
+    return [target.name for target in targets], outcome["released"]
+
+
+def _entries():
+    with read_registry() as data:
+        return data["projects"].get("testapp", {})
+
+
+class TestSyncer:
+    def test_first_sync_allocates_every_worktree(self, syncer, tmp_path):
+        _add_worktree(syncer.repo_root, tmp_path / "feature")
+        assert _synced(syncer) == (["my_repo", "feature"], [])
+        assert syncer.sync() is None
+
+    def test_only_changed_config_is_reallocated(self, syncer, tmp_path, monkeypatch):
+        _add_worktree(syncer.repo_root, tmp_path / "feature")
+        syncer.sync()
+
+        (tmp_path / "feature" / ".worktree-env.toml").write_text(
+            CONFIG + "API = {}\n"
+        )
+        operations = []
+        original = watching.run_operation
+
+        def run_operation(name, **params):
+            operations.append(name)
+            return original(name, **params)
+
+        monkeypatch.setattr(watching, "run_operation", run_operation)
+        assert _synced(syncer) == (["feature"], [])
+        assert operations == ["sync"]
+        feature = _entries()[str(tmp_path / "feature")]
+        assert feature["ports"] == {"PORT": 4001, "API": 4002}
+
+    def test_new_worktree(self, syncer, tmp_path):
+        syncer.sync()
+        _add_worktree(syncer.repo_root, tmp_path / "feature")
+        assert _synced(syncer) == (["feature"], [])
+
+    def test_removed_worktree_is_released(self, syncer, tmp_path):
+        feature = tmp_path / "feature"
+        _add_worktree(syncer.repo_root, feature)
+        syncer.sync()
+
+        subprocess.run(
+            ["git", "worktree", "remove", "--force", str(feature)],
+            cwd=syncer.repo_root,
+            capture_output=True,
+            check=True,
+        )
+        assert _synced(syncer) == ([], [str(feature)])
+        assert list(_entries()) == [str(syncer.repo_root)]
+
+    def test_renamed_project_releases_the_old_entry(self, syncer):
+        syncer.sync()
+        (syncer.repo_root / ".worktree-env.toml").write_text(
+            CONFIG.replace("testapp", "renamed")
+        )
+        assert _synced(syncer) == (["my_repo"], [str(syncer.repo_root)])
+        assert _entries() == {}
+
+    def test_global_config_change_refreshes_every_worktree(
+        self, syncer, registry_dir
+    ):
+        syncer.sync()
+        (registry_dir / "config.toml").write_text("[gc]\ninterval = 60\n")
+        assert _synced(syncer) == (["my_repo"], [])
+
+
+@pytest.fixture(params=["polling", "inotify"])
+def watcher(request):
+    if request.param == "polling":
+        watcher = watching.PollingWatcher(interval=0.01)
+    else:
+        try:
+            watcher = watching.InotifyWatcher()
+        except OSError:
+            pytest.skip("inotify is not available")
+    yield watcher
+    watcher.close()
+
+
+class TestWatchers:
+    def test_reports_config_replaced_by_rename(self, watcher, tmp_path):
+        config = tmp_path / ".worktree-env.toml"
+        config.write_text(CONFIG)
+        assert watcher.set_spec({str(tmp_path): {config.name}}) is True
+        assert watcher.set_spec({str(tmp_path): {config.name}}) is False
+        assert watcher.wait(0.05) is False
+
+        (tmp_path / "unrelated").write_text("x")
+        assert watcher.wait(0.05) is False
+
+        new = tmp_path / "new.toml"
+        new.write_text(CONFIG + "API = {}\n")
+        os.replace(new, config)
+        assert watcher.wait(1) is True
+
+    def test_reports_new_entries_of_a_directory(self, watcher, tmp_path):
+        watcher.set_spec({str(tmp_path): None})
+        (tmp_path / "feature").mkdir()
+        assert watcher.wait(1) is True
+
+
+class _ScriptedWatcher:
+    name = "scripted"
+
+    def __init__(self, waits):
+        self.waits = list(waits)
+        self.specs = []
+
+    def set_spec(self, spec):
+        changed = spec not in self.specs
+        self.specs.append(spec)
+        return changed
+
+    def wait(self, timeout):
+        if not self.waits:
+            raise KeyboardInterrupt
+        return self.waits.pop(0)
+
+
+def test_watch_debounces_and_resyncs_after_new_watches(syncer):
+    syncs = []
+    original = syncer.sync
+
+    def sync():
+        syncs.append(1)
+        return original()
+
+    syncer.sync = sync
+    # One burst of three events, then a quiet period.
+    watcher = _ScriptedWatcher([True, True, True, False])
+    with pytest.raises(KeyboardInterrupt):
+        watching.watch(syncer, watcher, lambda *_: None, pytest.fail, debounce=0)
+    # The first sync sets up the watches and is followed by another; the
+    # burst causes one more.
+    assert len(syncs) == 3
+
+
+def test_watch_reports_errors_and_keeps_going(syncer):
+    (syncer.repo_root / ".worktree-env.toml").write_text("[project\n")
+    errors = []
+    watcher = _ScriptedWatcher([])
+    with pytest.raises(KeyboardInterrupt):
+        watching.watch(syncer, watcher, pytest.fail, errors.append)
+    assert len(errors) == 2
@@ -1,9 +1,16 @@
+import subprocess
 from pathlib import Path
 
 import pytest
 
 from worktree_env.errors import NotAGitRepoError
-from worktree_env.worktree import get_repo_root, get_worktree_name, sanitize_name
+from worktree_env.worktree import (
+    get_git_common_dir,
+    get_repo_root,
+    get_worktree_name,
+    list_worktrees,
+    sanitize_name,
+)
 
 
 class TestGetRepoRoot:
@@ -15,6 +22,84 @@ class TestGetRepoRoot:
         with pytest.raises(NotAGitRepoError):
             get_repo_root(tmp_path)
 
+    def test_finds_root_from_subdirectory(self, git_worktree):
+        nested = git_worktree / "a" / "b"
+        nested.mkdir(parents=True)
+        assert get_repo_root(nested) == git_worktree
+
+    def test_finds_linked_worktree_root(self, git_worktree, tmp_path):
+        linked = tmp_path / "linked"
+        subprocess.run(
+            ["git", "worktree", "add", "--detach", str(linked)],
+            cwd=git_worktree,
+            capture_output=True,
+            check=True,
+        )
+        (linked / "src").mkdir()
+        assert (linked / ".git").is_file()
+        assert get_repo_root(linked / "src") == linked
+
+    def test_does_not_fork_git(self, git_worktree, monkeypatch):
+        def fail(*args, **kwargs):
+            raise AssertionError("git should not be called")
+
+        monkeypatch.setattr(subprocess, "run", fail)
+        assert get_repo_root(git_worktree) == git_worktree
+
+    def test_honors_git_work_tree(self, git_worktree, tmp_path, monkeypatch):
+        monkeypatch.setenv("GIT_WORK_TREE", str(git_worktree))
+        assert get_repo_root(tmp_path) == git_worktree
+
+    def test_git_dir_falls_back_to_git(self, git_worktree, monkeypatch):
+        monkeypatch.setenv("GIT_DIR", str(git_worktree / ".git"))
+        assert get_repo_root(git_worktree) == git_worktree
+
+    def test_ignores_dangling_gitdir_file(self, tmp_path):
+        (tmp_path / ".git").write_text("gitdir: /nonexistent/.git/worktrees/x\n")
+        with pytest.raises(NotAGitRepoError):
+            get_repo_root(tmp_path)
+
+
+class TestListWorktrees:
+    def test_lists_main_and_linked_worktrees(self, git_worktree, tmp_path):
+        linked = tmp_path / "linked"
+        subprocess.run(
+            ["git", "worktree", "add", "--detach", str(linked)],
+            cwd=git_worktree,
+            capture_output=True,
+            check=True,
+        )
+        assert list_worktrees(git_worktree) == [git_worktree, linked]
+
+    def test_skips_missing_worktrees(self, git_worktree, tmp_path):
+        linked = tmp_path / "linked"
+        subprocess.run(
+            ["git", "worktree", "add", "--detach", str(linked)],
+            cwd=git_worktree,
+            capture_output=True,
+            check=True,
+        )
+        linked.rename(tmp_path / "moved")
+        assert list_worktrees(git_worktree) == [git_worktree]
+
+
+class TestGetGitCommonDir:
+    def test_shared_by_linked_worktrees(self, git_worktree, tmp_path):
+        linked = tmp_path / "linked"
+        subprocess.run(
+            ["git", "worktree", "add", "--detach", str(linked)],
+            cwd=git_worktree,
+            capture_output=True,
+            check=True,
+        )
+        common = (git_worktree / ".git").resolve()
+        assert get_git_common_dir(git_worktree) == common
+        assert get_git_common_dir(linked) == common
+
+    def test_raises_outside_a_repository(self, tmp_path):
+        with pytest.raises(NotAGitRepoError):
+            get_git_common_dir(tmp_path)
+
 
 class TestGetWorktreeName:
     def test_returns_basename(self):